@@ -0,0 +1,431 @@
+"""Сквозной бенчмарк: сценарии нагрузки через настоящие обработчики с поддельным Bot API.
+
+Перед каждым сценарием база заполняется пользователями и открытыми слотами. Каждый сценарий
+выполняется в отдельном процессе со своей временной базой, поэтому пиковый RSS и кэши не
+смешиваются. Для каждой операции считаются пропускная способность, p50/p95/p99 задержки и
+число SQL-запросов на операцию. Результаты сохраняются в JSON, и их можно сравнить с прогоном
+другого коммита.
+
+Сценарии:
+- morning_rush — утренний всплеск запросов и предложений на одно и то же утро, затем выбор
+  помощников и ответы на напоминания;
+- popular_helper — один помощник с длинным слотом, и все запросившие одновременно выбирают его;
+- overlapping_requests — сотни пересекающихся запросов без помощников, потом приходят помощники,
+  и каждое предложение подходит многим запросам.
+
+Запуск: python -m benchmarks.e2e_benchmark [--scenario morning_rush] [--scale 0.2]
+        [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fakes import FakeBot, callback_update, make_context, message_update, use_temp_database
+
+DAY = datetime(2030, 6, 20)
+RESULTS_DIR = os.path.join('benchmarks', 'results')
+REGRESSION_THRESHOLD = 0.1
+
+SCENARIOS = {
+    'morning_rush': {'users': 2000, 'open_slots': 5000, 'requests': 600, 'offers': 200, 'concurrency': 50},
+    'popular_helper': {'users': 2000, 'open_slots': 5000, 'requests': 300, 'concurrency': 100},
+    'overlapping_requests': {'users': 2000, 'open_slots': 5000, 'requests': 500, 'offers': 50, 'concurrency': 50},
+}
+SCALED_PARAMETERS = ('users', 'open_slots', 'requests', 'offers')
+
+current_operation = contextvars.ContextVar('current_operation', default=None)
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def slot_text(start_time, minutes):
+    end_time = min(start_time + timedelta(minutes=minutes), start_time.replace(hour=23, minute=59))
+    return f'{start_time:%Y-%m-%d %H:%M}-{end_time:%H:%M}'
+
+
+def buttons(reply):
+    markup = reply[1].get('reply_markup') if reply else None
+    return [row[0] for row in markup.inline_keyboard] if markup else []
+
+
+class Recorder:
+    """Задержки и SQL-запросы по операциям; запросы относятся к операции через contextvar."""
+
+    def __init__(self, engine):
+        self.engine = engine.sync_engine
+        self.operations = {}
+        self.outcomes = {}
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self._count_statement)
+        return self
+
+    def __exit__(self, *exc_info):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._count_statement)
+
+    def _operation(self, name):
+        return self.operations.setdefault(name, {'latencies': [], 'errors': 0, 'statements': 0, 'elapsed': 0.0})
+
+    def _count_statement(self, *args):
+        name = current_operation.get()
+        if name is not None:
+            self._operation(name)['statements'] += 1
+
+    def outcome(self, name):
+        self.outcomes[name] = self.outcomes.get(name, 0) + 1
+
+    async def phase(self, calls, concurrency):
+        """Выполняет пары (операция, фабрика корутины) с ограничением параллельности."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def drive(name, call):
+            async with semaphore:
+                current_operation.set(name)
+                started = time.perf_counter()
+                try:
+                    await call()
+                except Exception:
+                    logging.getLogger(__name__).exception('%s failed', name)
+                    self._operation(name)['errors'] += 1
+                self._operation(name)['latencies'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(drive(name, call) for name, call in calls))
+        elapsed = time.perf_counter() - started
+        for name in {name for name, _ in calls}:
+            self._operation(name)['elapsed'] += elapsed
+
+    def summary(self):
+        result = {}
+        for name, operation in self.operations.items():
+            latencies = operation['latencies']
+            if not latencies:
+                continue
+            result[name] = {
+                'count': len(latencies),
+                'errors': operation['errors'],
+                'throughput': round(len(latencies) / operation['elapsed'], 1),
+                'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+                'sql_per_op': round(operation['statements'] / len(latencies), 2),
+            }
+        return result
+
+
+async def seed_population(rng, users, open_slots):
+    """Пользователи и открытые слоты на неделю вперёд, среди которых будет идти подбор."""
+    from sqlalchemy import insert
+
+    from database.engine import create_db, session_maker
+    from database.models import SlotType, TimeSlot, User
+    from utils.db_queries import load_slot_index
+    from utils.utils import get_current_datetime, get_timezone, to_utc
+
+    await create_db()
+    now = get_current_datetime()
+    async with session_maker() as session:
+        await session.execute(insert(User), [
+            {'telegram_id': telegram_id, 'telegram_username': f'user{telegram_id}', 'created': now, 'updated': now}
+            for telegram_id in range(1, users + 1)
+        ])
+        slots = []
+        for _ in range(open_slots):
+            # Слоты в тексте запросов читаются в часовом поясе бота, поэтому и заготовки задаются в нём.
+            start_time = to_utc(DAY + timedelta(days=rng.randrange(7), minutes=rng.randrange(8 * 60, 20 * 60, 15)),
+                                get_timezone())
+            slots.append({
+                'type': SlotType.OFFER if rng.random() < 0.4 else SlotType.REQUEST,
+                'user_id': rng.randint(1, users),
+                'start_time': start_time,
+                'end_time': start_time + timedelta(minutes=rng.choice((30, 60, 90, 120))),
+                'created': now,
+                'updated': now,
+            })
+        await session.execute(insert(TimeSlot), slots)
+        await session.commit()
+        await load_slot_index(session)
+
+
+def ask(bot, telegram_id, text, replies):
+    from handlers.ask_help_handler import save_ask_help_time_slots
+
+    async def call():
+        update = message_update(text, telegram_id, f'user{telegram_id}')
+        await save_ask_help_time_slots(update, make_context(bot))
+        replies[telegram_id] = update.message.replies[-1] if update.message.replies else None
+    return 'ask_help', call
+
+
+def offer(bot, telegram_id, text):
+    from handlers.offer_help_handler import save_offer_help_time_slots
+
+    async def call():
+        await save_offer_help_time_slots(message_update(text, telegram_id, f'user{telegram_id}'), make_context(bot))
+    return 'offer_help', call
+
+
+def choose(recorder, bot, telegram_id, callback_data, confirmed):
+    from utils.callbacks import callback_router, decode_callback
+
+    async def call():
+        update = callback_update(callback_data, telegram_id, f'user{telegram_id}')
+        await callback_router.dispatch(update, make_context(bot))
+        text = update.callback_query.edits[-1][0] if update.callback_query.edits else ''
+        if text.startswith('Вы выбрали помощь'):
+            recorder.outcome('matched')
+            confirmed.append((telegram_id, decode_callback(callback_data)[1][1]))
+        else:
+            recorder.outcome('already_taken')
+    return 'confirm_meeting', call
+
+
+def answer(recorder, bot, rng, telegram_id, request_slot_id):
+    from utils.callbacks import CallbackAction, callback_router, encode_callback
+
+    async def call():
+        data = encode_callback(CallbackAction.CONFIRM_MEETING, request_slot_id, int(rng.random() < 0.8))
+        await callback_router.dispatch(callback_update(data, telegram_id, f'user{telegram_id}'), make_context(bot))
+    return 'handle_confirmation', call
+
+
+async def follow_up_answers(recorder, bot, rng, confirmed, concurrency):
+    await recorder.phase(
+        [answer(recorder, bot, rng, telegram_id, slot_id) for telegram_id, slot_id in confirmed], concurrency
+    )
+
+
+async def morning_rush(recorder, bot, rng, params):
+    users = list(range(1, params['users'] + 1))
+    rng.shuffle(users)
+    requesters = users[:params['requests']]
+    helpers = users[params['requests']:params['requests'] + params['offers']]
+    replies = {}
+
+    def morning_slot():
+        return slot_text(DAY + timedelta(minutes=rng.randrange(8 * 60, 10 * 60, 15)), rng.choice((30, 60, 90)))
+
+    calls = [ask(bot, user, morning_slot(), replies) for user in requesters]
+    calls += [offer(bot, user, morning_slot()) for user in helpers]
+    rng.shuffle(calls)
+    await recorder.phase(calls, params['concurrency'])
+
+    confirmed = []
+    await recorder.phase([
+        choose(recorder, bot, user, rng.choice(buttons(replies[user])).callback_data, confirmed)
+        for user in requesters if buttons(replies.get(user))
+    ], params['concurrency'])
+    await follow_up_answers(recorder, bot, rng, confirmed, params['concurrency'])
+
+
+async def popular_helper(recorder, bot, rng, params):
+    helper = params['users']
+    requesters = list(range(1, params['requests'] + 1))
+    await recorder.phase([offer(bot, helper, slot_text(DAY + timedelta(hours=8), 12 * 60))], 1)
+
+    replies = {}
+    await recorder.phase([
+        ask(bot, user, slot_text(DAY + timedelta(minutes=rng.randrange(8 * 60, 19 * 60, 15)), 60), replies)
+        for user in requesters
+    ], params['concurrency'])
+
+    confirmed = []
+    calls = []
+    for user in requesters:
+        for button in buttons(replies.get(user)):
+            if button.text.startswith(f'user{helper} '):
+                calls.append(choose(recorder, bot, user, button.callback_data, confirmed))
+    await recorder.phase(calls, params['concurrency'])
+    await follow_up_answers(recorder, bot, rng, confirmed, params['concurrency'])
+
+
+async def overlapping_requests(recorder, bot, rng, params):
+    from utils.notifications import notifier
+
+    users = list(range(1, params['users'] + 1))
+    rng.shuffle(users)
+    requesters = users[:params['requests']]
+    helpers = users[params['requests']:params['requests'] + params['offers']]
+    window_start = DAY + timedelta(days=7, hours=14)
+
+    replies = {}
+    await recorder.phase([
+        ask(bot, user, slot_text(window_start + timedelta(minutes=rng.randrange(0, 120, 15)), 60), replies)
+        for user in requesters
+    ], params['concurrency'])
+    await recorder.phase([
+        offer(bot, user, slot_text(window_start, 180)) for user in helpers
+    ], params['concurrency'])
+
+    notified = {}
+    for chat_id, _, kwargs in notifier.snapshot():
+        markup = kwargs.get('reply_markup')
+        if markup and chat_id not in notified:
+            notified[chat_id] = markup.inline_keyboard[0][0].callback_data
+    recorder.outcomes['notified_requesters'] = len(notified)
+
+    confirmed = []
+    await recorder.phase([
+        choose(recorder, bot, chat_id, callback_data, confirmed) for chat_id, callback_data in notified.items()
+    ], params['concurrency'])
+    await follow_up_answers(recorder, bot, rng, confirmed, params['concurrency'])
+
+
+SCENARIO_RUNNERS = {
+    'morning_rush': morning_rush,
+    'popular_helper': popular_helper,
+    'overlapping_requests': overlapping_requests,
+}
+
+
+async def run_scenario_async(name, params, seed):
+    from database.engine import dispose_engine, init_engine
+    from utils.notifications import notifier
+
+    rng = random.Random(seed)
+    await seed_population(rng, params['users'], params['open_slots'])
+    engine = init_engine()
+    rss_after_seed = peak_rss_mb()
+    bot = FakeBot()
+    started = time.perf_counter()
+    with Recorder(engine) as recorder:
+        await SCENARIO_RUNNERS[name](recorder, bot, rng, params)
+    elapsed = time.perf_counter() - started
+    notifications = notifier.pending_count()
+    await dispose_engine()
+    return {
+        'params': params,
+        'seconds': round(elapsed, 3),
+        'operations': recorder.summary(),
+        'outcomes': recorder.outcomes,
+        'notifications_queued': notifications,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'rss_after_seed_mb': round(rss_after_seed, 1),
+    }
+
+
+def run_scenario(name, params, seed):
+    """Точка входа дочернего процесса: своя временная база и чистые синглтоны."""
+    use_temp_database()
+    logging.basicConfig(level=logging.ERROR)
+    return asyncio.run(run_scenario_async(name, params, seed))
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit.stdout.strip() + ('-dirty' if dirty.stdout.strip() else '')
+
+
+def print_report(results):
+    for name, scenario in results['scenarios'].items():
+        print(f'\n{name}: {scenario["seconds"]:.2f} с, пиковый RSS {scenario["peak_rss_mb"]:.0f} MB, '
+              f'итоги {scenario["outcomes"]}, уведомлений в очереди {scenario["notifications_queued"]}')
+        print(f'  {"операция":<20}{"кол-во":>8}{"ошибок":>8}{"оп/с":>9}{"p50 мс":>9}{"p95 мс":>9}{"p99 мс":>9}'
+              f'{"SQL/оп":>8}')
+        for operation, stats in scenario['operations'].items():
+            print(f'  {operation:<20}{stats["count"]:>8}{stats["errors"]:>8}{stats["throughput"]:>9.0f}'
+                  f'{stats["p50_ms"]:>9.1f}{stats["p95_ms"]:>9.1f}{stats["p99_ms"]:>9.1f}{stats["sql_per_op"]:>8.2f}')
+
+
+def compare(results, baseline, threshold):
+    """Печатает изменения относительно прошлого прогона и возвращает число регрессий."""
+    print(f'\nСравнение с {baseline["commit"]} (порог {threshold:.0%}):')
+    regressions = 0
+    checks = (('p95_ms', 1), ('p99_ms', 1), ('sql_per_op', 1), ('throughput', -1))
+    for name, scenario in results['scenarios'].items():
+        base_scenario = baseline['scenarios'].get(name)
+        if base_scenario is None:
+            continue
+        if base_scenario['params'] != scenario['params']:
+            print(f'  {name}: параметры сценария отличаются, сравнение пропущено')
+            continue
+        for operation, stats in scenario['operations'].items():
+            base_stats = base_scenario['operations'].get(operation)
+            if base_stats is None:
+                continue
+            changes = []
+            for metric, direction in checks:
+                old, new = base_stats[metric], stats[metric]
+                change = (new - old) / old if old else 0.0
+                worse = change * direction > threshold
+                regressions += worse
+                changes.append(f'{metric} {old}→{new} ({change:+.0%}{", регрессия" if worse else ""})')
+
+            print(f'  {name}/{operation}: ' + ', '.join(changes))
+        old_rss, new_rss = base_scenario['peak_rss_mb'], scenario['peak_rss_mb']
+        if old_rss and (new_rss - old_rss) / old_rss > threshold:
+            regressions += 1
+            print(f'  {name}: пиковый RSS {old_rss}→{new_rss} MB, регрессия')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='по умолчанию все')
+    parser.add_argument('--scale', type=float, default=1.0, help='множитель числа пользователей и слотов')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help=f'JSON с результатами, по умолчанию {RESULTS_DIR}/e2e-<коммит>.json')
+    parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': args.scale,
+        'seed': args.seed,
+        'scenarios': {},
+    }
+    # Каждый сценарий — в новом процессе: своя база, свои кэши и честный пиковый RSS.
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for name in args.scenario or SCENARIOS:
+            params = {
+                key: max(1, int(value * args.scale)) if key in SCALED_PARAMETERS else value
+                for key, value in SCENARIOS[name].items()
+            }
+            results['scenarios'][name] = pool.apply(run_scenario, (name, params, args.seed))
+    print_report(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, f'e2e-{commit}.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+    print(f'\nРезультаты сохранены в {output}')
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Отчёт /analytics и выгрузка /export на таблицах разного размера.
+
+Для каждого размера замеряется отчёт по рабочей таблице, затем слоты переносятся в архив и отчёт
+замеряется снова — уже по сводке slot_stats. Пиковая память выгрузки считается через tracemalloc
+и не должна расти вместе с числом строк.
+
+Запуск: python -m benchmarks.export_benchmark --sizes 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from database.migrations import migrate
+from database.models import SlotType, TimeSlot, User
+from utils.analytics import build_report, export_slots_csv, report_cache
+from utils.db_queries import archive_time_slots
+from utils.utils import get_current_datetime
+
+PERIOD_DAYS = 30
+USERS = 1000
+INSERT_CHUNK = 10000
+ARCHIVE_BATCH = 5000
+READ_CHUNK = 2 ** 20
+
+
+def generate_slots(size, now, rng):
+    for slot_id in range(1, size + 1):
+        start_time = now - timedelta(days=rng.randrange(1, PERIOD_DAYS), minutes=rng.randrange(0, 24 * 60, 30))
+        matched = rng.random() < 0.3
+        yield {
+            'id': slot_id,
+            'start_time': start_time,
+            'end_time': start_time + timedelta(minutes=rng.randrange(30, 4 * 60, 30)),
+            'type': rng.choice(list(SlotType)),
+            'user_id': rng.randrange(1, USERS + 1),
+            'matched': matched,
+            'expired': not matched,
+        }
+
+
+async def timed_report(engine):
+    report_cache.clear()
+    async with AsyncSession(engine) as session:
+        started = time.perf_counter()
+        report = await build_report(session, PERIOD_DAYS)
+    return time.perf_counter() - started, report
+
+
+async def run(size, part_mb, seed):
+    rng = random.Random(seed)
+    now = get_current_datetime()
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f'sqlite+aiosqlite:///{os.path.join(directory, "bench.db")}')
+        async with engine.begin() as conn:
+            await conn.run_sync(migrate)
+            await conn.execute(insert(User), [
+                {'id': user_id, 'telegram_id': user_id, 'telegram_username': f'user{user_id}'}
+                for user_id in range(1, USERS + 1)
+            ])
+            chunk = []
+            for slot in generate_slots(size, now, rng):
+                chunk.append(slot)
+                if len(chunk) == INSERT_CHUNK:
+                    await conn.execute(insert(TimeSlot), chunk)
+                    chunk = []
+            if chunk:
+                await conn.execute(insert(TimeSlot), chunk)
+
+        live_elapsed, live_report = await timed_report(engine)
+
+        started = time.perf_counter()
+        async with AsyncSession(engine) as session:
+            while await archive_time_slots(session, now, ARCHIVE_BATCH) == ARCHIVE_BATCH:
+                pass
+        archive_elapsed = time.perf_counter() - started
+        summary_elapsed, summary_report = await timed_report(engine)
+        assert live_report == summary_report, 'отчёт по сводке расходится с отчётом по рабочей таблице'
+
+        uploaded = 0
+
+        async def send_part(file, number):
+            nonlocal uploaded
+            while data := file.read(READ_CHUNK):
+                uploaded += len(data)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        async with AsyncSession(engine) as session:
+            rows, parts = await export_slots_csv(session, send_part, part_size=int(part_mb * 2 ** 20))
+        export_elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        await engine.dispose()
+
+    assert rows == size
+    print(f'Слотов: {size}')
+    print(f'  /analytics по time_slot:      {live_elapsed * 1000:8.1f} мс')
+    print(f'  перенос в архив:              {archive_elapsed * 1000:8.1f} мс')
+    print(f'  /analytics по slot_stats:     {summary_elapsed * 1000:8.1f} мс')
+    print(f'  /export: {parts} частей, {uploaded / 2 ** 20:.1f} МБ за {export_elapsed:.1f} с, '
+          f'пик памяти {peak / 2 ** 20:.1f} МБ')
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--part-mb', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    for size in args.sizes:
+        await run(size, args.part_mb, args.seed)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+import random
+import tempfile
+from types import SimpleNamespace
+
+from telegram.error import RetryAfter
+from telegram.request import BaseRequest
+
+
+def use_temp_database():
+    """Направляет бота во временную SQLite-базу. Вызывать до импорта utils.config."""
+    directory = tempfile.mkdtemp(prefix='helper_bot_bench_')
+    path = os.path.join(directory, 'bench.db')
+    os.environ['DATABASE_PATH'] = f'sqlite+aiosqlite:///{path}'
+    return path
+
+
+class FakeBot:
+    def __init__(self, latency=0.0, flood_rate=0.0, seed=1):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.sent = []
+        self._rng = random.Random(seed)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._rng.random() < self.flood_rate:
+            raise RetryAfter(1)
+        self.sent.append((chat_id, text, kwargs))
+        return SimpleNamespace(chat_id=chat_id, text=text)
+
+
+class FakeMessage:
+    def __init__(self, text, telegram_id, username):
+        self.text = text
+        self.from_user = SimpleNamespace(id=telegram_id, username=username)
+        self.chat = SimpleNamespace(id=telegram_id)
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append((text, kwargs))
+
+
+class FakeCallbackQuery:
+    def __init__(self, data, telegram_id, username):
+        self.data = data
+        self.from_user = SimpleNamespace(id=telegram_id, username=username)
+        self.edits = []
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, **kwargs):
+        self.edits.append((text, kwargs))
+
+
+def message_update(text, telegram_id, username):
+    message = FakeMessage(text, telegram_id, username)
+    return SimpleNamespace(
+        message=message, callback_query=None, effective_user=message.from_user, effective_chat=message.chat
+    )
+
+
+def callback_update(data, telegram_id, username):
+    query = FakeCallbackQuery(data, telegram_id, username)
+    return SimpleNamespace(
+        message=None, callback_query=query, effective_user=query.from_user,
+        effective_chat=SimpleNamespace(id=telegram_id)
+    )
+
+
+def make_context(bot):
+    return SimpleNamespace(bot=bot, chat_data={}, user_data={}, bot_data={}, args=[])
+
+
+def update_payload(update_id, telegram_id, text='/start'):
+    """Обновление в том виде, в каком его присылает Bot API."""
+    message = {
+        'message_id': update_id,
+        'date': 0,
+        'chat': {'id': telegram_id, 'type': 'private'},
+        'from': {'id': telegram_id, 'is_bot': False, 'first_name': 'user', 'username': f'user{telegram_id}'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+class FakeBotApi(BaseRequest):
+    """Транспорт, который отвечает вместо Bot API с заданной сетевой задержкой."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.pending = []
+        self.sent = []
+        self.messages = []
+        self.sent_event = asyncio.Event()
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        parameters = request_data.parameters if request_data else {}
+        api_method = url.rsplit('/', 1)[-1]
+        if api_method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+        elif api_method == 'getUpdates':
+            offset = int(parameters.get('offset') or 0)
+            self.pending = [update for update in self.pending if update['update_id'] >= offset]
+            result = self.pending[:int(parameters.get('limit') or 100)]
+            if not result:
+                await asyncio.sleep(0.01)
+        elif api_method == 'sendMessage':
+            chat_id = int(parameters['chat_id'])
+            self.sent.append(chat_id)
+            self.messages.append((chat_id, parameters.get('text', '')))
+            self.sent_event.set()
+            result = {'message_id': len(self.sent), 'date': 0, 'chat': {'id': chat_id, 'type': 'private'},
+                      'text': parameters.get('text', '')}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
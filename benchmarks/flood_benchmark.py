@@ -0,0 +1,168 @@
+"""Флуд от нескольких пользователей: нагрузка на базу и задержка ответов остальным.
+
+Обновления идут через настоящее приложение (очередь, обработчик по чатам, все группы обработчиков)
+с поддельным Bot API. Атакующие непрерывно отправляют «Попросить помощь» и каждый раз новый слот,
+обычные пользователи за то же время по одному разу просят помощь. Прогон повторяется без защиты —
+без лимита сообщений и без ограничения числа свободных слотов — в отдельном процессе с новой базой.
+
+Запуск: python -m benchmarks.flood_benchmark --attackers 20 --rate 50 --duration 5
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+MODES = ('protected', 'unprotected')
+ATTACKER_ID_BASE = 10 ** 6
+USER_ID_BASE = 2 * 10 ** 6
+DRAIN_TIMEOUT = 120
+
+
+def attacker_slot(number):
+    day, hour = divmod(number, 20)
+    return f'2030-{1 + day // 28 % 12:02d}-{1 + day % 28:02d} {hour + 2:02d}:00-{hour + 3:02d}:00'
+
+
+async def run(mode, attackers, rate, duration, users):
+    from sqlalchemy import event
+    from telegram import Update
+
+    import main
+    import utils.rate_limit
+    from benchmarks.fakes import FakeBotApi, update_payload
+    from utils.metrics import metrics
+
+    class TimedBotApi(FakeBotApi):
+        def __init__(self):
+            super().__init__()
+            self.sent_at = defaultdict(list)
+
+        async def do_request(self, url, method, request_data=None, **kwargs):
+            if url.endswith('/sendMessage'):
+                self.sent_at[int(request_data.parameters['chat_id'])].append(time.perf_counter())
+            return await super().do_request(url, method, request_data, **kwargs)
+
+    api = TimedBotApi()
+    app = main.build_application(token='1:bench', request=api, get_updates_request=api)
+    if mode == 'unprotected':
+        for handler in list(app.handlers.get(-1, [])):
+            app.remove_handler(handler, -1)
+        utils.rate_limit.MAX_OPEN_SLOTS = 10 ** 9
+
+    statements = 0
+
+    def count_statement(*args):
+        nonlocal statements
+        statements += 1
+
+    update_id = 0
+
+    async def put(telegram_id, text):
+        nonlocal update_id
+        update_id += 1
+        await app.update_queue.put(Update.de_json(update_payload(update_id, telegram_id, text), app.bot))
+
+    async def attack(attacker):
+        telegram_id = ATTACKER_ID_BASE + attacker
+        for number in range(int(rate * duration / 2)):
+            await put(telegram_id, main.ASK_HELP_ACTION)
+            await put(telegram_id, attacker_slot(number))
+            await asyncio.sleep(2 / rate)
+
+    submitted = {}
+
+    async def ask(user):
+        telegram_id = USER_ID_BASE + user
+        await asyncio.sleep(duration * user / users)
+        await put(telegram_id, main.ASK_HELP_ACTION)
+        await asyncio.sleep(0.2)
+        submitted[telegram_id] = time.perf_counter()
+        await put(telegram_id, f'2030-06-{1 + user % 28:02d} 10:00-11:00')
+
+    engine = main.init_engine()
+    event.listen(engine.sync_engine, 'before_cursor_execute', count_statement)
+    async with app:
+        await main.post_init(app)
+        await app.start()
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(attack(attacker) for attacker in range(attackers)), *(ask(user) for user in range(users))
+        )
+        flood_end = time.perf_counter()
+        flood_statements = statements
+        while time.perf_counter() - flood_end < DRAIN_TIMEOUT:
+            served = [telegram_id for telegram_id, at in submitted.items()
+                      if any(sent > at for sent in api.sent_at[telegram_id])]
+            if app.update_queue.empty() and len(served) == users:
+                break
+            await asyncio.sleep(0.05)
+        drained = time.perf_counter()
+        await app.stop()
+        await main.post_shutdown(app)
+
+    latencies = [
+        (min(sent for sent in api.sent_at[telegram_id] if sent > at) - at) * 1000
+        for telegram_id, at in submitted.items() if any(sent > at for sent in api.sent_at[telegram_id])
+    ]
+    latencies.sort()
+    return {
+        'updates': update_id,
+        'shed': {dict(labels)['reason']: count for labels, count in metrics.counters['updates_shed'].items()},
+        'sql': statements,
+        'sql_per_second_flood': flood_statements / (flood_end - started),
+        'messages_sent': len(api.sent),
+        'served': len(latencies),
+        'users': users,
+        'p50_ms': statistics.median(latencies) if latencies else None,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] if latencies else None,
+        'drain_seconds': drained - flood_end,
+    }
+
+
+def measure(mode, args):
+    from benchmarks.fakes import use_temp_database
+
+    use_temp_database()
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.flood_benchmark', '--child', mode, '--attackers', str(args.attackers),
+         '--rate', str(args.rate), '--duration', str(args.duration), '--users', str(args.users)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--attackers', type=int, default=20)
+    parser.add_argument('--rate', type=float, default=50, help='сообщений в секунду от одного атакующего')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(asyncio.run(run(args.child, args.attackers, args.rate, args.duration, args.users))))
+        return
+
+    print(f'Атакующих: {args.attackers} по {args.rate:g} сообщений/с в течение {args.duration:g} с, '
+          f'обычных пользователей: {args.users}')
+    for mode in MODES:
+        result = measure(mode, args)
+        shed = ', '.join(f'{reason} {count:g}' for reason, count in sorted(result['shed'].items())) or 'нет'
+        print(f'{mode}:')
+        print(f'  обновлений {result["updates"]}, отброшено: {shed}')
+        print(f'  SQL-запросов {result["sql"]}, во время флуда {result["sql_per_second_flood"]:.0f}/с, '
+              f'отправлено сообщений {result["messages_sent"]}')
+        if result['served']:
+            print(f'  обычным пользователям ответили {result["served"]}/{result["users"]}, '
+                  f'p50 {result["p50_ms"]:.0f} мс, p95 {result["p95_ms"]:.0f} мс, '
+                  f'очередь разобрана через {result["drain_seconds"]:.1f} с после флуда')
+        else:
+            print(f'  обычным пользователям не ответили за {DRAIN_TIMEOUT} с')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Память и скорость обработки очереди напоминаний о встречах.
+
+Запуск: python -m benchmarks.follow_ups_benchmark --follow-ups 100000
+"""
+import argparse
+import asyncio
+import resource
+import time
+from datetime import timedelta
+
+from sqlalchemy import func, insert, select
+
+from benchmarks.fakes import use_temp_database
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(args):
+    use_temp_database()
+    from database.engine import create_db, dispose_engine, init_engine, session_maker
+    from database.models import FollowUp, User
+    from utils.follow_ups import FollowUpScheduler
+    from utils.utils import get_current_datetime
+
+    engine = init_engine()
+    await create_db()
+    now = get_current_datetime()
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), [
+            {'id': 1, 'telegram_id': 1, 'telegram_username': 'requester'},
+            {'id': 2, 'telegram_id': 2, 'telegram_username': 'helper'},
+        ])
+        await conn.execute(insert(FollowUp), [
+            {'requester_id': 1, 'helper_id': 2, 'run_at': now - timedelta(seconds=number)}
+            for number in range(args.follow_ups)
+        ])
+    rss_after_seed = peak_rss_mb()
+
+    handled = 0
+
+    async def callback(session, request_slot_id):
+        nonlocal handled
+        handled += 1
+
+    scheduler = FollowUpScheduler(batch_size=args.batch_size)
+    scheduler.start(callback)
+    started = time.perf_counter()
+    while handled < args.follow_ups:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    await scheduler.stop()
+
+    async with session_maker() as session:
+        left = (await session.execute(select(func.count(FollowUp.id)))).scalar()
+    await dispose_engine()
+
+    print(f'Обработано {handled} напоминаний за {elapsed:.1f} s ({handled / elapsed:.0f}/s), осталось {left}')
+    print(f'Пиковый RSS: после заполнения {rss_after_seed:.0f} MB, после обработки {peak_rss_mb():.0f} MB')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--follow-ups', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
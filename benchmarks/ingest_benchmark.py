@@ -0,0 +1,134 @@
+"""Пропускная способность приёма обновлений: long polling против webhook.
+
+Запуск: python -m benchmarks.ingest_benchmark --updates 2000 --chats 200 --latency 0.02
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+from benchmarks.fakes import FakeBotApi, update_payload, use_temp_database
+
+WEBHOOK_PORT = 8765
+WEBHOOK_PATH = 'telegram'
+WEBHOOK_SECRET = 'bench-secret'
+
+
+def make_updates(count, chats):
+    return [update_payload(update_id, 10 ** 6 + update_id % chats) for update_id in range(1, count + 1)]
+
+
+async def wait_for_replies(api, count):
+    while len(api.sent) < count:
+        api.sent_event.clear()
+        await api.sent_event.wait()
+
+
+async def run_polling(app, api, updates):
+    api.pending = list(updates)
+    started = time.perf_counter()
+    await app.updater.start_polling(poll_interval=0, timeout=1)
+    await wait_for_replies(api, len(updates))
+    elapsed = time.perf_counter() - started
+    await app.updater.stop()
+    return elapsed
+
+
+async def post_json(reader, writer, path, payload, secret):
+    body = json.dumps(payload).encode()
+    writer.write(
+        f'POST /{path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\nX-Telegram-Bot-Api-Secret-Token: {secret}\r\n\r\n'.encode() + body
+    )
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            await reader.readexactly(int(line.split(b':', 1)[1]))
+    return status
+
+
+async def post_updates(updates, senders):
+    """Шлёт обновления по постоянным соединениям, как это делает сам Telegram."""
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+
+    async def sender():
+        reader, writer = await asyncio.open_connection('127.0.0.1', WEBHOOK_PORT)
+        try:
+            while not queue.empty():
+                status = await post_json(reader, writer, WEBHOOK_PATH, queue.get_nowait(), WEBHOOK_SECRET)
+                if status != 200:
+                    raise RuntimeError(f'Webhook ответил {status}')
+        finally:
+            writer.close()
+
+    reader, writer = await asyncio.open_connection('127.0.0.1', WEBHOOK_PORT)
+    status = await post_json(reader, writer, WEBHOOK_PATH, updates[0], 'wrong')
+    writer.close()
+    if status != 403:
+        raise RuntimeError(f'Запрос с неверным секретом не отклонён: {status}')
+    await asyncio.gather(*(sender() for _ in range(senders)))
+
+
+def telegram_side(updates, senders):
+    """Отдельный процесс, который играет роль Telegram и не отнимает у бота процессорное время."""
+    asyncio.run(post_updates(updates, senders))
+
+
+async def run_webhook(app, api, updates, senders):
+    await app.updater.start_webhook(
+        listen='127.0.0.1', port=WEBHOOK_PORT, url_path=WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+    )
+    process = multiprocessing.Process(target=telegram_side, args=(updates, senders))
+    started = time.perf_counter()
+    process.start()
+    await wait_for_replies(api, len(updates))
+    elapsed = time.perf_counter() - started
+    await asyncio.get_running_loop().run_in_executor(None, process.join)
+    await app.updater.stop()
+    if process.exitcode:
+        raise RuntimeError(f'Отправитель обновлений завершился с кодом {process.exitcode}')
+    return elapsed
+
+
+async def run_mode(mode, args):
+    from main import build_application, post_init, post_shutdown
+    logging.getLogger().setLevel(logging.WARNING)
+    api = FakeBotApi(latency=args.latency)
+    app = build_application(token='1:bench', request=api, get_updates_request=api)
+    updates = make_updates(args.updates, args.chats)
+    async with app:
+        await post_init(app)
+        await app.start()
+        if mode == 'polling':
+            elapsed = await run_polling(app, api, updates)
+        else:
+            elapsed = await run_webhook(app, api, updates, args.senders)
+        await app.stop()
+        await post_shutdown(app)
+    print(f'{mode:>8}: {len(updates)} обновлений за {elapsed:.2f} с, {len(updates) / elapsed:.0f} обновлений/с')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка ответа Bot API, с')
+    parser.add_argument('--senders', type=int, default=40, help='параллельных соединений webhook')
+    parser.add_argument('--mode', choices=('polling', 'webhook', 'both'), default='both')
+    args = parser.parse_args()
+    use_temp_database()
+    # Бенчмарк меряет приём обновлений, а не защиту от флуда: лимит сообщений на пользователя снят.
+    os.environ['RATE_LIMIT_BURST'] = str(args.updates)
+    modes = ('polling', 'webhook') if args.mode == 'both' else (args.mode,)
+    for mode in modes:
+        asyncio.run(run_mode(mode, args))
+
+
+if __name__ == '__main__':
+    main()
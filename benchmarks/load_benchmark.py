@@ -0,0 +1,94 @@
+"""Нагрузочный тест записи: параллельные пользователи отправляют слоты через обработчики.
+
+Запуск: python -m benchmarks.load_benchmark --updates 2000 --concurrency 50 --group-commit-ms 5
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fakes import FakeBot, make_context, message_update, use_temp_database
+
+SLOT_DATE = datetime(2030, 6, 20)
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def random_slot_text(rng):
+    start_time = SLOT_DATE + timedelta(days=rng.randrange(7), hours=rng.randrange(8, 20))
+    end_time = start_time + timedelta(hours=rng.randrange(1, 4))
+    return f'{start_time:%Y-%m-%d %H:%M}-{min(end_time, start_time.replace(hour=23, minute=59)):%H:%M}'
+
+
+async def run(args):
+    use_temp_database()
+    os.environ['DB_GROUP_COMMIT_MS'] = str(args.group_commit_ms)
+    from database.engine import create_db, dispose_engine, session_maker, writer
+    from handlers.ask_help_handler import save_ask_help_time_slots
+    from handlers.offer_help_handler import save_offer_help_time_slots
+    from utils.cache import slot_cache, user_cache
+    from utils.db_queries import load_slot_index
+    from utils.metrics import metrics
+
+    await create_db()
+    async with session_maker() as session:
+        await load_slot_index(session)
+
+    rng = random.Random(args.seed)
+    bot = FakeBot()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = []
+
+    async def drive(number):
+        handler = save_offer_help_time_slots if number % 2 else save_ask_help_time_slots
+        telegram_id = rng.randrange(1, args.users + 1)
+        update = message_update(random_slot_text(rng), telegram_id, f'user{telegram_id}')
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await handler(update, make_context(bot))
+            except Exception as error:
+                errors.append(error)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(drive(number) for number in range(args.updates)))
+    elapsed = time.perf_counter() - started
+    await dispose_engine()
+
+    print(f'Обновлений: {args.updates}, параллельно: {args.concurrency}, окно group commit: {args.group_commit_ms} ms')
+    print(f'{args.updates / elapsed:.0f} обновлений/с, {writer.transactions / elapsed:.0f} коммитов записи/с '
+          f'({writer.transactions} всего), ошибок: {len(errors)}')
+    if errors:
+        print(f'Первая ошибка: {errors[0]!r:.200}')
+    print(f'Задержка: p50 {statistics.median(latencies) * 1000:.1f} ms, '
+          f'p99 {percentile(latencies, 0.99) * 1000:.1f} ms')
+    for name in ('db_pool_checkout_seconds', 'db_session_lifetime_seconds'):
+        for histogram in metrics.histograms[name].values():
+            print(f'{name}: среднее {histogram.sum / histogram.count * 1000:.1f} ms, '
+                  f'p99 <= {histogram.quantile(0.99) * 1000:.0f} ms')
+    for cache in (user_cache, slot_cache):
+        print(f'Кэш {cache.name}: попаданий {cache.hits}, промахов {cache.misses}, доля попаданий {cache.hit_rate:.0%}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--group-commit-ms', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=1)
+    logging.basicConfig(level=logging.ERROR)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""День трафика: тысячи запросов и предложений приходят вперемешку, для каждого ищутся новые пары.
+
+Сверяет пары заметающей прямой с полным перебором открытых слотов, считает, сколько повторных
+уведомлений отсекает учёт уже предложенных помощников, и замеряет время подбора. С --db прогоняет
+тот же день через обработчики с временной базой.
+
+Запуск: python -m benchmarks.matching_day_benchmark --slots 5000 --users 500 [--db]
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from benchmarks.fakes import FakeBot, make_context, message_update, use_temp_database
+
+DAY = datetime(2030, 6, 20)
+
+
+def make_day(slot_count, user_count, seed):
+    rng = random.Random(seed)
+    slots = []
+    for slot_id in range(1, slot_count + 1):
+        start = DAY + timedelta(minutes=rng.randrange(8 * 60, 20 * 60, 15))
+        duration = timedelta(minutes=rng.choice((30, 60, 60, 90, 120, 180)))
+        slots.append(SimpleNamespace(
+            id=slot_id,
+            type='offer' if rng.random() < 0.4 else 'request',
+            user_id=rng.randint(1, user_count),
+            start_time=start,
+            end_time=min(start + duration, DAY + timedelta(hours=23, minutes=59)),
+        ))
+    return slots
+
+
+def brute_force(slot, open_slots):
+    return {
+        other.id
+        for other in open_slots
+        if other.user_id != slot.user_id and other.start_time <= slot.end_time and other.end_time >= slot.start_time
+    }
+
+
+def run_in_memory(slots, verify):
+    from database.models import SlotType
+    from utils.matcher import IncrementalMatcher
+    from utils.slot_index import SlotIndex
+
+    index = SlotIndex()
+    matcher = IncrementalMatcher(index)
+    open_slots = {'offer': [], 'request': []}
+    notified = set()
+    pairs = duplicates = 0
+    elapsed = 0.0
+    for slot in slots:
+        slot_type = SlotType.OFFER if slot.type == 'offer' else SlotType.REQUEST
+        other_type = SlotType.REQUEST if slot.type == 'offer' else SlotType.OFFER
+        started = time.perf_counter()
+        candidates = matcher.candidates(other_type, [slot])[slot.id]
+        elapsed += time.perf_counter() - started
+        if verify and {candidate_id for candidate_id, _ in candidates} != brute_force(slot, open_slots[other_type.value]):
+            print(f'Расхождение с перебором для слота {slot.id}')
+            return False
+        for candidate_id, _ in candidates:
+            candidate = slots[candidate_id - 1]
+            request, offer = (candidate, slot) if slot.type == 'offer' else (slot, candidate)
+            key = (request.id, offer.user_id)
+            if key in notified:
+                duplicates += 1
+            else:
+                notified.add(key)
+                pairs += 1
+        index.add_entry(slot.id, slot_type, slot.user_id, slot.start_time, slot.end_time)
+        open_slots[slot.type].append(slot)
+    print(f'В памяти: {len(slots)} слотов, новых пар {pairs}, отсечено повторов {duplicates}, '
+          f'подбор {elapsed * 1000:.1f} мс всего, {elapsed / len(slots) * 1e6:.0f} мкс на слот')
+    return True
+
+
+async def run_with_db(slots):
+    from database.engine import create_db, dispose_engine, init_engine
+    from database.instrumentation import count_queries
+    from handlers.ask_help_handler import save_ask_help_time_slots
+    from handlers.offer_help_handler import save_offer_help_time_slots
+    from utils.notifications import notifier
+
+    engine = init_engine()
+    await create_db()
+    bot = FakeBot()
+    started = time.perf_counter()
+    with count_queries(engine) as counter:
+        for slot in slots:
+            handler = save_offer_help_time_slots if slot.type == 'offer' else save_ask_help_time_slots
+            text = f'{slot.start_time:%Y-%m-%d %H:%M}-{slot.end_time:%H:%M}'
+            await handler(message_update(text, 10 ** 6 + slot.user_id, f'user{slot.user_id}'), make_context(bot))
+    elapsed = time.perf_counter() - started
+    notifications = notifier.pending_count()
+    await dispose_engine()
+    print(f'С базой: {len(slots)} сообщений за {elapsed:.2f} с ({elapsed / len(slots) * 1000:.2f} мс на сообщение), '
+          f'SQL-запросов {counter.count}, уведомлений в очереди {notifications}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--slots', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-verify', action='store_true', help='не сверять с полным перебором')
+    parser.add_argument('--db', action='store_true', help='прогнать день через обработчики с базой')
+    args = parser.parse_args()
+
+    use_temp_database()
+    slots = make_day(args.slots, args.users, args.seed)
+    if not run_in_memory(slots, verify=not args.no_verify):
+        sys.exit(1)
+    if args.db:
+        asyncio.run(run_with_db(slots))
+
+
+if __name__ == '__main__':
+    main()
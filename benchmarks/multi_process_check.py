@@ -0,0 +1,248 @@
+"""Несколько процессов бота на одной машине с общей SQLite-базой в режиме SHARED_STATE.
+
+Каждый процесс принимает webhook на своём порту, обновления одного пользователя нарочно
+приходят в разные процессы. Проверяется, что:
+- диалог, начатый в одном процессе, продолжается в другом и переживает перезапуск всех процессов;
+- слоты, сохранённые другим процессом, находятся при подборе;
+- фоновые задачи выполняет ровно один процесс, а после его падения аренду забирает другой;
+- каждое напоминание о встрече отправляется ровно один раз.
+
+Запуск: python -m benchmarks.multi_process_check --workers 3 --users 30
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+
+from benchmarks.fakes import FakeBotApi, update_payload, use_temp_database
+from benchmarks.ingest_benchmark import post_json
+
+BASE_PORT = 8780
+WEBHOOK_PATH = 'telegram'
+WEBHOOK_SECRET = 'check-secret'
+LEASE_TTL = 2.0
+SETTLE_TIME = 1.5
+REQUEST_TEXT = '2030-06-20 10:00-11:00'
+OFFER_TEXT = '2030-06-20 09:00-12:00'
+PAST = 946684800  # 2000-01-01 00:00 UTC, время в базе хранится в секундах с эпохи
+
+# Процессы запускаются начисто, чтобы каждый прочитал настройки и получил свой INSTANCE_ID.
+context = multiprocessing.get_context('spawn')
+
+
+class RecordingBotApi(FakeBotApi):
+    """Передаёт каждое отправленное сообщение в родительский процесс."""
+
+    def __init__(self, worker, messages):
+        super().__init__()
+        self.worker = worker
+        self.outbox = messages
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        result = await super().do_request(url, method, request_data, **kwargs)
+        if url.endswith('/sendMessage'):
+            chat_id, text = self.messages[-1]
+            self.outbox.put((self.worker, chat_id, text))
+        return result
+
+
+async def serve(worker, stop_event, messages):
+    from main import build_application, post_init, post_shutdown
+    logging.getLogger().setLevel(logging.WARNING)
+    api = RecordingBotApi(worker, messages)
+    app = build_application(token='1:check', request=api, get_updates_request=api)
+    async with app:
+        await post_init(app)
+        await app.start()
+        await app.updater.start_webhook(
+            listen='127.0.0.1', port=BASE_PORT + worker, url_path=WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+        )
+        while not stop_event.is_set():
+            await asyncio.sleep(0.05)
+        await app.updater.stop()
+        await app.stop()
+        await post_shutdown(app)
+
+
+def run_worker(worker, stop_event, messages):
+    os.environ['INSTANCE_ID'] = f'worker-{worker}'
+    asyncio.run(serve(worker, stop_event, messages))
+
+
+class Cluster:
+    def __init__(self, size):
+        self.size = size
+        self.messages = context.Queue()
+        self.stop_event = context.Event()
+        self.processes = {}
+        self.received = []
+        self._update_id = 0
+
+    def start(self):
+        self.stop_event.clear()
+        for worker in range(self.size):
+            process = context.Process(target=run_worker, args=(worker, self.stop_event, self.messages))
+            process.start()
+            self.processes[worker] = process
+        asyncio.run(self._wait_ready())
+
+    async def _wait_ready(self):
+        for worker in self.processes:
+            for _ in range(200):
+                try:
+                    _, writer = await asyncio.open_connection('127.0.0.1', BASE_PORT + worker)
+                    writer.close()
+                    break
+                except OSError:
+                    await asyncio.sleep(0.05)
+            else:
+                raise RuntimeError(f'Процесс {worker} не поднял webhook')
+
+    def kill(self, worker):
+        self.processes.pop(worker).kill()
+
+    def stop(self):
+        self.stop_event.set()
+        for process in self.processes.values():
+            process.join(30)
+        self.processes = {}
+        self.drain()
+
+    def drain(self):
+        while True:
+            try:
+                self.received.append(self.messages.get(timeout=0.2))
+            except Exception:
+                return
+
+    def send(self, steps):
+        """steps — список (номер процесса, telegram_id, текст); отправляются параллельно."""
+        async def post(worker, telegram_id, text):
+            self._update_id += 1
+            reader, writer = await asyncio.open_connection('127.0.0.1', BASE_PORT + worker)
+            try:
+                status = await post_json(
+                    reader, writer, WEBHOOK_PATH, update_payload(self._update_id, telegram_id, text), WEBHOOK_SECRET
+                )
+            finally:
+                writer.close()
+            if status != 200:
+                raise RuntimeError(f'Процесс {worker} ответил {status}')
+
+        async def post_all():
+            await asyncio.gather(*(post(*step) for step in steps))
+
+        asyncio.run(post_all())
+        time.sleep(SETTLE_TIME)
+        self.drain()
+
+    def replies(self, telegram_id, prefix):
+        return [message for message in self.received if message[1] == telegram_id and message[2].startswith(prefix)]
+
+
+def lease_owner(path):
+    with sqlite3.connect(path) as connection:
+        row = connection.execute("SELECT owner FROM lease WHERE name = 'background'").fetchone()
+    return row[0] if row else None
+
+
+def schedule_follow_ups(path, requesters, helper):
+    """Связывает слоты запросивших с помощником и ставит напоминания, время которых уже наступило."""
+    with sqlite3.connect(path) as connection:
+        helper_id = connection.execute('SELECT id FROM user WHERE telegram_id = ?', (helper,)).fetchone()[0]
+        for telegram_id in requesters:
+            slot_id = connection.execute(
+                "SELECT time_slot.id FROM time_slot JOIN user ON user.id = time_slot.user_id "
+                "WHERE user.telegram_id = ? AND time_slot.type = 'REQUEST'", (telegram_id,)
+            ).fetchone()[0]
+            connection.execute(
+                'UPDATE time_slot SET matched = 1, matched_user_id = ? WHERE id = ?', (helper_id, slot_id)
+            )
+            connection.execute(
+                'INSERT INTO follow_up (requester_id, helper_id, request_slot_id, run_at, created, updated) '
+                'SELECT user_id, ?, id, ?, ?, ? FROM time_slot WHERE id = ?',
+                (helper_id, PAST, PAST, PAST, slot_id),
+            )
+
+
+def check(name, ok, details=''):
+    print(f'{"ok  " if ok else "FAIL"} {name}{": " + details if details else ""}')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--users', type=int, default=30)
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    os.environ.update(SHARED_STATE='1', LEASE_TTL=str(LEASE_TTL), PERSISTENCE_INTERVAL='60')
+    from database.engine import create_db
+    asyncio.run(create_db())
+
+    helpers = [2 * 10 ** 6 + user for user in range(args.users)]
+    requesters = [3 * 10 ** 6 + user for user in range(args.users)]
+    waiting = [4 * 10 ** 6 + user for user in range(args.users)]
+    workers = args.workers
+    cluster = Cluster(workers)
+    results = []
+
+    cluster.start()
+    time.sleep(LEASE_TTL)
+    owner = lease_owner(path)
+    results.append(check('фоновые задачи у одного процесса', owner is not None, owner))
+
+    cluster.send([(index % workers, user, 'Помочь') for index, user in enumerate(helpers)])
+    cluster.send([((index + 1) % workers, user, OFFER_TEXT) for index, user in enumerate(helpers)])
+    cluster.send([(index % workers, user, 'Попросить помощь') for index, user in enumerate(requesters + waiting)])
+    cluster.send([((index + 1) % workers, user, REQUEST_TEXT) for index, user in enumerate(requesters)])
+    saved = sum(bool(cluster.replies(user, 'Вы указали временные слоты')) for user in helpers)
+    results.append(check('диалог продолжается в другом процессе', saved == len(helpers), f'{saved}/{len(helpers)}'))
+    found = sum(bool(cluster.replies(user, 'Нашёл помощников')) for user in requesters)
+    results.append(check('слоты других процессов находятся', found == len(requesters), f'{found}/{len(requesters)}'))
+
+    leader = int(owner.rsplit('-', 1)[1])
+    cluster.kill(leader)
+    time.sleep(LEASE_TTL * 2)
+    new_owner = lease_owner(path)
+    results.append(check(
+        'аренду забрал другой процесс после падения ведущего',
+        new_owner not in (None, owner), f'{owner} -> {new_owner}',
+    ))
+    cluster.stop()
+
+    follow_ups = requesters[:args.users // 2]
+    schedule_follow_ups(path, follow_ups, helpers[0])
+    cluster.received = []
+    cluster.start()
+    cluster.send([((index + 2) % workers, user, REQUEST_TEXT) for index, user in enumerate(waiting)])
+    resumed = sum(bool(cluster.replies(user, 'Нашёл помощников')) for user in waiting)
+    results.append(check('диалог пережил перезапуск', resumed == len(waiting), f'{resumed}/{len(waiting)}'))
+    deadline = time.monotonic() + 30
+    asked = []
+    while time.monotonic() < deadline:
+        asked = [message for message in cluster.received if message[2].startswith('Удалось ли')]
+        if len(asked) >= 2 * len(follow_ups):
+            break
+        time.sleep(0.5)
+        cluster.drain()
+    time.sleep(SETTLE_TIME)
+    cluster.stop()
+    asked = [message for message in cluster.received if message[2].startswith('Удалось ли')]
+    senders = {worker for worker, _, _ in asked}
+    per_requester = [len(cluster.replies(user, 'Удалось ли')) for user in follow_ups]
+    results.append(check(
+        'напоминания отправлены ровно один раз одним процессом',
+        per_requester == [1] * len(follow_ups) and len(asked) == 2 * len(follow_ups) and len(senders) == 1,
+        f'{len(asked)} сообщений, процессы {sorted(senders)}',
+    ))
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Задержка обработчика и пропускная способность рассылки при новом предложении помощи.
+
+Запуск: python -m benchmarks.notifications_benchmark --requesters 1000
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from benchmarks.fakes import FakeBot, make_context, message_update, use_temp_database
+
+SLOT_DATE = datetime(2030, 6, 20)
+
+
+async def seed_requesters(engine, count):
+    from database.models import SlotType, TimeSlot, User
+    from utils.utils import get_timezone, to_utc
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), [
+            {'id': user_id, 'telegram_id': 10 ** 6 + user_id, 'telegram_username': f'requester{user_id}'}
+            for user_id in range(1, count + 1)
+        ])
+        await conn.execute(insert(TimeSlot), [
+            {
+                'start_time': to_utc(SLOT_DATE.replace(hour=9 + user_id % 3), get_timezone()),
+                'end_time': to_utc(SLOT_DATE.replace(hour=10 + user_id % 3), get_timezone()),
+                'type': SlotType.REQUEST,
+                'user_id': user_id,
+            }
+            for user_id in range(1, count + 1)
+        ])
+
+
+async def run(args):
+    use_temp_database()
+    from database.engine import create_db, dispose_engine, init_engine, session_maker
+    from handlers.offer_help_handler import save_offer_help_time_slots
+    from utils.db_queries import load_slot_index
+    from utils.notifications import notifier
+
+    engine = init_engine()
+    await create_db()
+    await seed_requesters(engine, args.requesters)
+    async with session_maker() as session:
+        await load_slot_index(session)
+
+    bot = FakeBot(latency=args.latency, flood_rate=args.flood_rate)
+    notifier.workers = args.workers
+    notifier.global_interval = 1 / args.rate
+    notifier.start(bot)
+
+    update = message_update(f'{SLOT_DATE:%Y-%m-%d} 08:00-13:00', 1, 'helper')
+    started = time.perf_counter()
+    await save_offer_help_time_slots(update, make_context(bot))
+    handler_latency = time.perf_counter() - started
+
+    await notifier.join()
+    delivery_time = time.perf_counter() - started
+    await notifier.stop()
+    await dispose_engine()
+
+    print(f'Получателей: {args.requesters}')
+    print(f'Задержка обработчика: {handler_latency * 1000:.1f} ms')
+    print(f'Доставлено: {notifier.delivered}, ошибок: {notifier.failed}, за {delivery_time:.1f} s '
+          f'({notifier.delivered / delivery_time:.1f} сообщений/с)')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requesters', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=30, help='глобальный лимит сообщений в секунду')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05, help='задержка ответа Bot API, с')
+    parser.add_argument('--flood-rate', type=float, default=0.01, help='доля ответов 429')
+    logging.basicConfig(level=logging.ERROR)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
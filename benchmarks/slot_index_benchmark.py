@@ -0,0 +1,136 @@
+"""Сравнение поиска пересекающихся слотов: SQL-запрос против индекса в памяти.
+
+Индекс опрашивается так же, как при сохранении слота (utils.matcher), а SQL-запрос — прежний
+поиск по ix_time_slot_overlap. Ни запрос, ни индекс в боте больше не используются: индекс
+создаётся во временной базе только для сравнения.
+
+Запуск: python -m benchmarks.slot_index_benchmark --sizes 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from sqlalchemy import insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import joinedload
+
+from database.migrations import migrate
+from database.models import SlotType, TimeSlot, User
+from utils.matcher import IncrementalMatcher
+from utils.slot_index import SlotIndex
+
+PERIOD_START = datetime(2030, 1, 1, tzinfo=timezone.utc)
+PERIOD_DAYS = 365
+USERS = 1000
+INSERT_CHUNK = 10000
+
+
+def generate_slots(size, rng):
+    for slot_id in range(1, size + 1):
+        start_time = PERIOD_START + timedelta(days=rng.randrange(PERIOD_DAYS), minutes=rng.randrange(0, 20 * 60, 30))
+        end_time = start_time + timedelta(minutes=rng.randrange(30, 4 * 60, 30))
+        yield {
+            'id': slot_id,
+            'start_time': start_time,
+            'end_time': end_time,
+            'type': rng.choice(list(SlotType)),
+            'user_id': rng.randrange(1, USERS + 1),
+            'matched': rng.random() < 0.3,
+        }
+
+
+async def sql_overlapping(session, slot_type, start_time, end_time):
+    result = await session.execute(
+        select(TimeSlot).filter(
+            TimeSlot.type == slot_type,
+            TimeSlot.matched == False,
+            TimeSlot.expired == False,
+            TimeSlot.start_time <= end_time,
+            TimeSlot.end_time >= start_time,
+        ).options(joinedload(TimeSlot.user))
+    )
+    return result.scalars().all()
+
+
+def generate_queries(count, rng):
+    queries = []
+    for _ in range(count):
+        start_time = PERIOD_START + timedelta(days=rng.randrange(PERIOD_DAYS), minutes=rng.randrange(0, 20 * 60, 30))
+        queries.append((start_time, start_time + timedelta(hours=rng.randrange(1, 4))))
+    return queries
+
+
+async def run(size, query_count, seed):
+    rng = random.Random(seed)
+    slots = list(generate_slots(size, rng))
+    queries = generate_queries(query_count, rng)
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f'sqlite+aiosqlite:///{os.path.join(directory, "bench.db")}')
+        async with engine.begin() as conn:
+            await conn.run_sync(migrate)
+            await conn.execute(text(
+                'CREATE INDEX ix_time_slot_overlap ON time_slot (type, matched, start_time, end_time)'
+            ))
+            await conn.execute(insert(User), [
+                {'id': user_id, 'telegram_id': user_id, 'telegram_username': f'user{user_id}'}
+                for user_id in range(1, USERS + 1)
+            ])
+            for offset in range(0, size, INSERT_CHUNK):
+                await conn.execute(insert(TimeSlot), slots[offset:offset + INSERT_CHUNK])
+
+        index = SlotIndex()
+        started = time.perf_counter()
+        index.load(
+            (slot['id'], slot['type'], slot['user_id'], slot['start_time'], slot['end_time'])
+            for slot in slots if not slot['matched']
+        )
+        warm_up = time.perf_counter() - started
+
+        started = time.perf_counter()
+        matcher = IncrementalMatcher(index)
+        index_results = [
+            [slot_id for slot_id, _ in matcher.candidates(SlotType.OFFER, [query])[query.id]]
+            for query in (SimpleNamespace(id=0, user_id=0, start_time=start_time, end_time=end_time)
+                          for start_time, end_time in queries)
+        ]
+        index_elapsed = time.perf_counter() - started
+
+        sql_results = []
+        async with AsyncSession(engine) as session:
+            started = time.perf_counter()
+            for start_time, end_time in queries:
+                slots_found = await sql_overlapping(session, SlotType.OFFER, start_time, end_time)
+                sql_results.append([slot.id for slot in slots_found])
+                session.expunge_all()
+            sql_elapsed = time.perf_counter() - started
+        await engine.dispose()
+
+    for from_index, from_sql in zip(index_results, sql_results):
+        assert sorted(from_index) == sorted(from_sql), 'результаты индекса и SQL расходятся'
+
+    print(
+        f'{size:>9} слотов: прогрев индекса {warm_up:.2f}s, '
+        f'SQL {sql_elapsed / query_count * 1000:.3f} ms/запрос, '
+        f'индекс {index_elapsed / query_count * 1000:.3f} ms/запрос, '
+        f'ускорение x{sql_elapsed / index_elapsed:.0f}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    for size in args.sizes:
+        asyncio.run(run(size, args.queries, args.seed))
+
+
+if __name__ == '__main__':
+    main()
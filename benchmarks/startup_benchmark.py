@@ -0,0 +1,89 @@
+"""Холодный запуск бота: время импорта main и время до первого обработанного обновления.
+
+Каждый замер идёт в отдельном процессе интерпретатора с новой базой, чтобы ни модули,
+ни схема не были подготовлены заранее. Сеть заменена поддельным Bot API.
+
+Запуск: python -m benchmarks.startup_benchmark --runs 5
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+STAGES = (
+    ('import', 'импорт main'),
+    ('initialize', 'сборка приложения, схема базы, post_init'),
+    ('first_update', 'первое обновление до ответа'),
+    ('total', 'всего внутри процесса'),
+    ('process', 'процесс целиком, с запуском интерпретатора'),
+)
+
+
+async def first_update(main, started):
+    from telegram import Update
+
+    from benchmarks.fakes import FakeBotApi, update_payload
+
+    api = FakeBotApi()
+    app = main.build_application(token='1:bench', request=api, get_updates_request=api)
+    async with app:
+        await main.post_init(app)
+        initialized = time.perf_counter()
+        await app.start()
+        await app.update_queue.put(Update.de_json(update_payload(1, 10 ** 6), app.bot))
+        await api.sent_event.wait()
+        handled = time.perf_counter()
+        await app.stop()
+        await main.post_shutdown(app)
+    return initialized - started, handled - initialized
+
+
+def child():
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    initialize, handled = asyncio.run(first_update(main, imported))
+    print(json.dumps({
+        'import': imported - started,
+        'initialize': initialize,
+        'first_update': handled,
+        'total': imported - started + initialize + handled,
+    }))
+
+
+def measure():
+    from benchmarks.fakes import use_temp_database
+
+    use_temp_database()
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.startup_benchmark', '--child'],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process'] = time.perf_counter() - started
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    runs = [measure() for _ in range(args.runs)]
+    print(f'Запусков: {args.runs}')
+    print(f'  {"этап":<45} {"медиана мс":>10} {"мин мс":>8} {"макс мс":>8}')
+    for key, title in STAGES:
+        values = [run[key] * 1000 for run in runs]
+        print(f'  {title:<45} {statistics.median(values):>10.1f} {min(values):>8.1f} {max(values):>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Разбор временного слота: прежние validate_time_slot/parse_time_slot против parse_time_range.
+
+Замеряет время разбора на случайных строках. Совпадение результатов проверяет
+tests/test_time_slot_parser.py.
+
+Запуск: python -m benchmarks.time_slot_parser_benchmark --cases 20000 --repeat 5
+"""
+import argparse
+import random
+import re
+import timeit
+from datetime import datetime
+
+from utils.utils import TimeSlotError, parse_time_range
+
+NOW = datetime(2030, 6, 20, 8, 0)
+
+
+def legacy_validate_time_slot(time_slot):
+    pattern = re.compile(r'^\d{4}-\d{2}-\d{2} ([01]\d|2[0-3]):([0-5]\d)-([01]\d|2[0-3]):([0-5]\d)$')
+    match = pattern.match(time_slot)
+    if match:
+        date_part = time_slot.split()[0]
+        start_time = match.group(1) + match.group(2)
+        end_time = match.group(3) + match.group(4)
+        try:
+            datetime.strptime(date_part, '%Y-%m-%d')
+            return start_time < end_time
+        except ValueError:
+            return False
+    return False
+
+
+def legacy_parse_time_slot(time_slot):
+    date_part, times = time_slot.split()
+    start_time_str, end_time_str = times.split('-')
+    start_time = datetime.strptime(f"{date_part} {start_time_str}", '%Y-%m-%d %H:%M')
+    end_time = datetime.strptime(f"{date_part} {end_time_str}", '%Y-%m-%d %H:%M')
+    return start_time, end_time
+
+
+def legacy_parse(text):
+    return legacy_parse_time_slot(text) if legacy_validate_time_slot(text) else None
+
+
+def parse(text):
+    try:
+        return parse_time_range(text, NOW)
+    except TimeSlotError:
+        return None
+
+
+def random_case(rng):
+    if rng.random() < 0.5:
+        start = rng.randint(0, 22)
+        return (f'{rng.randint(2020, 2035)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} '
+                f'{start:02d}:{rng.randint(0, 59):02d}-{rng.randint(start, 23):02d}:{rng.randint(0, 59):02d}')
+    date = rng.choice([
+        f'{rng.randint(2020, 2035)}-{rng.randint(1, 12):02d}-{rng.randint(1, 31):02d}',
+        f'{rng.randint(2020, 2035)}-{rng.randint(0, 19):02d}-{rng.randint(0, 39):02d}',
+        f'{rng.randint(2020, 2035)}-{rng.randint(1, 12)}-{rng.randint(1, 28)}',
+        'завтра', 'tomorrow',
+    ])
+
+    def clock():
+        hour, minute = rng.randint(0, 25), rng.randint(0, 61)
+        return rng.choice([f'{hour:02d}:{minute:02d}', f'{hour}:{minute:02d}', f'{hour:02d}{minute:02d}'])
+
+    separator = rng.choice(['-', '-', '-', '–', ' - ', '/'])
+    return f'{date}{rng.choice([" ", " ", "  ", ""])}{clock()}{separator}{clock()}'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cases', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = [random_case(rng) for _ in range(args.cases)]
+    valid = [text for text in texts if legacy_validate_time_slot(text)]
+    for name, function in (('прежний', legacy_parse), ('новый', parse)):
+        for label, sample in (('корректные', valid), ('все', texts)):
+            best = min(timeit.repeat(lambda: [function(text) for text in sample], number=1, repeat=args.repeat))
+            print(f'{name:>8}, {label:>10}: {best / len(sample) * 1e6:.2f} мкс на строку')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,86 @@
-import os
-
-from dotenv import load_dotenv
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 from sqlalchemy.ext.asyncio import (AsyncSession, async_sessionmaker,
                                     create_async_engine)
 
-from database.models import Base
+from database.group_commit import writer
+from database.instrumentation import install_query_timing
+from database.migrations import migrate
+from utils.config import (DATABASE_PATH, DB_BUSY_TIMEOUT_MS, DB_GROUP_COMMIT_MS, DB_JOURNAL_MODE, DB_MAX_OVERFLOW,
+                          DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_SYNCHRONOUS)
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'PRAGMA journal_mode={DB_JOURNAL_MODE}')
+    cursor.execute(f'PRAGMA synchronous={DB_SYNCHRONOUS}')
+    cursor.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    cursor.close()
+
+
+def build_engine(database_url):
+    url = make_url(database_url)
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            memory_engine = create_async_engine(url, echo=False, poolclass=StaticPool)
+            event.listen(memory_engine.sync_engine, 'connect', set_sqlite_pragmas)
+            return memory_engine
+        sqlite_engine = create_async_engine(
+            url,
+            echo=False,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            connect_args={'timeout': DB_BUSY_TIMEOUT_MS / 1000},
+        )
+        event.listen(sqlite_engine.sync_engine, 'connect', set_sqlite_pragmas)
+        return sqlite_engine
+    return create_async_engine(
+        url,
+        echo=False,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=True,
+    )
 
-load_dotenv()
 
-engine = create_async_engine(os.getenv('DATABASE_PATH'), echo=False)
+# Движок создаётся в init_engine, а не при импорте: session_maker привязывается к нему там же.
+engine = None
+session_maker = async_sessionmaker(class_=AsyncSession, expire_on_commit=False)
 
-session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+def init_engine(database_url=None):
+    """Создаёт движок при первом вызове и возвращает его. Подключение к базе открывается при первом запросе."""
+    global engine
+    if engine is None:
+        engine = build_engine(database_url or DATABASE_PATH)
+        install_query_timing(engine)
+        session_maker.configure(bind=engine)
+        writer.configure(session_maker, window_ms=DB_GROUP_COMMIT_MS)
+    return engine
+
+
+async def dispose_engine():
+    global engine
+    if engine is not None:
+        await engine.dispose()
+        engine = None
 
 
 async def create_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    async with init_engine().begin() as conn:
+        await conn.run_sync(migrate)
+
+
+async def compact_database():
+    """Обновляет статистику планировщика и возвращает освободившееся место. VACUUM не работает внутри транзакции."""
+    async with init_engine().connect() as conn:
+        conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+        if conn.dialect.name == 'sqlite':
+            await conn.execute(text('VACUUM'))
+            await conn.execute(text('ANALYZE'))
+        else:
+            await conn.execute(text('VACUUM ANALYZE'))
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 200
+
+
+class GroupCommitWriter:
+    """Объединяет записи, пришедшие в течение window_ms, в одну транзакцию."""
+
+    def __init__(self, session_maker=None, window_ms=0, max_batch=MAX_BATCH):
+        self.session_maker = session_maker
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.transactions = 0
+        self._pending = []
+        self._flush_task = None
+        self._lock = None
+
+    def configure(self, session_maker, window_ms=0, max_batch=MAX_BATCH):
+        self.session_maker = session_maker
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+
+    @property
+    def enabled(self):
+        return self.window > 0
+
+    async def run(self, session, operation):
+        """Выполняет operation(session) и фиксирует результат — сразу или вместе с соседними записями.
+
+        В режиме group commit операция выполняется в сессии писателя, а соединение session
+        возвращается в пул на время ожидания.
+        """
+        if not self.enabled:
+            result = await operation(session)
+            await session.commit()
+            self.transactions += 1
+            return result
+        await session.commit()
+        return await self.submit(operation)
+
+    async def submit(self, operation):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((operation, future))
+        if len(self._pending) >= self.max_batch:
+            self._start_flush(delay=0)
+        elif self._flush_task is None:
+            self._start_flush(delay=self.window)
+        return await future
+
+    def _start_flush(self, delay):
+        batch, self._pending = self._pending, []
+        self._flush_task = asyncio.create_task(self._flush(batch, delay))
+
+    async def _flush(self, batch, delay):
+        if delay:
+            await asyncio.sleep(delay)
+            batch, self._pending = batch + self._pending, []
+        self._flush_task = None
+        try:
+            await self._commit_batch(batch)
+        except Exception:
+            logger.warning('Group commit of %s writes failed, retrying them one by one', len(batch), exc_info=True)
+            for operation, future in batch:
+                await self._commit_batch([(operation, future)])
+
+    async def _commit_batch(self, batch):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock, self.session_maker() as session:
+            try:
+                results = [await operation(session) for operation, _ in batch]
+                await session.commit()
+                self.transactions += 1
+            except Exception as error:
+                await session.rollback()
+                if len(batch) > 1:
+                    raise
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(error)
+                return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+writer = GroupCommitWriter()
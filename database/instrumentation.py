@@ -0,0 +1,48 @@
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from utils.metrics import metrics
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append((statement, parameters))
+
+
+@contextmanager
+def count_queries(engine):
+    """Считает SQL-запросы, выполненные через engine внутри блока with."""
+    sync_engine = getattr(engine, 'sync_engine', engine)
+    counter = QueryCounter()
+    event.listen(sync_engine, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(sync_engine, 'before_cursor_execute', counter)
+
+
+def install_query_timing(engine):
+    """Записывает длительность каждого SQL-запроса в метрику db_query_seconds."""
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        metrics.observe(
+            'db_query_seconds',
+            time.perf_counter() - context._query_started,
+            statement=statement.lstrip().split(None, 1)[0].upper(),
+        )
+
+    event.listen(sync_engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(sync_engine, 'after_cursor_execute', after_cursor_execute)
@@ -0,0 +1,153 @@
+import logging
+import time
+
+from sqlalchemy import Integer, inspect, text
+
+from database.models import Base, UTCEpoch
+from utils.config import TIMEZONE_OFFSET
+from utils.utils import legacy_utc_offset
+
+logger = logging.getLogger(__name__)
+
+
+def _has_column(connection, table, column):
+    return column in {info['name'] for info in inspect(connection).get_columns(table)}
+
+
+def _add_time_slot_indexes(connection):
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_time_slot_overlap ON time_slot (type, matched, start_time, end_time)'
+    ))
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_time_slot_user ON time_slot (user_id, type, start_time, end_time)'
+    ))
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_time_slot_matched_user ON time_slot (matched_user_id, type, matched)'
+    ))
+
+
+def _add_follow_up_request_slot(connection):
+    if not _has_column(connection, 'follow_up', 'request_slot_id'):
+        connection.execute(text('ALTER TABLE follow_up ADD COLUMN request_slot_id INTEGER REFERENCES time_slot (id)'))
+    connection.execute(text(
+        'UPDATE follow_up SET request_slot_id = ('
+        'SELECT time_slot.id FROM time_slot '
+        'WHERE time_slot.user_id = follow_up.requester_id '
+        "AND time_slot.type = 'REQUEST' "
+        'AND time_slot.matched_user_id = follow_up.helper_id '
+        'ORDER BY time_slot.created DESC LIMIT 1'
+        ') WHERE request_slot_id IS NULL'
+    ))
+
+
+def _add_time_slot_expired(connection):
+    if not _has_column(connection, 'time_slot', 'expired'):
+        connection.execute(text('ALTER TABLE time_slot ADD COLUMN expired BOOLEAN NOT NULL DEFAULT false'))
+
+
+def _convert_times_to_utc_epoch(connection):
+    """Переводит время из локального времени хоста со сдвигом TIMEZONE_OFFSET в секунды с эпохи UTC.
+
+    В SQLite строки переводятся на месте с учётом перехода на летнее время хоста, в PostgreSQL
+    меняется тип колонки со сдвигом, действующим на момент миграции.
+    """
+    quote = connection.dialect.identifier_preparer.quote
+    for table in Base.metadata.sorted_tables:
+        columns = {info['name']: info['type'] for info in inspect(connection).get_columns(table.name)}
+        for column in table.columns:
+            if not isinstance(column.type, UTCEpoch) or column.name not in columns:
+                continue
+            table_name, column_name = quote(table.name), quote(column.name)
+            if connection.dialect.name == 'sqlite':
+                connection.execute(text(
+                    f"UPDATE {table_name} SET {column_name} = "
+                    f"CAST(strftime('%s', {column_name}, 'utc') AS INTEGER) - :offset "
+                    f"WHERE typeof({column_name}) = 'text'"
+                ), {'offset': TIMEZONE_OFFSET * 3600})
+            elif not isinstance(columns[column.name], Integer):
+                offset = int(legacy_utc_offset().total_seconds())
+                connection.execute(text(
+                    f'ALTER TABLE {table_name} ALTER COLUMN {column_name} TYPE BIGINT '
+                    f'USING EXTRACT(EPOCH FROM {column_name})::BIGINT - {offset}'
+                ))
+
+
+def _add_user_timezone(connection):
+    if not _has_column(connection, 'user', 'timezone'):
+        connection.execute(text('ALTER TABLE "user" ADD COLUMN timezone VARCHAR(64)'))
+
+
+def _fill_slot_stats(connection):
+    # Таблицу slot_stats создаёт create_all, а сводку по уже накопленному архиву нужно посчитать один раз.
+    now = int(time.time())
+    connection.execute(text(
+        'INSERT INTO slot_stats (hour, type, user_id, slots, matched, seconds, matched_seconds, created, updated) '
+        'SELECT start_time / 3600, type, user_id, COUNT(*), SUM(CASE WHEN matched THEN 1 ELSE 0 END), '
+        'SUM(end_time - start_time), SUM(CASE WHEN matched THEN end_time - start_time ELSE 0 END), :now, :now '
+        'FROM time_slot_archive GROUP BY start_time / 3600, type, user_id'
+    ), {'now': now})
+
+
+def _add_follow_up_claimed_until(connection):
+    if not _has_column(connection, 'follow_up', 'claimed_until'):
+        connection.execute(text('ALTER TABLE follow_up ADD COLUMN claimed_until BIGINT'))
+
+
+def _replace_time_slot_indexes(connection):
+    # Поиск пар ушёл в slot_index, и прежние индексы time_slot ни один запрос больше не использует.
+    for name in ('ix_time_slot_overlap', 'ix_time_slot_user', 'ix_time_slot_matched_user'):
+        connection.execute(text(f'DROP INDEX IF EXISTS {name}'))
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_time_slot_open ON time_slot (matched, expired, end_time)'))
+    connection.execute(text('CREATE INDEX IF NOT EXISTS ix_time_slot_end_time ON time_slot (end_time)'))
+
+
+def _add_follow_up_request_slot_index(connection):
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_follow_up_request_slot_id ON follow_up (request_slot_id)'
+    ))
+
+
+def _widen_telegram_ids(connection):
+    # Идентификаторы пользователей и чатов Telegram бывают больше 2^31. В SQLite INTEGER и так восьмибайтовый.
+    if connection.dialect.name == 'sqlite':
+        return
+    connection.execute(text('ALTER TABLE "user" ALTER COLUMN telegram_id TYPE BIGINT'))
+    connection.execute(text('ALTER TABLE persistence_entry ALTER COLUMN chat_id TYPE BIGINT'))
+
+
+MIGRATIONS = [
+    (1, _add_time_slot_indexes),
+    (2, _add_follow_up_request_slot),
+    (3, _add_time_slot_expired),
+    (4, _convert_times_to_utc_epoch),
+    (5, _add_user_timezone),
+    (6, _fill_slot_stats),
+    (7, _add_follow_up_claimed_until),
+    (8, _replace_time_slot_indexes),
+    (9, _add_follow_up_request_slot_index),
+    (10, _widen_telegram_ids),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(connection):
+    return connection.execute(text('SELECT version FROM schema_version')).scalar()
+
+
+def migrate(connection):
+    """Создаёт недостающие таблицы и применяет миграции, которых ещё нет в базе."""
+    fresh = not inspect(connection).has_table('time_slot')
+    Base.metadata.create_all(connection)
+    connection.execute(text('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)'))
+
+    version = get_schema_version(connection)
+    if version is None:
+        version = LATEST_VERSION if fresh else 0
+        connection.execute(text('INSERT INTO schema_version (version) VALUES (:version)'), {'version': version})
+
+    for migration_version, migration in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        logger.info('Applying migration %s: %s', migration_version, migration.__name__)
+        migration(connection)
+        connection.execute(text('UPDATE schema_version SET version = :version'), {'version': migration_version})
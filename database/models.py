@@ -1,14 +1,38 @@
 import enum
+from datetime import datetime, timezone
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String, func, Column, Enum, Boolean
+from sqlalchemy import (BigInteger, DateTime, ForeignKey, Integer, String, Text, func, Column, Enum, Boolean, Index,
+                        TypeDecorator, UniqueConstraint)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 from utils.utils import get_current_datetime
 
 
+class UTCEpoch(TypeDecorator):
+    """Момент времени как целое число секунд с эпохи UTC.
+
+    Принимает только datetime с часовым поясом и возвращает datetime в UTC, поэтому сравнения
+    и индексы в базе работают с числами, а часовой пояс пользователя нужен только при вводе и выводе.
+    """
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            raise ValueError(f'Время без часового пояса: {value}')
+        return int(value.timestamp())
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return datetime.fromtimestamp(value, timezone.utc)
+
+
 class Base(DeclarativeBase):
-    created: Mapped[DateTime] = mapped_column(DateTime, default=get_current_datetime)
-    updated: Mapped[DateTime] = mapped_column(DateTime, default=get_current_datetime, onupdate=get_current_datetime)
+    created: Mapped[DateTime] = mapped_column(UTCEpoch, default=get_current_datetime)
+    updated: Mapped[DateTime] = mapped_column(UTCEpoch, default=get_current_datetime, onupdate=get_current_datetime)
 
 
 class SlotType(enum.Enum):
@@ -20,8 +44,10 @@ class User(Base):
     __tablename__ = 'user'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    telegram_id = Column(Integer, unique=True, nullable=False)
+    telegram_id = Column(BigInteger, unique=True, nullable=False)
     telegram_username = Column(String(150), nullable=False)
+    # Имя из utils.utils.parse_timezone; None — часовой пояс бота по умолчанию.
+    timezone = Column(String(64), nullable=True)
     time_slots = relationship('TimeSlot', back_populates='user', foreign_keys='TimeSlot.user_id')
 
 
@@ -29,11 +55,112 @@ class TimeSlot(Base):
     __tablename__ = 'time_slot'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    start_time = Column(DateTime, nullable=False)
-    end_time = Column(DateTime, nullable=False)
+    start_time = Column(UTCEpoch, nullable=False)
+    end_time = Column(UTCEpoch, nullable=False)
     type = Column(Enum(SlotType), nullable=False)
     user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
     user = relationship('User', back_populates='time_slots', foreign_keys=[user_id])
     matched = Column(Boolean, nullable=False, default=False)
     matched_user_id = Column(Integer, ForeignKey('user.id'), nullable=True)
     matched_user = relationship('User', foreign_keys=[matched_user_id])
+    expired = Column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        # Свободные слоты по времени окончания: загрузка индекса слотов и пометка истёкших.
+        Index('ix_time_slot_open', 'matched', 'expired', 'end_time'),
+        # Перенос закончившихся слотов в архив.
+        Index('ix_time_slot_end_time', 'end_time'),
+    )
+
+
+class TimeSlotArchive(Base):
+    """Прошедшие слоты, перенесённые из time_slot, чтобы рабочая таблица не росла."""
+    __tablename__ = 'time_slot_archive'
+
+    id = Column(Integer, primary_key=True)
+    start_time = Column(UTCEpoch, nullable=False)
+    end_time = Column(UTCEpoch, nullable=False)
+    type = Column(Enum(SlotType), nullable=False)
+    user_id = Column(Integer, nullable=False, index=True)
+    matched = Column(Boolean, nullable=False)
+    matched_user_id = Column(Integer, nullable=True)
+    expired = Column(Boolean, nullable=False)
+    archived_at = Column(UTCEpoch, nullable=False, default=get_current_datetime)
+
+
+class MatchCandidate(Base):
+    """Помощник, о котором запросившему уже сообщили, — чтобы не присылать его повторно."""
+    __tablename__ = 'match_candidate'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    request_slot_id = Column(Integer, ForeignKey('time_slot.id'), nullable=False)
+    offer_slot_id = Column(Integer, ForeignKey('time_slot.id'), nullable=False)
+    helper_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    overlap_seconds = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('request_slot_id', 'helper_id', name='uq_match_candidate_request_helper'),
+        Index('ix_match_candidate_offer', 'offer_slot_id'),
+    )
+
+
+class FollowUp(Base):
+    __tablename__ = 'follow_up'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    requester_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    helper_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    request_slot_id = Column(Integer, ForeignKey('time_slot.id'), nullable=True, index=True)
+    run_at = Column(UTCEpoch, nullable=False, index=True)
+    # До этого момента напоминание обрабатывается; если процесс упал, после него напоминание заберут снова.
+    claimed_until = Column(UTCEpoch, nullable=True)
+
+
+class PersistenceEntry(Base):
+    """Состояние диалогов и chat_data, общее для всех процессов бота и переживающее перезапуск."""
+    __tablename__ = 'persistence_entry'
+
+    kind = Column(String(64), primary_key=True)
+    key = Column(String(64), primary_key=True)
+    chat_id = Column(BigInteger, nullable=True, index=True)
+    data = Column(Text, nullable=False)
+
+
+class Lease(Base):
+    """Аренда фоновых задач: их выполняет только процесс, который держит непросроченную аренду."""
+    __tablename__ = 'lease'
+
+    name = Column(String(64), primary_key=True)
+    owner = Column(String(128), nullable=False)
+    expires_at = Column(UTCEpoch, nullable=False)
+
+
+class SlotStats(Base):
+    """Сводка по перенесённым в архив слотам: час начала, тип и пользователь.
+
+    Архив не меняется, поэтому сводка пополняется в той же транзакции, что и перенос слотов,
+    и отчётам администратора не нужно пересчитывать историю.
+    """
+    __tablename__ = 'slot_stats'
+
+    hour = Column(BigInteger, primary_key=True)
+    type = Column(Enum(SlotType), primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    slots = Column(Integer, nullable=False)
+    matched = Column(Integer, nullable=False)
+    seconds = Column(BigInteger, nullable=False)
+    matched_seconds = Column(BigInteger, nullable=False)
+
+
+class MeetingConfirmation(Base):
+    """Ответ «Да» или «Нет» на вопрос, удалось ли договориться о встрече."""
+    __tablename__ = 'meeting_confirmation'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    request_slot_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    confirmed = Column(Boolean, nullable=False)
+
+    __table_args__ = (
+        Index('ix_meeting_confirmation_created', 'created'),
+    )
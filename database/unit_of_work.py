@@ -0,0 +1,49 @@
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from database.engine import session_maker
+from utils.metrics import metrics
+
+_current_unit = ContextVar('db_unit_of_work', default=None)
+
+
+class UnitOfWork:
+    """Сессия одного обновления. Открывается при первом обращении к базе."""
+
+    def __init__(self):
+        self.session = None
+        self._opened_at = None
+
+    async def get_session(self):
+        if self.session is None:
+            self._opened_at = time.perf_counter()
+            self.session = session_maker()
+            await self.session.connection()
+            metrics.observe('db_pool_checkout_seconds', time.perf_counter() - self._opened_at)
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            metrics.observe('db_session_lifetime_seconds', time.perf_counter() - self._opened_at)
+            self.session = None
+
+
+@asynccontextmanager
+async def unit_of_work():
+    unit = UnitOfWork()
+    token = _current_unit.set(unit)
+    try:
+        yield unit
+    finally:
+        _current_unit.reset(token)
+        await unit.close()
+
+
+async def get_session():
+    """Возвращает сессию текущего обновления, открывая её при первом вызове."""
+    unit = _current_unit.get()
+    if unit is None:
+        raise RuntimeError('get_session() вызван вне with_db_session')
+    return await unit.get_session()
@@ -0,0 +1,72 @@
+import io
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from database.unit_of_work import get_session
+from utils.analytics import build_report, export_slots_csv
+from utils.config import ADMIN_TELEGRAM_ID
+from utils.decorators import with_db_session
+from utils.metrics import metrics
+from utils.utils import get_current_datetime
+
+MAX_MESSAGE_LENGTH = 4000
+DEFAULT_ANALYTICS_DAYS = 30
+MAX_ANALYTICS_DAYS = 3650
+
+
+def is_admin(update: Update):
+    return ADMIN_TELEGRAM_ID is not None and str(update.effective_user.id) == str(ADMIN_TELEGRAM_ID)
+
+
+async def stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update):
+        return
+
+    if context.args and context.args[0] == 'prometheus':
+        await update.message.reply_document(
+            io.BytesIO(metrics.render_prometheus().encode()), filename='metrics.txt'
+        )
+        return
+
+    await reply_long_text(update, metrics.summary(), 'stats.txt')
+
+
+async def reply_long_text(update: Update, text, filename):
+    if len(text) > MAX_MESSAGE_LENGTH:
+        await update.message.reply_document(io.BytesIO(text.encode()), filename=filename)
+    else:
+        await update.message.reply_text(text)
+
+
+@with_db_session
+async def analytics_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/analytics [дни] — доля совпадений, спрос без помощников по часам, загрузка помощников, ответы «Нет»."""
+    if not is_admin(update):
+        return
+
+    days = DEFAULT_ANALYTICS_DAYS
+    if context.args:
+        if not context.args[0].isdigit() or not 1 <= int(context.args[0]) <= MAX_ANALYTICS_DAYS:
+            await update.message.reply_text(
+                f'Укажите период в днях от 1 до {MAX_ANALYTICS_DAYS}, например: /analytics 7'
+            )
+            return
+        days = int(context.args[0])
+    report = await build_report(await get_session(), days)
+    await reply_long_text(update, report, 'analytics.txt')
+
+
+@with_db_session
+async def export_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export — все слоты, включая архив, в CSV; большой файл приходит несколькими частями."""
+    if not is_admin(update):
+        return
+
+    date = get_current_datetime().strftime('%Y%m%d')
+
+    async def send_part(file, number):
+        await update.message.reply_document(file, filename=f'slots-{date}-{number}.csv')
+
+    rows, parts = await export_slots_csv(await get_session(), send_part)
+    await update.message.reply_text(f'Выгружено слотов: {rows}, файлов: {parts}.')
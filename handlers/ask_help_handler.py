@@ -1,229 +1,162 @@
-from datetime import timedelta, datetime
+from datetime import timedelta
 
-from sqlalchemy import select, or_, and_
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 
-from database.models import SlotType, TimeSlot, User
+from database.models import SlotType
+from database.unit_of_work import get_session
 from utils.config import ADMIN_TELEGRAM_ID
 from utils.decorators import with_db_session
-from utils.utils import validate_time_slot, parse_time_slot
-from utils.db_queries import get_or_create_user, save_time_slot, find_matching_offers
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from utils.utils import TimeSlotError, format_time_slot, get_timezone, parse_time_slots
+from utils.callbacks import MAX_KEYBOARD_BUTTONS, CallbackAction, callback_router, encode_callback
+from utils.db_queries import (get_or_create_user, save_time_slots, find_new_candidates, get_slots_by_ids,
+                              get_request_slot_with_users, record_match_candidates, record_meeting_confirmation)
+from utils.match_service import claim_match
+from utils.notifications import notifier
+from utils.rate_limit import admit_time_slots
 
-ASK_HELP_TIME_SLOTS, CONFIRM_MEETING = range(2)
-scheduler = AsyncIOScheduler()
-scheduler.start()
+ASK_HELP_TIME_SLOTS = 0
 
 
 @with_db_session
 async def ask_help_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         'Пожалуйста, укажите время, когда вам нужна помощь в формате YYYY-MM-DD HH:MM-HH:MM. '
-        'Например, 2024-06-20 09:00-12:00'
+        'Например, 2024-06-20 09:00-12:00\n\n'
+        'Можно указать несколько интервалов, каждый с новой строки, '
+        'или расписание на несколько недель: Пн-Пт 09:00-12:00 на 4 недели\n\n'
+        'Время указывается в вашем часовом поясе, изменить его можно командой /timezone'
     )
     return ASK_HELP_TIME_SLOTS
 
 
 @with_db_session
 async def save_ask_help_time_slots(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    time_slot_text = update.message.text
     telegram_id = update.message.from_user.id
     telegram_username = update.message.from_user.username
+    session = await get_session()
+    user = await get_or_create_user(session, telegram_id, telegram_username)
+    tz = get_timezone(user.timezone)
+    try:
+        intervals = parse_time_slots(update.message.text, tz)
+    except TimeSlotError as error:
+        await update.message.reply_text(
+            f'{error}.\n\nПожалуйста, укажите время в формате YYYY-MM-DD HH:MM-HH:MM. '
+            'Например, 2024-06-20 09:00-12:00'
+        )
+        return ASK_HELP_TIME_SLOTS
 
-    if validate_time_slot(time_slot_text):
-        start_time, end_time = parse_time_slot(time_slot_text)
-
-        session = context.chat_data['db_session']
-        user = await get_or_create_user(session, telegram_id, telegram_username)
-        await save_time_slot(session, user, start_time, end_time, slot_type=SlotType.REQUEST)
-        await session.commit()
-        matching_slots = await find_matching_offers(session, start_time, end_time)
-
-        if matching_slots:
-            matching_text = '\n'.join([
-                f'@{slot.user.telegram_username} ({slot.start_time.strftime("%H:%M")}-{slot.end_time.strftime("%H:%M")})'
-                for slot in matching_slots
-            ])
-            keyboard = [
-                [
-                    InlineKeyboardButton(
-                        f'{slot.user.telegram_username} '
-                        f'({slot.start_time.strftime("%H:%M")}-{slot.end_time.strftime("%H:%M")})',
-                        callback_data=f"{slot.user.id}|{slot.start_time.isoformat()}|{slot.end_time.isoformat()}")
-                ]
-                for slot in matching_slots
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text(
-                f'Нашёл помощников на выбранное время:\n\n{matching_text}\n\n'
-                'Свяжитесь с ними, а после нажмите кнопку с пользователем, с которым удалось договориться:',
-                reply_markup=reply_markup
-            )
-            return CONFIRM_MEETING
-        else:
-            await update.message.reply_text(
-                'К сожалению, на указанное время никого нет. '
-                'Продолжаю искать. Я уведомлю вас, как только кто-то найдётся.'
-            )
+    intervals = await admit_time_slots(update, user.id, SlotType.REQUEST, intervals)
+    if not intervals:
         return ConversationHandler.END
+
+    request_slots = await save_time_slots(session, user, intervals, slot_type=SlotType.REQUEST)
+    matches = await find_new_candidates(session, SlotType.OFFER, request_slots)
+    pairs = [
+        (slot, request_slot)
+        for request_slot in request_slots
+        for slot in matches[request_slot.id]
+    ][:MAX_KEYBOARD_BUTTONS]
+
+    if pairs:
+        matching_text = '\n'.join([
+            f'@{slot.user.telegram_username} ({format_time_slot(slot.start_time, slot.end_time, tz)})'
+            for slot, _ in pairs
+        ])
+        keyboard = [
+            [
+                InlineKeyboardButton(
+                    f'{slot.user.telegram_username} ({format_time_slot(slot.start_time, slot.end_time, tz)})',
+                    callback_data=encode_callback(CallbackAction.CHOOSE_HELPER, slot.id, request_slot.id))
+            ]
+            for slot, request_slot in pairs
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await update.message.reply_text(
+            f'Нашёл помощников на выбранное время:\n\n{matching_text}\n\n'
+            'Свяжитесь с ними, а после нажмите кнопку с пользователем, с которым удалось договориться:',
+            reply_markup=reply_markup
+        )
+        # Запоминаются только показанные помощники: не попавших в клавиатуру можно будет предложить позже.
+        await record_match_candidates(session, [(request_slot, slot) for slot, request_slot in pairs])
     else:
         await update.message.reply_text(
-            'Неверный формат. Пожалуйста, укажите время в формате YYYY-MM-DD HH:MM-HH:MM. '
-            'Например, 2024-06-20 09:00-12:00'
+            'К сожалению, на указанное время никого нет. '
+            'Продолжаю искать. Я уведомлю вас, как только кто-то найдётся.'
         )
-        return ASK_HELP_TIME_SLOTS
+    return ConversationHandler.END
 
 
+@callback_router.register(CallbackAction.CHOOSE_HELPER)
 @with_db_session
-async def confirm_meeting(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def confirm_meeting(update: Update, context: ContextTypes.DEFAULT_TYPE, offer_slot_id, request_slot_id):
     query = update.callback_query
     await query.answer()
-
-    callback_data = query.data.split('|')
-    helper_id = int(callback_data[0])
-    start_time = callback_data[1]
-    end_time = callback_data[2]
-    requester_id = query.from_user.id
-    session = context.chat_data['db_session']
-
-    start_time = datetime.fromisoformat(start_time)
-    end_time = datetime.fromisoformat(end_time)
-
-    helper_slot = await session.execute(
-        select(TimeSlot)
-        .filter_by(user_id=helper_id, start_time=start_time, end_time=end_time, type=SlotType.OFFER)
-        .options(joinedload(TimeSlot.user))
-    )
-    helper_slot = helper_slot.scalars().first()
-
-    requester_slot = None
-    if helper_slot:
-        requester_slot = await session.execute(
-            select(TimeSlot)
-            .join(User, TimeSlot.user_id == User.id)
-            .filter(
-                User.telegram_id == requester_id,
-                TimeSlot.type == SlotType.REQUEST,
-                or_(
-                    and_(TimeSlot.start_time <= helper_slot.start_time, TimeSlot.end_time >= helper_slot.start_time),
-                    and_(TimeSlot.start_time <= helper_slot.end_time, TimeSlot.end_time >= helper_slot.end_time),
-                    and_(TimeSlot.start_time >= helper_slot.start_time, TimeSlot.end_time <= helper_slot.end_time),
-                    and_(TimeSlot.start_time <= helper_slot.start_time, TimeSlot.end_time >= helper_slot.end_time),
-                )
-            )
-            .order_by(TimeSlot.created.desc())
-            .options(joinedload(TimeSlot.user))
-        )
-        requester_slot = requester_slot.scalars().first()
-        if requester_slot:
-            requester_slot.matched = True
-            requester_slot.matched_user_id = helper_slot.user_id
-            session.add(requester_slot)
-            await session.commit()
-    if helper_slot and requester_slot:
-        helper_user = await session.execute(select(User).filter_by(id=helper_id))
-        helper_user = helper_user.scalars().first()
-        requester_user = await session.execute(select(User).filter_by(telegram_id=requester_id))
-        requester_user = requester_user.scalars().first()
-
-        if helper_user and requester_user:
-            meeting_time = max(helper_slot.end_time, requester_slot.end_time) + timedelta(hours=1)
-            scheduler.add_job(
-                check_meeting_status, 'date', run_date=meeting_time, args=[
-                    requester_id, helper_id, session, context
-                ]
-            )
-
+    session = await get_session()
+
+    slots = {slot.id: slot for slot in await get_slots_by_ids(session, [offer_slot_id, request_slot_id])}
+    helper_slot = slots.get(offer_slot_id)
+    requester_slot = slots.get(request_slot_id)
+
+    if (helper_slot and requester_slot
+            and helper_slot.type == SlotType.OFFER and requester_slot.type == SlotType.REQUEST
+            and requester_slot.user.telegram_id == query.from_user.id):
+        meeting_time = max(helper_slot.end_time, requester_slot.end_time) + timedelta(hours=1)
+        if await claim_match(session, requester_slot, helper_slot, follow_up_at=meeting_time):
+            tz = get_timezone(requester_slot.user.timezone)
             await query.edit_message_text(
-                f'Вы выбрали помощь от пользователя @{helper_user.telegram_username}.\n'
-                f'Слот помощника: {helper_slot.start_time.strftime("%Y-%m-%d %H:%M")} - '
-                f'{helper_slot.end_time.strftime("%H:%M")}\n'
-                f'Ваш слот: {requester_slot.start_time.strftime("%Y-%m-%d %H:%M")} - '
-                f'{requester_slot.end_time.strftime("%H:%M")}\n'
+                f'Вы выбрали помощь от пользователя @{helper_slot.user.telegram_username}.\n'
+                f'Слот помощника: {format_time_slot(helper_slot.start_time, helper_slot.end_time, tz, " - ")}\n'
+                f'Ваш слот: {format_time_slot(requester_slot.start_time, requester_slot.end_time, tz, " - ")}\n'
                 f'Мы напомним вам через час после встречи для подтверждения.'
             )
         else:
-            await query.edit_message_text('Ошибка при подтверждении встречи. Пользователь не найден.')
+            await query.edit_message_text('Этот помощник уже договорился о встрече с другим пользователем.')
     else:
         await query.edit_message_text('Ошибка при подтверждении встречи. Слот не найден.')
 
 
-async def check_meeting_status(requester_id, helper_id, session, context):
-    requester = await session.execute(select(User).filter_by(telegram_id=requester_id))
-    helper = await session.execute(select(User).filter_by(id=helper_id))
-    requester = requester.scalars().first()
-    helper = helper.scalars().first()
+async def check_meeting_status(session, request_slot_id):
+    """Спрашивает обоих участников, состоялась ли встреча. Возвращает отправки, которые нужно дождаться."""
+    requester_slot = await get_request_slot_with_users(session, request_slot_id)
 
-    if requester and helper:
+    if requester_slot and requester_slot.matched_user:
+        requester = requester_slot.user
+        helper = requester_slot.matched_user
         keyboard = [
-            [InlineKeyboardButton('Да', callback_data=f'confirm_yes_{requester_id}_{helper_id}'),
-             InlineKeyboardButton('Нет', callback_data=f'confirm_no_{requester_id}_{helper_id}')]
+            [InlineKeyboardButton('Да', callback_data=encode_callback(
+                CallbackAction.CONFIRM_MEETING, request_slot_id, 1)),
+             InlineKeyboardButton('Нет', callback_data=encode_callback(
+                 CallbackAction.CONFIRM_MEETING, request_slot_id, 0))]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await context.bot.send_message(requester.telegram_id,
-                                       f'Удалось ли вам договориться с пользователем @{helper.telegram_username} ()? '
-                                       f'Пожалуйста, выберите "Да" или "Нет":',
-                                       reply_markup=reply_markup)
-        await context.bot.send_message(helper.telegram_id,
-                                       f'Удалось ли вам договориться с пользователем @{requester.telegram_username}? '
-                                       f'Пожалуйста, выберите: "Да" или "Нет":',
-                                       reply_markup=reply_markup)
+        return [
+            notifier.enqueue(requester.telegram_id,
+                             f'Удалось ли вам договориться с пользователем @{helper.telegram_username} ()? '
+                             f'Пожалуйста, выберите "Да" или "Нет":',
+                             reply_markup=reply_markup),
+            notifier.enqueue(helper.telegram_id,
+                             f'Удалось ли вам договориться с пользователем @{requester.telegram_username}? '
+                             f'Пожалуйста, выберите: "Да" или "Нет":',
+                             reply_markup=reply_markup),
+        ]
+    return []
 
 
+@callback_router.register(CallbackAction.CONFIRM_MEETING)
 @with_db_session
-async def handle_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE, request_slot_id, confirmed):
     query = update.callback_query
     await query.answer()
+    session = await get_session()
 
-    data = query.data.split("_")
-    confirmation = data[1]
-    requester_id = int(data[2])
-    helper_id = int(data[3])
-    session: AsyncSession = context.chat_data['db_session']
-
-    requester_slot_result = await session.execute(
-        select(TimeSlot).join(
-            User,
-            TimeSlot.user_id == User.id
-        ).filter(
-            User.telegram_id == requester_id,
-            TimeSlot.type == SlotType.REQUEST,
-            TimeSlot.matched == True,
-            TimeSlot.matched_user_id == helper_id
-        ).order_by(TimeSlot.created.desc())
-    )
-    requester_slot = requester_slot_result.scalars().first()
-
-    requester_result = await session.execute(select(User).filter_by(telegram_id=requester_id))
-    helper_result = await session.execute(select(User).filter_by(id=helper_id))
-    requester = requester_result.scalars().first()
-    helper = helper_result.scalars().first()
-
-    if requester_slot:
-        helper_slot_result = await session.execute(
-            select(TimeSlot).filter(
-                TimeSlot.user_id == helper_id,
-                TimeSlot.type == SlotType.OFFER,
-                or_(
-                    and_(TimeSlot.start_time <= requester_slot.start_time, TimeSlot.end_time >= requester_slot.start_time),
-                    and_(TimeSlot.start_time <= requester_slot.end_time, TimeSlot.end_time >= requester_slot.end_time),
-                    and_(TimeSlot.start_time >= requester_slot.start_time, TimeSlot.end_time <= requester_slot.end_time),
-                    and_(TimeSlot.start_time <= requester_slot.start_time, TimeSlot.end_time >= requester_slot.end_time),
-                )
-            ).order_by(TimeSlot.start_time)
-        )
-        helper_slot = helper_slot_result.scalars().first()
-
-        if helper_slot:
-            helper_slot.matched = True
-            helper_slot.matched_user_id = requester.id
-            session.add(helper_slot)
-            await session.commit()
+    requester_slot = await get_request_slot_with_users(session, request_slot_id)
+    requester = requester_slot.user if requester_slot else None
+    helper = requester_slot.matched_user if requester_slot else None
+    user = await get_or_create_user(session, query.from_user.id, query.from_user.username)
+    await record_meeting_confirmation(session, request_slot_id, user.id, confirmed)
 
-    if confirmation == "yes":
+    if confirmed:
         await query.edit_message_text('Спасибо за подтверждение! Рады, что вы смогли помочь друг другу.')
     else:
         await query.edit_message_text('Похоже, что что-то пошло не так. Я сообщу модератору для проверки.')
@@ -233,6 +166,5 @@ async def handle_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE
                 f'Проблема с подтверждением встречи.\n\n'
                 f'Запросил помощь: @{requester.telegram_username}.\n'
                 f'Предложил помощь: @{helper.telegram_username}.\n\n'
-                f'Слот: {requester_slot.start_time.strftime("%Y-%m-%d %H:%M")} - '
-                f'{requester_slot.end_time.strftime("%H:%M")}'
+                f'Слот: {format_time_slot(requester_slot.start_time, requester_slot.end_time, separator=" - ")}'
             )
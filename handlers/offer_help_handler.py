@@ -1,66 +1,92 @@
+from functools import partial
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 
+from database.engine import session_maker
 from database.models import SlotType
+from database.unit_of_work import get_session
+from utils.callbacks import MAX_KEYBOARD_BUTTONS, CallbackAction, encode_callback
 from utils.decorators import with_db_session
-from utils.utils import validate_time_slot, parse_time_slot
-from utils.db_queries import save_time_slot, get_or_create_user, find_matching_requests
+from utils.utils import TimeSlotError, format_time_slot, get_timezone, parse_time_slots
+from utils.db_queries import save_time_slots, get_or_create_user, find_new_candidates, record_match_candidates
+from utils.notifications import notifier
+from utils.rate_limit import admit_time_slots
+
+ASK_TIME_SLOTS = 0
 
-ASK_TIME_SLOTS = range(1)
+
+async def remember_notified(pairs):
+    async with session_maker() as session:
+        await record_match_candidates(session, pairs)
 
 
 @with_db_session
 async def offer_help_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         'Пожалуйста, укажите время, когда вы готовы помочь в формате YYYY-MM-DD HH:MM-HH:MM. '
-        'Например, 2024-06-20 09:00-12:00'
+        'Например, 2024-06-20 09:00-12:00\n\n'
+        'Можно указать несколько интервалов, каждый с новой строки, '
+        'или расписание на несколько недель: Пн-Пт 09:00-12:00 на 4 недели\n\n'
+        'Время указывается в вашем часовом поясе, изменить его можно командой /timezone'
     )
     return ASK_TIME_SLOTS
 
 
 @with_db_session
 async def save_offer_help_time_slots(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    time_slot_text = update.message.text
     telegram_id = update.message.from_user.id
     telegram_username = update.message.from_user.username
-
-    if validate_time_slot(time_slot_text):
-        start_time, end_time = parse_time_slot(time_slot_text)
-
-        session = context.chat_data['db_session']
-        user = await get_or_create_user(session, telegram_id, telegram_username)
-        await save_time_slot(session, user, start_time, end_time, slot_type=SlotType.OFFER)
-
-        matching_requests = await find_matching_requests(session, start_time, end_time)
-        for request in matching_requests:
-            matching_text = '\n'.join([
-                f'@{slot.user.telegram_username} ({slot.start_time.strftime("%H:%M")}-{slot.end_time.strftime("%H:%M")})'
-                for slot in matching_requests
-            ])
-            keyboard = [
-                [
-                    InlineKeyboardButton(
-                        f'{slot.user.telegram_username} '
-                        f'({slot.start_time.strftime("%H:%M")}-{slot.end_time.strftime("%H:%M")})',
-                        callback_data=f"{slot.user.id}|{slot.start_time.isoformat()}|{slot.end_time.isoformat()}")
-                ]
-                for slot in matching_requests
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await context.bot.send_message(
-                request.user.telegram_id,
-                f'Нашёл помощника на выбранное время:\n\n'
-                f'{matching_text}\n\n'
-                f'Пожалуйста, выберите если удалось договориться:',
-                reply_markup=reply_markup
-            )
-
-        await update.message.reply_text(f'Вы указали временной слот: {time_slot_text}')
-        return ConversationHandler.END
-
-    else:
+    session = await get_session()
+    user = await get_or_create_user(session, telegram_id, telegram_username)
+    tz = get_timezone(user.timezone)
+    try:
+        intervals = parse_time_slots(update.message.text, tz)
+    except TimeSlotError as error:
         await update.message.reply_text(
-            'Неверный формат. Пожалуйста, укажите время в формате YYYY-MM-DD HH:MM-HH:MM. '
+            f'{error}.\n\nПожалуйста, укажите время в формате YYYY-MM-DD HH:MM-HH:MM. '
             'Например, 2024-06-20 09:00-12:00'
         )
         return ASK_TIME_SLOTS
+
+    intervals = await admit_time_slots(update, user.id, SlotType.OFFER, intervals)
+    if not intervals:
+        return ConversationHandler.END
+
+    offer_slots = await save_time_slots(session, user, intervals, slot_type=SlotType.OFFER)
+    matches = await find_new_candidates(session, SlotType.REQUEST, offer_slots)
+
+    buttons = {}
+    shown = {}
+    for offer_slot in offer_slots:
+        requesters = set()
+        for request in matches[offer_slot.id]:
+            requester_id = request.user.telegram_id
+            if requester_id in requesters:
+                continue
+            requesters.add(requester_id)
+            requester_buttons = buttons.setdefault(requester_id, [])
+            if len(requester_buttons) < MAX_KEYBOARD_BUTTONS:
+                # Время в уведомлении показывается в часовом поясе запросившего.
+                requester_tz = get_timezone(request.user.timezone)
+                slot_text = format_time_slot(offer_slot.start_time, offer_slot.end_time, requester_tz)
+                requester_buttons.append(InlineKeyboardButton(
+                    f'{user.telegram_username} ({slot_text})',
+                    callback_data=encode_callback(CallbackAction.CHOOSE_HELPER, offer_slot.id, request.id)
+                ))
+                shown.setdefault(requester_id, []).append((request, offer_slot))
+    for requester_id, requester_buttons in buttons.items():
+        slots_text = '\n'.join(f'@{button.text}' for button in requester_buttons)
+        notifier.enqueue(
+            requester_id,
+            f'Нашёл помощника на выбранное время:\n\n'
+            f'{slots_text}\n\n'
+            f'Пожалуйста, выберите если удалось договориться:',
+            reply_markup=InlineKeyboardMarkup([[button] for button in requester_buttons]),
+            # Пара считается показанной, только когда уведомление дошло.
+            on_sent=partial(remember_notified, shown[requester_id]),
+        )
+
+    slots_text = '\n'.join(format_time_slot(start_time, end_time, tz) for start_time, end_time in intervals)
+    await update.message.reply_text(f'Вы указали временные слоты:\n{slots_text}')
+    return ConversationHandler.END
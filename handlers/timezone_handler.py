@@ -0,0 +1,36 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from database.unit_of_work import get_session
+from utils.decorators import with_db_session
+from utils.db_queries import get_or_create_user, set_user_timezone
+from utils.utils import TimeZoneError, format_datetime, get_current_datetime, get_timezone, parse_timezone
+
+
+@with_db_session
+async def timezone_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    session = await get_session()
+    user = await get_or_create_user(session, update.message.from_user.id, update.message.from_user.username)
+
+    if not context.args:
+        tz = get_timezone(user.timezone)
+        await update.message.reply_text(
+            f'Ваш часовой пояс: {user.timezone or f"{tz} (по умолчанию)"}, '
+            f'сейчас {format_datetime(get_current_datetime(), tz)}.\n\n'
+            'Чтобы изменить его, отправьте /timezone и название пояса или смещение от UTC. '
+            'Например, /timezone Europe/Moscow или /timezone +3'
+        )
+        return
+
+    try:
+        timezone = parse_timezone(' '.join(context.args))
+    except TimeZoneError as error:
+        await update.message.reply_text(
+            f'{error}.\n\nУкажите название пояса или смещение от UTC. Например, /timezone Europe/Moscow или /timezone +3'
+        )
+        return
+
+    await set_user_timezone(session, user, timezone)
+    await update.message.reply_text(
+        f'Часовой пояс сохранён: {timezone}, сейчас {format_datetime(get_current_datetime(), get_timezone(timezone))}.'
+    )
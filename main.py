@@ -1,23 +1,35 @@
-import asyncio
+import atexit
 import logging
 import os
-from logging.handlers import TimedRotatingFileHandler
-import nest_asyncio
-from dotenv import find_dotenv, load_dotenv
-
-load_dotenv(find_dotenv())
-nest_asyncio.apply()
+import queue
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 
 from telegram import ReplyKeyboardMarkup, Update, KeyboardButton
 from telegram.ext import (ApplicationBuilder,
                           CommandHandler, ConversationHandler,
-                          ContextTypes, MessageHandler,
+                          ContextTypes, MessageHandler, TypeHandler,
                           filters, CallbackQueryHandler)
 
-from database.engine import create_db
-from handlers.ask_help_handler import ASK_HELP_TIME_SLOTS, CONFIRM_MEETING, save_ask_help_time_slots, confirm_meeting, \
-    ask_help_handler, handle_confirmation
+from database.engine import dispose_engine, init_engine, session_maker
+from handlers.ask_help_handler import ASK_HELP_TIME_SLOTS, save_ask_help_time_slots, ask_help_handler, \
+    check_meeting_status
+from handlers.admin_handler import analytics_handler, export_handler, stats_handler
 from handlers.offer_help_handler import offer_help_handler, save_offer_help_time_slots, ASK_TIME_SLOTS
+from handlers.timezone_handler import timezone_handler
+from utils.callbacks import callback_router
+from utils.config import (BOT_TOKEN, LOG_LEVEL, MAX_CONCURRENT_UPDATES, SHARED_STATE, UPDATE_QUEUE_SIZE, WEBHOOK_LISTEN,
+                          WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_URL)
+from utils.db_queries import load_slot_index
+from utils.follow_ups import follow_up_scheduler
+from utils.leader import leader_lease
+from utils.maintenance import maintenance_task
+from utils.notifications import notifier
+from utils.persistence import SQLPersistence, load_shared_state, save_shared_state
+from utils.rate_limit import throttle_update
+from utils.telegram_request import TimedRequest
+from utils.update_processor import BoundedUpdateQueue, ChatOrderedUpdateProcessor
+
+LOG_DIR = 'logs'
 
 
 class ExcludeLoggerFilter(logging.Filter):
@@ -28,21 +40,26 @@ class ExcludeLoggerFilter(logging.Filter):
         return not record.name.startswith(self.name)
 
 
-LOG_DIR = 'logs'
-logging.basicConfig(level=logging.DEBUG)
-os.makedirs(LOG_DIR, exist_ok=True)
-log_file = os.path.join(LOG_DIR, 'bot.log')
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-handler = TimedRotatingFileHandler(log_file, when='midnight', interval=1, backupCount=3)
-handler.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-exclude_httpcore_filter = ExcludeLoggerFilter('httpcore.http11')
-handler.addFilter(exclude_httpcore_filter)
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-
-BOT_TOKEN = os.environ.get('BOT_TOKEN')
+def configure_logging():
+    """Пишет логи в консоль и в logs/bot.log через очередь, чтобы запись в файл не блокировала цикл событий."""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_file = os.path.join(LOG_DIR, 'bot.log')
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    handler = TimedRotatingFileHandler(log_file, when='midnight', interval=1, backupCount=3)
+    exclude_httpcore_filter = ExcludeLoggerFilter('httpcore.http11')
+    handler.addFilter(exclude_httpcore_filter)
+    handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    log_listener = QueueListener(log_queue, console_handler, handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+    logger = logging.getLogger()
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(QueueHandler(log_queue))
+
+
 OFFER_HELP_ACTION = 'Помочь'
 ASK_HELP_ACTION = 'Попросить помощь'
 ACTIONS_BUTTONS = ReplyKeyboardMarkup([
@@ -53,7 +70,8 @@ ACTIONS_BUTTONS = ReplyKeyboardMarkup([
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
-        f'Привет! Чем могу помочь? Выберите действие: {OFFER_HELP_ACTION} или {ASK_HELP_ACTION}.',
+        f'Привет! Чем могу помочь? Выберите действие: {OFFER_HELP_ACTION} или {ASK_HELP_ACTION}.\n\n'
+        'Часовой пояс, в котором вы указываете время, можно изменить командой /timezone.',
         reply_markup=ACTIONS_BUTTONS,
     )
     return ConversationHandler.END
@@ -63,34 +81,104 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
-async def main():
-    await create_db()
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+async def start_background_tasks():
+    follow_up_scheduler.start(check_meeting_status)
+    maintenance_task.start()
+
+
+async def stop_background_tasks():
+    await maintenance_task.stop()
+    await follow_up_scheduler.stop()
+
+
+async def post_init(app):
+    # Схему базы создаёт SQLPersistence ещё при инициализации приложения.
+    async with session_maker() as session:
+        await load_slot_index(session)
+    notifier.start(app.bot)
+    leader_lease.start(start_background_tasks, stop_background_tasks)
+
+
+async def post_shutdown(app):
+    await leader_lease.stop()
+    await notifier.stop()
+    await dispose_engine()
+
+
+def build_application(token=BOT_TOKEN, request=None, get_updates_request=None):
+    """Собирает приложение: движок базы, обработчики и фоновые задачи создаются здесь, а не при импорте."""
+    init_engine()
+    update_queue = BoundedUpdateQueue(UPDATE_QUEUE_SIZE)
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .request(request or TimedRequest())
+        .update_queue(update_queue)
+        .concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES, update_queue))
+        .persistence(SQLPersistence())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if get_updates_request is not None:
+        builder.get_updates_request(get_updates_request)
+    app = builder.build()
     start_handler = CommandHandler('start', start)
+    stats_command_handler = CommandHandler('stats', stats_handler)
+    timezone_command_handler = CommandHandler('timezone', timezone_handler)
+    analytics_command_handler = CommandHandler('analytics', analytics_handler)
+    export_command_handler = CommandHandler('export', export_handler)
     ask_help_hndlr = ConversationHandler(
             entry_points=[MessageHandler(filters.Regex(f'^{ASK_HELP_ACTION}$'), ask_help_handler)],
             states={
                 ASK_HELP_TIME_SLOTS: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_ask_help_time_slots)],
-                CONFIRM_MEETING: [CallbackQueryHandler(confirm_meeting)]
             },
-            fallbacks=[CommandHandler('cancel', cancel)]
+            fallbacks=[CommandHandler('cancel', cancel)],
+            name='ask_help',
+            persistent=True,
         )
     offer_help_hndlr = ConversationHandler(
         entry_points=[MessageHandler(filters.Regex(f'^{OFFER_HELP_ACTION}$'), offer_help_handler)],
         states={
             ASK_TIME_SLOTS: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_offer_help_time_slots)]
         },
-        fallbacks=[CommandHandler('cancel', cancel)]
-    )
-    confirmation_handler = CallbackQueryHandler(
-        handle_confirmation, pattern=r'^confirm_(yes|no)_\d+_\d+$'
+        fallbacks=[CommandHandler('cancel', cancel)],
+        name='offer_help',
+        persistent=True,
     )
+    callback_handler = CallbackQueryHandler(callback_router.dispatch)
     app.add_handler(start_handler, 1)
     app.add_handler(ask_help_hndlr, 2)
     app.add_handler(offer_help_hndlr, 3)
-    app.add_handler(confirmation_handler, 4)
-    app.run_polling()
+    app.add_handler(callback_handler, 4)
+    app.add_handler(stats_command_handler, 5)
+    app.add_handler(timezone_command_handler, 6)
+    app.add_handler(analytics_command_handler, 7)
+    app.add_handler(export_command_handler, 8)
+    # Лимит сообщений проверяется раньше всех остальных обработчиков, включая чтение общего состояния.
+    app.add_handler(TypeHandler(Update, throttle_update), -1)
+    if SHARED_STATE:
+        app.add_handler(TypeHandler(Update, load_shared_state), 0)
+        app.add_handler(TypeHandler(Update, save_shared_state), 100)
+    return app
+
+
+def main():
+    if WEBHOOK_URL and not WEBHOOK_SECRET:
+        # Без секрета webhook принимает обновления от кого угодно.
+        raise RuntimeError('Для режима webhook (WEBHOOK_URL) нужно задать WEBHOOK_SECRET')
+    configure_logging()
+    app = build_application()
+    if WEBHOOK_URL:
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            webhook_url=f'{WEBHOOK_URL.rstrip("/")}/{WEBHOOK_PATH}',
+        )
+    else:
+        app.run_polling()
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    main()
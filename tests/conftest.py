@@ -0,0 +1,67 @@
+from datetime import timedelta
+from itertools import count
+
+import pytest
+
+from database.engine import create_db, dispose_engine, init_engine, session_maker
+from database.models import TimeSlot, User
+from utils.cache import slot_cache, user_cache
+from utils.db_queries import load_slot_index
+from utils.slot_index import slot_index
+from utils.utils import get_current_datetime
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture
+async def engine(tmp_path):
+    """Движок бота на пустой временной базе с актуальной схемой; кэши и индекс слотов очищены."""
+    engine = init_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+    await create_db()
+    slot_cache.clear()
+    user_cache.clear()
+    slot_index.synced_id = 0
+    slot_index.load([])
+    yield engine
+    await dispose_engine()
+
+
+@pytest.fixture
+async def session(engine):
+    async with session_maker() as session:
+        yield session
+
+
+@pytest.fixture
+def slot_start():
+    """Начало слотов по умолчанию: завтра, без микросекунд — как после разбора сообщения."""
+    return get_current_datetime().replace(microsecond=0) + timedelta(days=1)
+
+
+@pytest.fixture
+def add_slots(engine):
+    """Функция add_slots(start_time, types): по свободному часовому слоту каждого типа от нового пользователя.
+
+    Возвращает слоты в порядке types с загруженными пользователями и перезагружает индекс слотов.
+    """
+    telegram_ids = count(1)
+
+    async def add_slots(start_time, types):
+        async with session_maker() as session:
+            slots = []
+            for slot_type in types:
+                telegram_id = next(telegram_ids)
+                user = User(telegram_id=telegram_id, telegram_username=f'user{telegram_id}')
+                slots.append(TimeSlot(user=user, type=slot_type, start_time=start_time,
+                                      end_time=start_time + timedelta(hours=1), matched=False, expired=False))
+            session.add_all(slots)
+            await session.commit()
+            await load_slot_index(session)
+        slot_cache.clear()
+        user_cache.clear()
+        return slots
+
+    return add_slots
@@ -0,0 +1,65 @@
+"""Пара запоминается как показанная, только если запросивший её действительно увидел."""
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from benchmarks.fakes import FakeBot, make_context, message_update
+from database.engine import session_maker
+from database.models import MatchCandidate, SlotType
+from handlers import offer_help_handler
+from handlers.ask_help_handler import save_ask_help_time_slots
+from utils.callbacks import MAX_KEYBOARD_BUTTONS
+from utils.notifications import NotificationDispatcher
+from utils.utils import get_current_datetime, get_timezone
+
+pytestmark = pytest.mark.anyio
+
+TELEGRAM_ID = 10_000
+
+
+@pytest.fixture
+def start_time():
+    """Завтра в 10:00 по часовому поясу бота, чтобы часовой слот не переходил через полночь."""
+    tomorrow = get_current_datetime().astimezone(get_timezone()) + timedelta(days=1)
+    return tomorrow.replace(hour=10, minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+async def notifier(monkeypatch):
+    """Свой диспетчер без повторов: очередь общего привязана к циклу событий первого теста."""
+    notifier = NotificationDispatcher(chat_interval=0, max_attempts=1)
+    monkeypatch.setattr(offer_help_handler, 'notifier', notifier)
+    yield notifier
+    await notifier.stop()
+
+
+def slot_message(start_time):
+    return message_update(f'{start_time:%Y-%m-%d %H:%M}-{start_time + timedelta(hours=1):%H:%M}', TELEGRAM_ID,
+                          f'user{TELEGRAM_ID}')
+
+
+async def count_candidates():
+    async with session_maker() as session:
+        return await session.scalar(select(func.count()).select_from(MatchCandidate))
+
+
+async def test_helpers_cut_off_by_keyboard_are_not_recorded(engine, add_slots, start_time):
+    await add_slots(start_time, [SlotType.OFFER] * (MAX_KEYBOARD_BUTTONS + 5))
+    update = slot_message(start_time)
+    await save_ask_help_time_slots(update, make_context(FakeBot()))
+
+    assert len(update.message.replies[-1][1]['reply_markup'].inline_keyboard) == MAX_KEYBOARD_BUTTONS
+    assert await count_candidates() == MAX_KEYBOARD_BUTTONS
+
+
+@pytest.mark.parametrize('flood_rate, recorded', [(0.0, 1), (1.0, 0)], ids=['delivered', 'failed'])
+async def test_offer_is_recorded_only_after_delivery(engine, add_slots, start_time, notifier, flood_rate, recorded):
+    await add_slots(start_time, [SlotType.REQUEST])
+    bot = FakeBot(flood_rate=flood_rate)
+    notifier.start(bot)
+    await offer_help_handler.save_offer_help_time_slots(slot_message(start_time), make_context(bot))
+    await notifier.join()
+
+    assert len(bot.sent) == recorded
+    assert await count_candidates() == recorded
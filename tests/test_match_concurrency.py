@@ -0,0 +1,40 @@
+"""Одновременные подтверждения одного предложения: занять слот должен ровно один запросивший."""
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+import handlers.ask_help_handler  # noqa: F401 регистрирует обработчики кнопок
+from benchmarks.fakes import FakeBot, callback_update, make_context
+from database.engine import session_maker
+from database.models import SlotType, TimeSlot
+from utils.callbacks import CallbackAction, callback_router, encode_callback
+
+pytestmark = pytest.mark.anyio
+
+REQUESTERS = 50
+
+
+async def test_concurrent_choices_match_exactly_one_requester(engine, add_slots, slot_start):
+    offer, *requests = await add_slots(slot_start, [SlotType.OFFER] + [SlotType.REQUEST] * REQUESTERS)
+    bot = FakeBot()
+    updates = [
+        callback_update(encode_callback(CallbackAction.CHOOSE_HELPER, offer.id, request.id), request.user.telegram_id,
+                        request.user.telegram_username)
+        for request in requests
+    ]
+    await asyncio.gather(*(callback_router.dispatch(update, make_context(bot)) for update in updates))
+
+    winners = [update for update in updates if update.callback_query.edits[-1][0].startswith('Вы выбрали')]
+    async with session_maker() as session:
+        matched = (await session.execute(select(TimeSlot).filter(TimeSlot.matched == True))).scalars().all()
+    offers = [slot for slot in matched if slot.type == SlotType.OFFER]
+    matched_requests = [slot for slot in matched if slot.type == SlotType.REQUEST]
+
+    assert len(winners) == 1
+    assert [slot.id for slot in offers] == [offer.id]
+    assert len(matched_requests) == 1
+    assert offers[0].matched_user_id == matched_requests[0].user_id
+    assert matched_requests[0].matched_user_id == offer.user_id
+    telegram_ids = {request.user_id: request.user.telegram_id for request in requests}
+    assert telegram_ids[matched_requests[0].user_id] == winners[0].callback_query.from_user.id
@@ -0,0 +1,39 @@
+"""Число SQL-запросов при подборе пар не растёт вместе с числом найденных слотов."""
+from datetime import timedelta
+
+import pytest
+
+from database.engine import session_maker
+from database.instrumentation import count_queries
+from database.models import SlotType
+from utils import db_queries
+from utils.cache import slot_cache, user_cache
+
+pytestmark = pytest.mark.anyio
+
+MATCH_QUERIES = [
+    ('get_slots_by_ids', lambda session, request, offers: db_queries.get_slots_by_ids(
+        session, [offer.id for offer in offers])),
+    ('find_new_candidates', lambda session, request, offers: db_queries.find_new_candidates(
+        session, SlotType.OFFER, [request])),
+    ('get_request_slot_with_users', lambda session, request, offers: db_queries.get_request_slot_with_users(
+        session, request.id)),
+]
+
+
+@pytest.mark.parametrize('name, run_query', MATCH_QUERIES, ids=[query[0] for query in MATCH_QUERIES])
+async def test_statement_count_does_not_depend_on_matches(engine, add_slots, slot_start, name, run_query):
+    counts = []
+    # Запросы на разное время, чтобы предложения одного не подходили к другому.
+    for day, matches in enumerate((1, 50)):
+        types = [SlotType.REQUEST] + [SlotType.OFFER] * matches
+        request, *offers = await add_slots(slot_start + timedelta(days=day), types)
+        slot_cache.clear()
+        user_cache.clear()
+        with count_queries(engine) as counter:
+            async with session_maker() as session:
+                result = await run_query(session, request, offers)
+        if name == 'find_new_candidates':
+            assert len(result[request.id]) == matches
+        counts.append(counter.count)
+    assert counts[0] == counts[1]
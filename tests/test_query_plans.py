@@ -0,0 +1,83 @@
+"""Горячие запросы бота используют индексы, а не полный просмотр таблиц."""
+from datetime import timedelta
+
+import pytest
+
+from database.engine import session_maker
+from database.instrumentation import count_queries
+from database.models import FollowUp, PersistenceEntry, SlotType, TimeSlot
+from utils import db_queries
+from utils.cache import slot_cache, user_cache
+from utils.utils import get_current_datetime
+
+pytestmark = pytest.mark.anyio
+
+# Каждый запрос функции должен использовать хотя бы один из перечисленных индексов.
+HOT_QUERIES = [
+    ('get_or_create_user', lambda session, slot, offer: db_queries.get_or_create_user(
+        session, slot.user.telegram_id, slot.user.telegram_username), ('sqlite_autoindex_user_1',)),
+    ('get_slots_by_ids', lambda session, slot, offer: db_queries.get_slots_by_ids(session, [slot.id]),
+     ('PRIMARY KEY',)),
+    ('get_request_slot_with_users', lambda session, slot, offer: db_queries.get_request_slot_with_users(
+        session, slot.id), ('PRIMARY KEY',)),
+    ('load_slot_index', lambda session, slot, offer: db_queries.load_slot_index(session), ('ix_time_slot_open',)),
+    ('sync_slot_index', lambda session, slot, offer: db_queries.sync_slot_index(session), ('PRIMARY KEY',)),
+    ('expire_time_slots', lambda session, slot, offer: db_queries.expire_time_slots(session, get_current_datetime()),
+     ('ix_time_slot_open',)),
+    ('find_new_candidates', lambda session, slot, offer: db_queries.find_new_candidates(
+        session, SlotType.OFFER, [slot]), ('PRIMARY KEY',)),
+    ('find_new_candidates_for_offer', lambda session, slot, offer: db_queries.find_new_candidates(
+        session, SlotType.REQUEST, [offer]), ('PRIMARY KEY', 'sqlite_autoindex_match_candidate_1')),
+    ('record_match_candidates', lambda session, slot, offer: db_queries.record_match_candidates(
+        session, [(slot, offer)]), ()),
+    ('archive_time_slots', lambda session, slot, offer: db_queries.archive_time_slots(
+        session, get_current_datetime(), 100),
+     ('ix_time_slot_end_time', 'ix_follow_up_request_slot_id', 'PRIMARY KEY', 'ix_match_candidate_offer',
+      'sqlite_autoindex_match_candidate_1')),
+    ('claim_due_follow_ups', lambda session, slot, offer: db_queries.claim_due_follow_ups(
+        session, get_current_datetime(), 100, timedelta(minutes=5)), ('ix_follow_up_run_at', 'PRIMARY KEY')),
+    ('get_persistence_entries', lambda session, slot, offer: db_queries.get_persistence_entries(
+        session, chat_id=slot.user.telegram_id), ('ix_persistence_entry_chat_id',)),
+]
+
+
+@pytest.fixture
+async def open_slots(add_slots, slot_start, session):
+    """Запрос с подходящим предложением, плюс строки, без которых часть запросов не дойдёт до базы."""
+    request, offer = await add_slots(slot_start, [SlotType.REQUEST, SlotType.OFFER])
+    now = get_current_datetime()
+    session.add_all([
+        # Совпавший слот, который уже можно перенести в архив.
+        TimeSlot(user_id=request.user_id, type=SlotType.REQUEST, start_time=now - timedelta(hours=2),
+                 end_time=now - timedelta(hours=1), matched=True, matched_user_id=offer.user_id, expired=False),
+        FollowUp(requester_id=request.user_id, helper_id=offer.user_id, request_slot_id=request.id,
+                 run_at=now - timedelta(minutes=1)),
+        PersistenceEntry(kind='chat_data', key=str(request.user.telegram_id), chat_id=request.user.telegram_id,
+                         data='{}'),
+    ])
+    await session.commit()
+    return request, offer
+
+
+async def explain(conn, statement, parameters):
+    result = await conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+    return [row[-1] for row in result]
+
+
+@pytest.mark.parametrize('name, run_query, expected_indexes', HOT_QUERIES, ids=[query[0] for query in HOT_QUERIES])
+async def test_hot_query_uses_index(engine, open_slots, name, run_query, expected_indexes):
+    slot_cache.clear()
+    user_cache.clear()
+    with count_queries(engine) as counter:
+        async with session_maker() as session:
+            await run_query(session, *open_slots)
+    assert counter.statements, f'{name} не обратился к базе'
+
+    async with engine.connect() as conn:
+        for statement, parameters in counter.statements:
+            plan = await explain(conn, statement, parameters)
+            if not plan and not statement.lstrip().upper().startswith('SELECT'):
+                # Вставка по VALUES не читает таблицу, и план у неё пустой.
+                continue
+            assert any(index in line for index in expected_indexes for line in plan), (statement, plan)
+            assert not [line for line in plan if line.startswith('SCAN') and 'USING' not in line], (statement, plan)
@@ -0,0 +1,133 @@
+import random
+import re
+from datetime import datetime, timezone
+
+import pytest
+
+from utils.utils import TimeSlotError, TimeSlotErrorReason, get_timezone, parse_time_range, parse_time_slots
+
+# Четверг.
+NOW = datetime(2030, 6, 20, 8, 0)
+MOSCOW = get_timezone('UTC+03:00')
+EXTENDED_FORMAT = re.compile(
+    r'(?:\d{4}-\d{2}-\d{2}|завтра|tomorrow|сегодня)\s*\d{1,2}:\d{2}\s*[-–—]\s*\d{1,2}:\d{2}'
+)
+
+
+def legacy_parse(time_slot):
+    """Разбор до parse_time_range: только `YYYY-MM-DD HH:MM-HH:MM`, иначе None."""
+    pattern = re.compile(r'^\d{4}-\d{2}-\d{2} ([01]\d|2[0-3]):([0-5]\d)-([01]\d|2[0-3]):([0-5]\d)$')
+    match = pattern.match(time_slot)
+    if not match or match.group(1) + match.group(2) >= match.group(3) + match.group(4):
+        return None
+    date_part, times = time_slot.split()
+    start_time_str, end_time_str = times.split('-')
+    try:
+        return (datetime.strptime(f'{date_part} {start_time_str}', '%Y-%m-%d %H:%M'),
+                datetime.strptime(f'{date_part} {end_time_str}', '%Y-%m-%d %H:%M'))
+    except ValueError:
+        return None
+
+
+def random_case(rng):
+    if rng.random() < 0.5:
+        start = rng.randint(0, 22)
+        return (f'{rng.randint(2020, 2035)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} '
+                f'{start:02d}:{rng.randint(0, 59):02d}-{rng.randint(start, 23):02d}:{rng.randint(0, 59):02d}')
+    date = rng.choice([
+        f'{rng.randint(2020, 2035)}-{rng.randint(1, 12):02d}-{rng.randint(1, 31):02d}',
+        f'{rng.randint(2020, 2035)}-{rng.randint(0, 19):02d}-{rng.randint(0, 39):02d}',
+        f'{rng.randint(2020, 2035)}-{rng.randint(1, 12)}-{rng.randint(1, 28)}',
+        'завтра', 'tomorrow',
+    ])
+
+    def clock():
+        hour, minute = rng.randint(0, 25), rng.randint(0, 61)
+        return rng.choice([f'{hour:02d}:{minute:02d}', f'{hour}:{minute:02d}', f'{hour:02d}{minute:02d}'])
+
+    separator = rng.choice(['-', '-', '-', '–', '—', ' - ', '/'])
+    return f'{date}{rng.choice([" ", " ", "  ", ""])}{clock()}{separator}{clock()}'
+
+
+def parse(text):
+    try:
+        return parse_time_range(text, NOW)
+    except TimeSlotError:
+        return None
+
+
+def test_matches_legacy_parser_on_random_input():
+    rng = random.Random(1)
+    for _ in range(20000):
+        text = random_case(rng)
+        expected, actual = legacy_parse(text), parse(text)
+        if expected is not None:
+            assert actual == expected, text
+        elif actual is not None:
+            assert EXTENDED_FORMAT.fullmatch(text), text
+
+
+def test_range_crossing_midnight_is_rejected():
+    with pytest.raises(TimeSlotError) as error:
+        parse_time_range('2030-06-21 23:00-01:00')
+    assert error.value.reason == TimeSlotErrorReason.ORDER
+
+
+def test_range_ending_at_midnight_is_rejected():
+    with pytest.raises(TimeSlotError) as error:
+        parse_time_range('2030-06-21 23:00-00:00')
+    assert error.value.reason == TimeSlotErrorReason.ORDER
+
+
+def test_local_time_after_midnight_falls_on_previous_utc_day():
+    assert parse_time_slots('2030-06-21 01:00-02:30', MOSCOW, NOW.replace(tzinfo=timezone.utc)) == [
+        (datetime(2030, 6, 20, 22, 0, tzinfo=timezone.utc), datetime(2030, 6, 20, 23, 30, tzinfo=timezone.utc)),
+    ]
+
+
+def test_relative_day_after_midnight_in_local_timezone():
+    # 22:30 UTC — уже пятница по Москве, поэтому «завтра» — суббота.
+    now = datetime(2030, 6, 20, 22, 30, tzinfo=timezone.utc)
+    assert parse_time_slots('завтра 10:00-11:00', MOSCOW, now) == [
+        (datetime(2030, 6, 22, 7, 0, tzinfo=timezone.utc), datetime(2030, 6, 22, 8, 0, tzinfo=timezone.utc)),
+    ]
+
+
+def days(slots):
+    return [start_time.astimezone(MOSCOW).strftime('%a %d') for start_time, _ in slots]
+
+
+def test_day_range():
+    assert days(parse_time_slots('Пн-Пт 09:00-12:00', MOSCOW, NOW.replace(tzinfo=MOSCOW))) == [
+        'Thu 20', 'Fri 21', 'Mon 24', 'Tue 25', 'Wed 26',
+    ]
+
+
+def test_day_range_wraps_over_week_end():
+    assert days(parse_time_slots('сб-пн 09:00-12:00', MOSCOW, NOW.replace(tzinfo=MOSCOW))) == [
+        'Sat 22', 'Sun 23', 'Mon 24',
+    ]
+
+
+def test_day_list_for_several_weeks():
+    assert days(parse_time_slots('mon, wed 09:00-12:00 for 2 weeks', MOSCOW, NOW.replace(tzinfo=MOSCOW))) == [
+        'Mon 24', 'Wed 26', 'Mon 01', 'Wed 03',
+    ]
+
+
+def test_unknown_weekday():
+    with pytest.raises(TimeSlotError) as error:
+        parse_time_slots('пн-хх 09:00-12:00', MOSCOW, NOW.replace(tzinfo=MOSCOW))
+    assert error.value.reason == TimeSlotErrorReason.WEEKDAY
+
+
+@pytest.mark.parametrize('dash', ['-', '–', '—'])
+def test_dashes_in_time_range(dash):
+    assert parse_time_range(f'2030-06-21 09:00 {dash} 12:00') == (datetime(2030, 6, 21, 9), datetime(2030, 6, 21, 12))
+
+
+@pytest.mark.parametrize('dash', ['-', '–', '—'])
+def test_dashes_in_day_range(dash):
+    assert days(parse_time_slots(f'пн{dash}ср 09:00{dash}12:00', MOSCOW, NOW.replace(tzinfo=MOSCOW))) == [
+        'Mon 24', 'Tue 25', 'Wed 26',
+    ]
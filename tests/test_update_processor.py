@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from telegram import Update
+
+from benchmarks.fakes import update_payload
+from utils.update_processor import BoundedUpdateQueue, ChatOrderedUpdateProcessor
+
+pytestmark = pytest.mark.anyio
+
+
+def make_update(update_id, chat_id):
+    return Update.de_json(update_payload(update_id, chat_id, 'text'), None)
+
+
+async def fetch_updates(update_queue, processor, handle, tasks):
+    """Как Application._update_fetcher при max_concurrent_updates > 1: каждое обновление — отдельная задача."""
+    while True:
+        update = await update_queue.get()
+        tasks.append(asyncio.create_task(processor.process_update(update, handle(update))))
+
+
+async def test_put_waits_while_queue_limit_is_in_flight():
+    update_queue = BoundedUpdateQueue(10)
+    processor = ChatOrderedUpdateProcessor(4, update_queue)
+    gate = asyncio.Event()
+    tasks = []
+
+    async def handle(update):
+        await gate.wait()
+
+    fetcher = asyncio.create_task(fetch_updates(update_queue, processor, handle, tasks))
+
+    async def produce():
+        for update_id in range(200):
+            await update_queue.put(make_update(update_id, update_id))
+
+    producer = asyncio.create_task(produce())
+    await asyncio.sleep(0.05)
+    assert not producer.done()
+    assert update_queue.in_flight() == 10
+    assert len(tasks) == 10
+
+    gate.set()
+    await asyncio.wait_for(producer, 5)
+    await asyncio.gather(*tasks)
+    fetcher.cancel()
+    assert update_queue.in_flight() == 0
+    assert len(tasks) == 200
+
+
+async def test_busy_chat_does_not_block_other_chats():
+    update_queue = BoundedUpdateQueue(100)
+    processor = ChatOrderedUpdateProcessor(4, update_queue)
+    gate = asyncio.Event()
+    handled = []
+
+    async def handle(update):
+        if update.effective_chat.id == 1:
+            await gate.wait()
+        handled.append(update.update_id)
+
+    busy = [asyncio.create_task(processor.process_update(update, handle(update)))
+            for update in (make_update(update_id, 1) for update_id in range(20))]
+    await asyncio.sleep(0.01)
+    others = [processor.process_update(update, handle(update))
+              for update in (make_update(update_id, update_id) for update_id in range(100, 105))]
+    await asyncio.wait_for(asyncio.gather(*others), 1)
+    assert handled == list(range(100, 105))
+
+    gate.set()
+    await asyncio.gather(*busy)
+
+
+async def test_chat_order_holds_when_waiting_update_is_cancelled():
+    update_queue = BoundedUpdateQueue(100)
+    processor = ChatOrderedUpdateProcessor(4, update_queue)
+    gate = asyncio.Event()
+    handled = []
+
+    async def handle(update):
+        if update.update_id == 0:
+            await gate.wait()
+        handled.append(update.update_id)
+
+    tasks = [asyncio.create_task(processor.process_update(update, handle(update)))
+             for update in (make_update(update_id, 1) for update_id in range(10))]
+    await asyncio.sleep(0.01)
+    tasks[5].cancel()
+    gate.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    assert handled == [0, 1, 2, 3, 4, 6, 7, 8, 9]
+    assert processor._tails == {}
+
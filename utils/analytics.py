@@ -0,0 +1,124 @@
+import csv
+import io
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from database.models import SlotType
+from utils.cache import TTLCache
+from utils.config import ANALYTICS_CACHE_TTL, EXPORT_BATCH_SIZE, EXPORT_PART_MB
+from utils.db_queries import (get_confirmation_stats, get_failed_confirmations, get_helper_utilization,
+                              get_slot_totals, get_unmatched_requests_by_hour, stream_slots_for_export)
+from utils.utils import format_datetime, get_current_datetime, get_timezone
+
+TOP_HELPERS = 10
+LATEST_FAILURES = 10
+EXPORT_HEADER = ['id', 'type', 'start_time', 'end_time', 'user_id', 'matched', 'matched_user_id', 'expired',
+                 'archived', 'telegram_username']
+
+report_cache = TTLCache('analytics', 16, ANALYTICS_CACHE_TTL)
+
+
+def _share(part, total):
+    return f'{part / total:.0%}' if total else '—'
+
+
+def _hours(seconds):
+    return f'{seconds / 3600:.1f} ч'
+
+
+async def build_report(session, days, now=None):
+    """Текстовый отчёт за последние days дней. Повторные вызовы в течение ANALYTICS_CACHE_TTL берутся из кэша."""
+    report = report_cache.get(days)
+    if report is not None:
+        return report
+
+    now = now or get_current_datetime()
+    tz = get_timezone()
+    until_hour = int(now.timestamp()) // 3600 + 1
+    since_hour = until_hour - days * 24
+    since = now - timedelta(days=days)
+
+    totals = await get_slot_totals(session, since_hour, until_hour)
+    requests, matched_requests, _, _ = totals.get(SlotType.REQUEST, (0, 0, 0, 0))
+    offers, matched_offers, offered_seconds, booked_seconds = totals.get(SlotType.OFFER, (0, 0, 0, 0))
+    lines = [
+        f'Аналитика за {days} дн. (часы — {tz.tzname(now)})',
+        '',
+        f'Запросов: {requests}, нашли помощника: {matched_requests} ({_share(matched_requests, requests)})',
+        f'Предложений: {offers}, совпали: {matched_offers} ({_share(matched_offers, offers)})',
+    ]
+
+    unmatched = Counter()
+    for hour, count in await get_unmatched_requests_by_hour(session, since_hour, until_hour):
+        unmatched[datetime.fromtimestamp(hour * 3600, timezone.utc).astimezone(tz).hour] += count
+    lines += ['', 'Запросы без помощника по часу начала:']
+    lines += [f'  {hour:02d}:00 — {count}' for hour, count in sorted(unmatched.items()) if count] or ['  нет']
+
+    lines += [
+        '',
+        f'Загрузка помощников: занято {_hours(booked_seconds)} из {_hours(offered_seconds)} '
+        f'({_share(booked_seconds, offered_seconds)})',
+    ]
+    for username, offered, booked in await get_helper_utilization(session, since_hour, until_hour, TOP_HELPERS):
+        lines.append(f'  @{username or "?"}: {_hours(booked)} из {_hours(offered)} ({_share(booked, offered)})')
+
+    total, failed = await get_confirmation_stats(session, since)
+    lines += ['', f'Ответов о встрече: {total}, «Нет»: {failed} ({_share(failed, total)})']
+    for created, request_slot_id, username in await get_failed_confirmations(session, since, LATEST_FAILURES):
+        lines.append(f'  {format_datetime(created, tz)} @{username}, запрос {request_slot_id}')
+
+    report = '\n'.join(lines)
+    report_cache.set(days, report)
+    return report
+
+
+def _export_row(row):
+    (slot_id, slot_type, start_time, end_time, user_id, matched, matched_user_id, expired, archived,
+     username) = row
+    return [slot_id, slot_type.value, start_time.isoformat(), end_time.isoformat(), user_id, int(matched),
+            matched_user_id or '', int(expired), int(archived), username or '']
+
+
+async def export_slots_csv(session, send_part, batch_size=EXPORT_BATCH_SIZE, part_size=int(EXPORT_PART_MB * 2 ** 20)):
+    """Выгружает все слоты в CSV и передаёт его частями send_part(file, number).
+
+    Строки пишутся во временный файл порциями по batch_size; как только файл превышает part_size байт,
+    он отправляется и удаляется, поэтому ни выборка, ни CSV целиком в памяти не держатся.
+    Возвращает (число строк, число частей).
+    """
+    rows = parts = 0
+    part = None
+    async for batch in stream_slots_for_export(session, batch_size):
+        if part is None:
+            part, writer = _new_part()
+        writer.writerows(_export_row(row) for row in batch)
+        rows += len(batch)
+        part.flush()
+        if part.buffer.tell() >= part_size:
+            parts += 1
+            await _send_part(part, send_part, parts)
+            part = None
+    if part is not None or not parts:
+        if part is None:
+            part, _ = _new_part()
+        parts += 1
+        await _send_part(part, send_part, parts)
+    return rows, parts
+
+
+def _new_part():
+    part = io.TextIOWrapper(tempfile.TemporaryFile(), encoding='utf-8', newline='')
+    writer = csv.writer(part)
+    writer.writerow(EXPORT_HEADER)
+    return part, writer
+
+
+async def _send_part(part, send_part, number):
+    part.flush()
+    binary = part.detach()
+    try:
+        binary.seek(0)
+        await send_part(binary, number)
+    finally:
+        binary.close()
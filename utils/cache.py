@@ -0,0 +1,100 @@
+import time
+from collections import OrderedDict, namedtuple
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from database.models import SlotType
+from utils.config import CACHE_TTL, SLOT_CACHE_SIZE, USER_CACHE_SIZE
+from utils.metrics import metrics
+
+CachedUser = namedtuple('CachedUser', ['id', 'telegram_id', 'telegram_username', 'timezone'])
+
+
+@dataclass(frozen=True)
+class CachedSlot:
+    id: int
+    type: SlotType
+    user_id: int
+    start_time: datetime
+    end_time: datetime
+    matched: bool
+    matched_user_id: Optional[int]
+    user: CachedUser
+    matched_user: Optional[CachedUser]
+
+    @classmethod
+    def from_model(cls, slot):
+        return cls(
+            id=slot.id,
+            type=slot.type,
+            user_id=slot.user_id,
+            start_time=slot.start_time,
+            end_time=slot.end_time,
+            matched=slot.matched,
+            matched_user_id=slot.matched_user_id,
+            user=_cached_user(slot.user),
+            matched_user=_cached_user(slot.matched_user),
+        )
+
+
+def _cached_user(user):
+    if user is None:
+        return None
+    return CachedUser(user.id, user.telegram_id, user.telegram_username, user.timezone)
+
+
+class TTLCache:
+    """Ограниченный LRU-кэш, записи которого живут не дольше ttl секунд."""
+
+    def __init__(self, name, maxsize, ttl, clock=time.monotonic):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > self.clock():
+            self._data.move_to_end(key)
+            self._count(hit=True)
+            return entry[1]
+        if entry is not None:
+            del self._data[key]
+        self._count(hit=False)
+        return None
+
+    def set(self, key, value):
+        self._data[key] = (self.clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, *keys):
+        for key in keys:
+            self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def _count(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        metrics.increment('cache_requests', cache=self.name, result='hit' if hit else 'miss')
+
+
+user_cache = TTLCache('user', USER_CACHE_SIZE, CACHE_TTL)
+slot_cache = TTLCache('slot', SLOT_CACHE_SIZE, CACHE_TTL)
@@ -0,0 +1,108 @@
+import base64
+import enum
+import hashlib
+import hmac
+import logging
+
+from utils.config import CALLBACK_SECRET
+
+logger = logging.getLogger(__name__)
+
+CALLBACK_VERSION = 1
+SIGNATURE_SIZE = 8
+MAX_CALLBACK_DATA_SIZE = 64
+MAX_KEYBOARD_BUTTONS = 50
+
+
+class CallbackAction(enum.IntEnum):
+    CHOOSE_HELPER = 1
+    CONFIRM_MEETING = 2
+
+
+class InvalidCallbackData(ValueError):
+    pass
+
+
+def _sign(payload):
+    return hmac.new(CALLBACK_SECRET.encode(), payload, hashlib.sha256).digest()[:SIGNATURE_SIZE]
+
+
+def _encode_varint(value):
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def _decode_varints(data):
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    if shift:
+        raise InvalidCallbackData('Обрезанное значение')
+    return values
+
+
+def encode_callback(action, *ids):
+    """Упаковывает действие и id в подписанную строку для callback_data."""
+    payload = bytes([CALLBACK_VERSION, action]) + b''.join(_encode_varint(value) for value in ids)
+    data = base64.urlsafe_b64encode(payload + _sign(payload)).rstrip(b'=').decode()
+    if len(data) > MAX_CALLBACK_DATA_SIZE:
+        raise ValueError(f'callback_data длиннее {MAX_CALLBACK_DATA_SIZE} байт')
+    return data
+
+
+def decode_callback(data):
+    """Возвращает (действие, id) или бросает InvalidCallbackData для чужих и повреждённых данных."""
+    try:
+        raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+    except (ValueError, TypeError) as error:
+        raise InvalidCallbackData('Не base64') from error
+    payload, signature = raw[:-SIGNATURE_SIZE], raw[-SIGNATURE_SIZE:]
+    if len(payload) < 2 or not hmac.compare_digest(signature, _sign(payload)):
+        raise InvalidCallbackData('Неверная подпись')
+    if payload[0] != CALLBACK_VERSION:
+        raise InvalidCallbackData(f'Неизвестная версия {payload[0]}')
+    try:
+        action = CallbackAction(payload[1])
+    except ValueError as error:
+        raise InvalidCallbackData(f'Неизвестное действие {payload[1]}') from error
+    return action, _decode_varints(payload[2:])
+
+
+class CallbackRouter:
+    """Направляет нажатия inline-кнопок в обработчики, зарегистрированные по действию."""
+
+    def __init__(self):
+        self._handlers = {}
+
+    def register(self, action):
+        def decorator(func):
+            self._handlers[action] = func
+            return func
+        return decorator
+
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        try:
+            action, ids = decode_callback(query.data)
+            handler = self._handlers[action]
+        except (InvalidCallbackData, KeyError) as error:
+            logger.warning('Rejected callback %r: %s', query.data, error)
+            await query.answer('Эта кнопка устарела.')
+            return
+        return await handler(update, context, *ids)
+
+
+callback_router = CallbackRouter()
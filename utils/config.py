@@ -1,7 +1,49 @@
 import os
+import socket
+import uuid
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
+BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_TELEGRAM_ID = os.getenv('ADMIN_TELEGRAM_ID')
+# Раньше время хранилось как локальное время хоста плюс TIMEZONE_OFFSET часов. Это смещение
+# используется миграцией в UTC и как часовой пояс по умолчанию, если DEFAULT_TIMEZONE не задан.
+TIMEZONE_OFFSET = int(os.getenv('TIMEZONE_OFFSET', 0))
+DEFAULT_TIMEZONE = os.getenv('DEFAULT_TIMEZONE')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+DATABASE_PATH = os.getenv('DATABASE_PATH')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+DB_GROUP_COMMIT_MS = float(os.getenv('DB_GROUP_COMMIT_MS', 0))
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 1000))
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', 64))
+CALLBACK_SECRET = os.getenv('CALLBACK_SECRET') or BOT_TOKEN or ''
+MAINTENANCE_INTERVAL = int(os.getenv('MAINTENANCE_INTERVAL', 600))
+SLOT_RETENTION_DAYS = int(os.getenv('SLOT_RETENTION_DAYS', 30))
+COMPACTION_HOUR = int(os.getenv('COMPACTION_HOUR', 4))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+SLOT_CACHE_SIZE = int(os.getenv('SLOT_CACHE_SIZE', 10000))
+CACHE_TTL = float(os.getenv('CACHE_TTL', 300))
+ANALYTICS_CACHE_TTL = float(os.getenv('ANALYTICS_CACHE_TTL', 60))
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+EXPORT_PART_MB = float(os.getenv('EXPORT_PART_MB', 20))
+RATE_LIMIT_PER_MINUTE = float(os.getenv('RATE_LIMIT_PER_MINUTE', 20))
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', 5))
+RATE_LIMIT_USERS = int(os.getenv('RATE_LIMIT_USERS', 100000))
+MAX_OPEN_SLOTS = int(os.getenv('MAX_OPEN_SLOTS', 100))
+SHARED_STATE = os.getenv('SHARED_STATE', '').lower() in ('1', 'true', 'yes')
+INSTANCE_ID = os.getenv('INSTANCE_ID') or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+LEASE_TTL = float(os.getenv('LEASE_TTL', 30))
+PERSISTENCE_INTERVAL = float(os.getenv('PERSISTENCE_INTERVAL', 10))
+SLOT_INDEX_RESYNC_INTERVAL = float(os.getenv('SLOT_INDEX_RESYNC_INTERVAL', 60))
@@ -1,46 +1,529 @@
-from sqlalchemy import select
+import time
+from datetime import datetime, timezone
+from functools import partial
 
-from database.models import User, TimeSlot, SlotType
+from sqlalchemy import BigInteger, case, delete, func, insert, literal, select, type_coerce, union_all, update
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import joinedload
 
+from database.group_commit import writer
+from database.models import (FollowUp, Lease, MatchCandidate, MeetingConfirmation, PersistenceEntry, SlotStats, User,
+                             TimeSlot, TimeSlotArchive, SlotType, UTCEpoch)
+from utils.cache import CachedSlot, CachedUser, slot_cache, user_cache
+from utils.config import SHARED_STATE, SLOT_INDEX_RESYNC_INTERVAL
+from utils.matcher import matcher
+from utils.metrics import SIZE_BUCKETS, metrics
+from utils.slot_index import slot_index
+from utils.utils import get_current_datetime
 
-async def save_time_slot(session, user, start_time, end_time, slot_type):
-    time_slot = TimeSlot(start_time=start_time, end_time=end_time, type=slot_type, user=user)
-    session.add(time_slot)
-    await session.commit()
-    await session.refresh(time_slot)
-    return time_slot
+
+def dialect_insert(session, model):
+    """INSERT с поддержкой ON CONFLICT для диалекта текущей базы."""
+    if session.bind.dialect.name == 'postgresql':
+        # Диалект PostgreSQL импортируется, только если он нужен: это заметная часть времени запуска.
+        from sqlalchemy.dialects import postgresql
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def insert_ignore(session, model):
+    """INSERT, который молча пропускает строки, нарушающие ограничение уникальности."""
+    return dialect_insert(session, model).on_conflict_do_nothing()
+
+
+async def insert_time_slots(session, user_id, intervals, slot_type):
+    result = await session.scalars(
+        insert(TimeSlot).returning(TimeSlot),
+        [
+            {'start_time': start_time, 'end_time': end_time, 'type': slot_type, 'user_id': user_id}
+            for start_time, end_time in intervals
+        ],
+    )
+    return result.all()
+
+
+async def save_time_slots(session, user, intervals, slot_type):
+    """Сохраняет несколько слотов пользователя одной транзакцией."""
+    time_slots = await writer.run(session, partial(
+        insert_time_slots, user_id=user.id, intervals=intervals, slot_type=slot_type
+    ))
+    owner = CachedUser(user.id, user.telegram_id, user.telegram_username, user.timezone)
+    for time_slot in time_slots:
+        slot_index.add(time_slot)
+        slot_cache.set(time_slot.id, CachedSlot(
+            id=time_slot.id, type=time_slot.type, user_id=time_slot.user_id, start_time=time_slot.start_time,
+            end_time=time_slot.end_time, matched=False, matched_user_id=None, user=owner, matched_user=None,
+        ))
+    return time_slots
+
+
+async def upsert_user(session, telegram_id, telegram_username):
+    now = get_current_datetime()
+    result = await session.execute(
+        dialect_insert(session, User)
+        .values(telegram_id=telegram_id, telegram_username=telegram_username, created=now, updated=now)
+        .on_conflict_do_update(
+            index_elements=[User.telegram_id],
+            set_={'telegram_username': telegram_username, 'updated': now},
+        )
+        .returning(User.id, User.telegram_id, User.telegram_username, User.timezone)
+    )
+    return CachedUser(*result.one())
 
 
 async def get_or_create_user(session, telegram_id, telegram_username):
-    result = await session.execute(select(User).filter_by(telegram_id=telegram_id))
-    user = result.scalars().first()
-    if not user:
-        user = User(telegram_id=telegram_id, telegram_username=telegram_username)
-        session.add(user)
-        await session.commit()
-        await session.refresh(user)
+    """Пользователь по telegram_id: из кэша, SELECT'ом или атомарным upsert'ом, если его нет или сменился ник."""
+    user = user_cache.get(telegram_id)
+    if user is None:
+        result = await session.execute(
+            select(User.id, User.telegram_id, User.telegram_username, User.timezone).filter_by(telegram_id=telegram_id)
+        )
+        row = result.first()
+        user = CachedUser(*row) if row else None
+    if user is None or user.telegram_username != telegram_username:
+        if user is not None:
+            slot_cache.clear()
+        user = await writer.run(session, partial(
+            upsert_user, telegram_id=telegram_id, telegram_username=telegram_username
+        ))
+    user_cache.set(telegram_id, user)
+    return user
+
+
+async def update_user_timezone(session, user_id, timezone):
+    result = await session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(timezone=timezone, updated=get_current_datetime())
+        .returning(User.id, User.telegram_id, User.telegram_username, User.timezone)
+    )
+    return CachedUser(*result.one())
+
+
+async def set_user_timezone(session, user, timezone):
+    """Сохраняет часовой пояс пользователя. Слоты в кэше хранят пользователя, поэтому кэш слотов сбрасывается."""
+    user = await writer.run(session, partial(update_user_timezone, user_id=user.id, timezone=timezone))
+    user_cache.set(user.telegram_id, user)
+    slot_cache.clear()
     return user
 
 
-async def find_matching_offers(session, start_time, end_time):
-    offers = await session.execute(
-        select(TimeSlot).filter(
-            TimeSlot.start_time <= end_time,
-            TimeSlot.end_time >= start_time,
-            TimeSlot.type == SlotType.OFFER,
-            TimeSlot.matched == False,
+async def get_request_slot_with_users(session, slot_id):
+    slots = await get_slots_by_ids(session, [slot_id])
+    if slots and slots[0].type == SlotType.REQUEST:
+        return slots[0]
+    return None
+
+
+async def load_slot_index(session):
+    """Заполняет индекс свободных слотов из базы данных."""
+    result = await session.execute(
+        select(TimeSlot.id, TimeSlot.type, TimeSlot.user_id, TimeSlot.start_time, TimeSlot.end_time)
+        .filter(TimeSlot.matched == False, TimeSlot.expired == False, TimeSlot.end_time > get_current_datetime())
+    )
+    slot_index.load(result)
+
+
+async def sync_slot_index(session):
+    """Догружает в индекс слоты, сохранённые другими процессами бота.
+
+    Раз в SLOT_INDEX_RESYNC_INTERVAL секунд индекс перечитывается целиком, чтобы убрать слоты,
+    занятые в других процессах, а кэш слотов сбрасывается.
+    """
+    if slot_index.loaded_at is None or time.monotonic() - slot_index.loaded_at > SLOT_INDEX_RESYNC_INTERVAL:
+        await load_slot_index(session)
+        slot_cache.clear()
+        return
+    result = await session.execute(
+        select(TimeSlot.id, TimeSlot.type, TimeSlot.user_id, TimeSlot.start_time, TimeSlot.end_time,
+               TimeSlot.matched, TimeSlot.expired)
+        .filter(TimeSlot.id > slot_index.synced_id)
+    )
+    now = get_current_datetime()
+    for slot_id, slot_type, user_id, start_time, end_time, matched, expired in result:
+        if not matched and not expired and end_time > now:
+            slot_index.add_entry(slot_id, slot_type, user_id, start_time, end_time)
+        slot_index.synced_id = max(slot_index.synced_id, slot_id)
+
+
+async def get_slots_by_ids(session, slot_ids):
+    """Слоты с пользователями, по возрастанию начала. Сначала берутся из кэша, остальные — одним запросом."""
+    slots = {}
+    missing = []
+    for slot_id in slot_ids:
+        slot = slot_cache.get(slot_id)
+        if slot is None:
+            missing.append(slot_id)
+        else:
+            slots[slot_id] = slot
+    if missing:
+        result = await session.execute(
+            select(TimeSlot)
+            .filter(TimeSlot.id.in_(missing))
+            .options(joinedload(TimeSlot.user), joinedload(TimeSlot.matched_user))
         )
+        for time_slot in result.scalars().all():
+            slot = slots[time_slot.id] = CachedSlot.from_model(time_slot)
+            slot_cache.set(slot.id, slot)
+    return sorted(slots.values(), key=lambda slot: (slot.start_time, slot.id))
+
+
+async def insert_match_candidates(session, rows):
+    await session.execute(insert_ignore(session, MatchCandidate), rows)
+
+
+async def record_match_candidates(session, pairs):
+    """Запоминает пары (запрос, предложение), которые запросивший уже увидел, чтобы не присылать их повторно."""
+    rows = [
+        {
+            'request_slot_id': request_slot.id,
+            'offer_slot_id': offer_slot.id,
+            'helper_id': offer_slot.user_id,
+            'overlap_seconds': int((min(request_slot.end_time, offer_slot.end_time)
+                                    - max(request_slot.start_time, offer_slot.start_time)).total_seconds()),
+        }
+        for request_slot, offer_slot in pairs
+    ]
+    if rows:
+        await writer.run(session, partial(insert_match_candidates, rows=rows))
+
+
+async def get_notified_helpers(session, request_slot_ids):
+    """Пары (id запроса, id помощника), о которых запросившим уже сообщили."""
+    result = await session.execute(
+        select(MatchCandidate.request_slot_id, MatchCandidate.helper_id)
+        .filter(MatchCandidate.request_slot_id.in_(request_slot_ids))
+    )
+    return set(result.all())
+
+
+async def find_new_candidates(session, slot_type, time_slots):
+    """Подбирает пары для только что сохранённых слотов.
+
+    Возвращает словарь {id слота: подходящие слоты типа slot_type по убыванию пересечения}.
+    Помощники, о которых запросившему уже сообщали, в результат не попадают, а от каждого помощника
+    берётся один слот. Показанные пары нужно сохранить через record_match_candidates.
+    """
+    if SHARED_STATE:
+        await sync_slot_index(session)
+    ranked = matcher.candidates(slot_type, time_slots, after=get_current_datetime())
+    slots = {
+        slot.id: slot
+        for slot in await get_slots_by_ids(session, list({slot_id for pairs in ranked.values() for slot_id, _ in pairs}))
+    }
+    # Только что сохранённые запросы ещё ни с кем не сводились, проверять нужно только найденные запросы.
+    seen = set()
+    if slot_type == SlotType.REQUEST and slots:
+        seen = await get_notified_helpers(session, list(slots))
+    matches = {}
+    for time_slot in time_slots:
+        matches[time_slot.id] = []
+        for slot_id, _ in ranked[time_slot.id]:
+            if slot_id not in slots:
+                continue
+            request_slot, offer_slot = (slots[slot_id], time_slot) if slot_type == SlotType.REQUEST \
+                else (time_slot, slots[slot_id])
+            if (request_slot.id, offer_slot.user_id) in seen:
+                continue
+            seen.add((request_slot.id, offer_slot.user_id))
+            matches[time_slot.id].append(slots[slot_id])
+        metrics.observe('match_results', len(matches[time_slot.id]), buckets=SIZE_BUCKETS, slot_type=slot_type.value)
+    return matches
+
+
+async def claim_due_follow_ups(session, now, limit, ttl):
+    """Забирает до limit наступивших напоминаний на время ttl и возвращает (id, request_slot_id).
+
+    Пока аренда не истекла, напоминание больше никто не заберёт. Удаляет его delete_follow_ups после
+    отправки; если этого не случилось, после ttl напоминание заберут снова.
+    """
+    claimable = (FollowUp.claimed_until == None) | (FollowUp.claimed_until <= now)
+    result = await session.execute(
+        select(FollowUp.id)
+        .filter(FollowUp.run_at <= now, claimable)
+        .order_by(FollowUp.run_at)
+        .limit(limit)
+    )
+    follow_up_ids = result.scalars().all()
+    if not follow_up_ids:
+        return []
+    result = await session.execute(
+        update(FollowUp)
+        .filter(FollowUp.id.in_(follow_up_ids), claimable)
+        .values(claimed_until=now + ttl)
+        .returning(FollowUp.id, FollowUp.request_slot_id)
+        .execution_options(synchronize_session=False)
+    )
+    claimed = result.all()
+    await session.commit()
+    return claimed
+
+
+async def delete_follow_ups(session, follow_up_ids):
+    await session.execute(delete(FollowUp).filter(FollowUp.id.in_(follow_up_ids)))
+    await session.commit()
+
+
+async def get_next_follow_up_time(session):
+    """Ближайший момент, когда какое-то напоминание можно будет забрать."""
+    available_at = case((FollowUp.claimed_until > FollowUp.run_at, FollowUp.claimed_until), else_=FollowUp.run_at)
+    result = await session.execute(select(func.min(available_at)))
+    return result.scalar()
+
+
+async def expire_time_slots(session, now):
+    """Помечает истёкшими свободные слоты, которые уже закончились, и убирает их из индекса."""
+    result = await session.execute(
+        update(TimeSlot)
+        .where(TimeSlot.matched == False, TimeSlot.expired == False, TimeSlot.end_time <= now)
+        .values(expired=True)
+        .returning(TimeSlot.id)
+        .execution_options(synchronize_session=False)
     )
-    return offers.scalars().all()
+    slot_ids = result.scalars().all()
+    await session.commit()
+    for slot_id in slot_ids:
+        slot_index.discard(slot_id)
+    slot_cache.invalidate(*slot_ids)
+    return len(slot_ids)
 
 
-async def find_matching_requests(session, start_time, end_time):
-    requests = await session.execute(
-        select(TimeSlot).filter(
-            TimeSlot.start_time <= end_time,
-            TimeSlot.end_time >= start_time,
-            TimeSlot.type == SlotType.REQUEST,
-            TimeSlot.matched == False,
+async def archive_time_slots(session, before, limit):
+    """Переносит в архив до limit совпавших или истёкших слотов, закончившихся раньше before."""
+    pending_follow_up = select(FollowUp.id).filter(FollowUp.request_slot_id == TimeSlot.id).exists()
+    result = await session.execute(
+        select(TimeSlot.id)
+        .filter((TimeSlot.matched == True) | (TimeSlot.expired == True), TimeSlot.end_time < before, ~pending_follow_up)
+        .order_by(TimeSlot.end_time)
+        .limit(limit)
+    )
+    slot_ids = result.scalars().all()
+    if slot_ids:
+        columns = ['id', 'start_time', 'end_time', 'type', 'user_id', 'matched', 'matched_user_id', 'expired',
+                   'created', 'updated']
+        now = get_current_datetime()
+        await session.execute(
+            insert(TimeSlotArchive).from_select(
+                columns + ['archived_at'],
+                select(*(getattr(TimeSlot, column) for column in columns), literal(now, UTCEpoch))
+                .filter(TimeSlot.id.in_(slot_ids)),
+            )
         )
+        await session.execute(add_slot_stats(session, TimeSlot.id.in_(slot_ids), now))
+        await session.execute(delete(MatchCandidate).filter(
+            MatchCandidate.request_slot_id.in_(slot_ids) | MatchCandidate.offer_slot_id.in_(slot_ids)
+        ))
+        await session.execute(delete(TimeSlot).filter(TimeSlot.id.in_(slot_ids)))
+        await session.commit()
+        slot_cache.invalidate(*slot_ids)
+    return len(slot_ids)
+
+
+def epoch_seconds(column):
+    """Колонка UTCEpoch как число секунд — для арифметики в SQL."""
+    return type_coerce(column, BigInteger)
+
+
+def hour_start(hour):
+    return datetime.fromtimestamp(hour * 3600, timezone.utc)
+
+
+def slot_stats_columns(model):
+    """Час начала, тип, пользователь, совпадение и длительность каждого слота model."""
+    duration = epoch_seconds(model.end_time) - epoch_seconds(model.start_time)
+    return (
+        (epoch_seconds(model.start_time) // 3600).label('hour'),
+        model.type.label('type'),
+        model.user_id.label('user_id'),
+        case((model.matched == True, 1), else_=0).label('matched'),
+        duration.label('seconds'),
+        case((model.matched == True, duration), else_=0).label('matched_seconds'),
+    )
+
+
+def add_slot_stats(session, criterion, now):
+    """INSERT ... SELECT, который добавляет в сводку слоты time_slot, отобранные criterion."""
+    hour, slot_type, user_id, matched, seconds, matched_seconds = slot_stats_columns(TimeSlot)
+    statement = dialect_insert(session, SlotStats).from_select(
+        ['hour', 'type', 'user_id', 'slots', 'matched', 'seconds', 'matched_seconds', 'created', 'updated'],
+        select(hour, slot_type, user_id, func.count(), func.sum(matched), func.sum(seconds), func.sum(matched_seconds),
+               literal(now, UTCEpoch), literal(now, UTCEpoch))
+        .filter(criterion)
+        .group_by(hour, slot_type, user_id),
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[SlotStats.hour, SlotStats.type, SlotStats.user_id],
+        set_={
+            'slots': SlotStats.slots + statement.excluded.slots,
+            'matched': SlotStats.matched + statement.excluded.matched,
+            'seconds': SlotStats.seconds + statement.excluded.seconds,
+            'matched_seconds': SlotStats.matched_seconds + statement.excluded.matched_seconds,
+            'updated': now,
+        },
+    )
+
+
+def slot_stats_source(since_hour, until_hour):
+    """Статистика по часам [since_hour, until_hour): рабочие слоты построчно плюс готовая сводка по архиву."""
+    hour, slot_type, user_id, matched, seconds, matched_seconds = slot_stats_columns(TimeSlot)
+    live = (
+        select(hour, slot_type, user_id, literal(1).label('slots'), matched, seconds, matched_seconds)
+        .filter(TimeSlot.start_time >= hour_start(since_hour), TimeSlot.start_time < hour_start(until_hour))
+    )
+    archived = (
+        select(SlotStats.hour, SlotStats.type, SlotStats.user_id, SlotStats.slots, SlotStats.matched,
+               SlotStats.seconds, SlotStats.matched_seconds)
+        .filter(SlotStats.hour >= since_hour, SlotStats.hour < until_hour)
     )
-    return requests.scalars().all()
+    return union_all(live, archived).subquery('slot_stats_source')
+
+
+async def get_slot_totals(session, since_hour, until_hour):
+    """{тип слота: (слотов, совпавших, секунд, совпавших секунд)} за период."""
+    stats = slot_stats_source(since_hour, until_hour)
+    result = await session.execute(
+        select(stats.c.type, func.sum(stats.c.slots), func.sum(stats.c.matched), func.sum(stats.c.seconds),
+               func.sum(stats.c.matched_seconds))
+        .group_by(stats.c.type)
+    )
+    return {slot_type: tuple(value or 0 for value in values) for slot_type, *values in result.all()}
+
+
+async def get_unmatched_requests_by_hour(session, since_hour, until_hour):
+    """Пары (час с эпохи UTC, число запросов без помощника) за период."""
+    stats = slot_stats_source(since_hour, until_hour)
+    result = await session.execute(
+        select(stats.c.hour, func.sum(stats.c.slots - stats.c.matched))
+        .filter(stats.c.type == SlotType.REQUEST)
+        .group_by(stats.c.hour)
+    )
+    return result.all()
+
+
+async def get_helper_utilization(session, since_hour, until_hour, limit):
+    """Помощники с наибольшим предложенным временем: (username, секунд предложено, секунд занято)."""
+    stats = slot_stats_source(since_hour, until_hour)
+    offered = func.sum(stats.c.seconds).label('offered')
+    result = await session.execute(
+        select(User.telegram_username, offered, func.sum(stats.c.matched_seconds))
+        .join(User, User.id == stats.c.user_id, isouter=True)
+        .filter(stats.c.type == SlotType.OFFER)
+        .group_by(stats.c.user_id, User.telegram_username)
+        .order_by(offered.desc())
+        .limit(limit)
+    )
+    return result.all()
+
+
+async def insert_meeting_confirmation(session, request_slot_id, user_id, confirmed):
+    await session.execute(
+        insert(MeetingConfirmation).values(request_slot_id=request_slot_id, user_id=user_id, confirmed=confirmed)
+    )
+
+
+async def record_meeting_confirmation(session, request_slot_id, user_id, confirmed):
+    """Сохраняет ответ на вопрос о встрече для отчёта администратора."""
+    await writer.run(session, partial(insert_meeting_confirmation, request_slot_id=request_slot_id, user_id=user_id,
+                                      confirmed=confirmed))
+
+
+async def get_confirmation_stats(session, since):
+    """(всего ответов, ответов «Нет») начиная с since."""
+    result = await session.execute(
+        select(func.count(), func.sum(case((MeetingConfirmation.confirmed == False, 1), else_=0)))
+        .filter(MeetingConfirmation.created >= since)
+    )
+    total, failed = result.one()
+    return total, failed or 0
+
+
+async def get_failed_confirmations(session, since, limit):
+    """Последние ответы «Нет»: (время ответа, id запроса, username ответившего)."""
+    result = await session.execute(
+        select(MeetingConfirmation.created, MeetingConfirmation.request_slot_id, User.telegram_username)
+        .join(User, User.id == MeetingConfirmation.user_id)
+        .filter(MeetingConfirmation.confirmed == False, MeetingConfirmation.created >= since)
+        .order_by(MeetingConfirmation.created.desc())
+        .limit(limit)
+    )
+    return result.all()
+
+
+def export_columns(model, archived):
+    return select(model.id, model.type, model.start_time, model.end_time, model.user_id, model.matched,
+                  model.matched_user_id, model.expired, literal(archived).label('archived'))
+
+
+async def stream_slots_for_export(session, batch_size):
+    """Все слоты, рабочие и архивные, порциями по batch_size строк.
+
+    Строки читаются курсором по мере выгрузки, поэтому память не зависит от размера таблиц.
+    """
+    slots = union_all(export_columns(TimeSlot, False), export_columns(TimeSlotArchive, True)).subquery('slots')
+    result = await session.stream(
+        select(slots, User.telegram_username)
+        .join(User, User.id == slots.c.user_id, isouter=True)
+        .execution_options(yield_per=batch_size)
+    )
+    async for partition in result.partitions():
+        yield partition
+
+
+async def get_persistence_entries(session, chat_id=None):
+    """Строки (kind, key, data) общего состояния бота — все или только одного чата."""
+    query = select(PersistenceEntry.kind, PersistenceEntry.key, PersistenceEntry.data)
+    if chat_id is not None:
+        query = query.filter(PersistenceEntry.chat_id == chat_id)
+    result = await session.execute(query)
+    return result.all()
+
+
+async def write_persistence_entries(session, entries):
+    """Сохраняет записи {(kind, key): (chat_id, data)} одной транзакцией; data=None удаляет запись."""
+    now = get_current_datetime()
+    rows = [
+        {'kind': kind, 'key': key, 'chat_id': chat_id, 'data': data, 'created': now, 'updated': now}
+        for (kind, key), (chat_id, data) in entries.items()
+        if data is not None
+    ]
+    if rows:
+        statement = dialect_insert(session, PersistenceEntry)
+        await session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[PersistenceEntry.kind, PersistenceEntry.key],
+                set_={'chat_id': statement.excluded.chat_id, 'data': statement.excluded.data, 'updated': now},
+            ),
+            rows,
+        )
+    deleted = {}
+    for (kind, key), (_, data) in entries.items():
+        if data is None:
+            deleted.setdefault(kind, []).append(key)
+    for kind, keys in deleted.items():
+        await session.execute(
+            delete(PersistenceEntry).filter(PersistenceEntry.kind == kind, PersistenceEntry.key.in_(keys))
+        )
+    await session.commit()
+
+
+async def acquire_lease(session, name, owner, now, ttl):
+    """Берёт или продлевает аренду, если она свободна, просрочена или уже принадлежит owner."""
+    statement = dialect_insert(session, Lease)
+    result = await session.execute(
+        statement
+        .values(name=name, owner=owner, expires_at=now + ttl, created=now, updated=now)
+        .on_conflict_do_update(
+            index_elements=[Lease.name],
+            set_={'owner': owner, 'expires_at': now + ttl, 'updated': now},
+            where=(Lease.owner == owner) | (Lease.expires_at <= now),
+        )
+        .returning(Lease.owner)
+    )
+    acquired = result.scalar() == owner
+    await session.commit()
+    return acquired
+
+
+async def release_lease(session, name, owner):
+    await session.execute(delete(Lease).filter(Lease.name == name, Lease.owner == owner))
+    await session.commit()
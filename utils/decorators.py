@@ -1,11 +1,25 @@
+import time
 from functools import wraps
-from database.engine import session_maker
+
+from database.unit_of_work import unit_of_work
+from utils.metrics import metrics
+
+
+def timed_handler(func):
+    @wraps(func)
+    async def wrapped(update, context, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(update, context, *args, **kwargs)
+        finally:
+            metrics.observe('handler_latency_seconds', time.perf_counter() - started, handler=func.__name__)
+    return wrapped
 
 
 def with_db_session(func):
+    @timed_handler
     @wraps(func)
     async def wrapped(update, context, *args, **kwargs):
-        async with session_maker() as session:
-            context.chat_data['db_session'] = session
+        async with unit_of_work():
             return await func(update, context, *args, **kwargs)
     return wrapped
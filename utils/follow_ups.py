@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from database.engine import session_maker
+from utils.db_queries import claim_due_follow_ups, delete_follow_ups, get_next_follow_up_time
+from utils.notifications import Delivery
+from utils.utils import get_current_datetime
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_SLEEP = 30
+CLAIM_TTL = timedelta(minutes=5)
+
+
+class FollowUpScheduler:
+    """Цикл, который достаёт наступившие напоминания о встречах из базы и обрабатывает их пачками."""
+
+    def __init__(self, batch_size=BATCH_SIZE, max_sleep=MAX_SLEEP, claim_ttl=CLAIM_TTL):
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self.claim_ttl = claim_ttl
+        self._callback = None
+        self._task = None
+
+    def start(self, callback):
+        """callback(session, request_slot_id) вызывается для каждого наступившего напоминания.
+
+        Он возвращает future отправленных сообщений (или ничего). Напоминание удаляется, только когда
+        все они отправлены или окончательно отклонены; иначе его повторят после claim_ttl.
+        """
+        self._callback = callback
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_due(self):
+        deliveries = {}
+        async with session_maker() as session:
+            due = await claim_due_follow_ups(session, get_current_datetime(), self.batch_size, self.claim_ttl)
+            for follow_up in due:
+                try:
+                    deliveries[follow_up.id] = await self._callback(session, follow_up.request_slot_id) or []
+                except Exception:
+                    logger.exception('Follow-up %s failed', follow_up.id)
+        results = await asyncio.gather(*(asyncio.gather(*sends) for sends in deliveries.values()))
+        done = [follow_up_id for follow_up_id, sent in zip(deliveries, results) if Delivery.FAILED not in sent]
+        if done:
+            async with session_maker() as session:
+                await delete_follow_ups(session, done)
+        if len(done) < len(due):
+            logger.warning('Follow-ups not delivered, will retry: %s', len(due) - len(done))
+        return len(due)
+
+    async def _sleep_time(self):
+        async with session_maker() as session:
+            next_run = await get_next_follow_up_time(session)
+        if next_run is None:
+            return self.max_sleep
+        return min(self.max_sleep, max(0.0, (next_run - get_current_datetime()).total_seconds()))
+
+    async def _run(self):
+        while True:
+            try:
+                if await self.run_due() == self.batch_size:
+                    continue
+                await asyncio.sleep(await self._sleep_time())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Follow-up loop iteration failed')
+                await asyncio.sleep(self.max_sleep)
+
+
+follow_up_scheduler = FollowUpScheduler()
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from database.engine import session_maker
+from utils.config import INSTANCE_ID, LEASE_TTL
+from utils.db_queries import acquire_lease, release_lease
+from utils.metrics import metrics
+from utils.utils import get_current_datetime
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """Выбор ведущего процесса через аренду в базе.
+
+    Аренда продлевается каждые ttl / 3 секунд. Пока процесс её держит, в нём работают фоновые
+    задачи; если продлить аренду не удаётся дольше ttl, процесс сам их останавливает.
+    """
+
+    def __init__(self, name='background', owner=INSTANCE_ID, ttl=LEASE_TTL):
+        self.name = name
+        self.owner = owner
+        self.ttl = ttl
+        self.is_leader = False
+        self._renewed_at = None
+        self._on_acquired = None
+        self._on_lost = None
+        self._task = None
+
+    def start(self, on_acquired, on_lost):
+        """on_acquired() и on_lost() — корутины, которые запускают и останавливают фоновые задачи."""
+        self._on_acquired = on_acquired
+        self._on_lost = on_lost
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            await self._set_leader(False)
+            try:
+                async with session_maker() as session:
+                    await release_lease(session, self.name, self.owner)
+            except Exception:
+                logger.warning('Failed to release lease %s', self.name, exc_info=True)
+
+    async def renew(self):
+        """Одна попытка взять или продлить аренду. Возвращает, является ли процесс ведущим."""
+        try:
+            async with session_maker() as session:
+                acquired = await acquire_lease(
+                    session, self.name, self.owner, get_current_datetime(), timedelta(seconds=self.ttl)
+                )
+            if acquired:
+                self._renewed_at = time.monotonic()
+        except Exception:
+            logger.warning('Failed to renew lease %s', self.name, exc_info=True)
+            acquired = self.is_leader and time.monotonic() - self._renewed_at < self.ttl
+        if acquired != self.is_leader:
+            await self._set_leader(acquired)
+        return acquired
+
+    async def _set_leader(self, leader):
+        self.is_leader = leader
+        metrics.increment('lease_changes', lease=self.name, state='acquired' if leader else 'lost')
+        logger.info('%s lease %s as %s', 'Acquired' if leader else 'Lost', self.name, self.owner)
+        await (self._on_acquired if leader else self._on_lost)()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.renew()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Lease %s iteration failed', self.name)
+            await asyncio.sleep(self.ttl / 3)
+
+
+leader_lease = LeaderLease()
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from database.engine import compact_database, session_maker
+from utils.config import COMPACTION_HOUR, MAINTENANCE_INTERVAL, SLOT_RETENTION_DAYS
+from utils.db_queries import archive_time_slots, expire_time_slots
+from utils.metrics import metrics
+from utils.utils import get_current_datetime, get_timezone
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH_SIZE = 500
+
+
+class MaintenanceTask:
+    """Периодически помечает истёкшие слоты, переносит старые в архив и раз в сутки сжимает базу."""
+
+    def __init__(self, interval=MAINTENANCE_INTERVAL, retention_days=SLOT_RETENTION_DAYS,
+                 batch_size=ARCHIVE_BATCH_SIZE, compaction_hour=COMPACTION_HOUR):
+        self.interval = interval
+        self.retention = timedelta(days=retention_days)
+        self.batch_size = batch_size
+        self.compaction_hour = compaction_hour
+        self._compacted_on = None
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self, compact=None):
+        now = get_current_datetime()
+        async with session_maker() as session:
+            expired = await expire_time_slots(session, now)
+            archived = 0
+            while True:
+                batch = await archive_time_slots(session, now - self.retention, self.batch_size)
+                archived += batch
+                if batch < self.batch_size:
+                    break
+                await asyncio.sleep(0)
+        metrics.increment('slots_expired', expired)
+        metrics.increment('slots_archived', archived)
+        # Час сжатия задан в часовом поясе бота по умолчанию.
+        local_now = now.astimezone(get_timezone())
+        if compact is None:
+            compact = local_now.hour == self.compaction_hour and self._compacted_on != local_now.date()
+        if compact:
+            await compact_database()
+            self._compacted_on = local_now.date()
+        if expired or archived or compact:
+            logger.info('Maintenance: expired %s, archived %s, compacted %s', expired, archived, compact)
+        return expired, archived
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Maintenance iteration failed')
+            await asyncio.sleep(self.interval)
+
+
+maintenance_task = MaintenanceTask()
@@ -0,0 +1,47 @@
+from sqlalchemy import case, update
+
+from database.models import FollowUp, TimeSlot
+from utils.cache import slot_cache
+from utils.slot_index import slot_index
+
+
+async def claim_match(session, request_slot, offer_slot, follow_up_at=None):
+    """Атомарно помечает запрос и предложение как совпавшие.
+
+    Оба слота занимаются одним условным UPDATE в одной транзакции вместе с напоминанием о встрече.
+    Возвращает False, если хотя бы один из слотов уже занят, — тогда ничего не меняется.
+    """
+    result = await session.execute(
+        update(TimeSlot)
+        .where(
+            TimeSlot.id.in_([request_slot.id, offer_slot.id]),
+            TimeSlot.matched == False,
+            TimeSlot.expired == False,
+        )
+        .values(
+            matched=True,
+            matched_user_id=case(
+                (TimeSlot.id == request_slot.id, offer_slot.user_id),
+                else_=request_slot.user_id,
+            ),
+        )
+        .returning(TimeSlot.id)
+        .execution_options(synchronize_session=False)
+    )
+    if len(result.scalars().all()) != 2:
+        await session.rollback()
+        return False
+
+    if follow_up_at is not None:
+        session.add(FollowUp(
+            requester_id=request_slot.user_id,
+            helper_id=offer_slot.user_id,
+            request_slot_id=request_slot.id,
+            run_at=follow_up_at,
+        ))
+    await session.commit()
+
+    for slot in (request_slot, offer_slot):
+        slot_index.discard(slot.id)
+    slot_cache.invalidate(request_slot.id, offer_slot.id)
+    return True
@@ -0,0 +1,64 @@
+import heapq
+
+from utils.slot_index import slot_index
+
+
+def sweep_pairs(new_entries, candidates):
+    """Находит все пересекающиеся пары (новый слот, кандидат) за один проход заметающей прямой.
+
+    Оба списка состоят из записей (start_time, id, end_time, user_id) и отсортированы по началу.
+    Пары слотов одного пользователя пропускаются. Возвращает (id нового, id кандидата, длительность пересечения).
+    """
+    pairs = []
+    active_new = []
+    active_candidates = []
+    new_position = candidate_position = 0
+    while new_position < len(new_entries) or candidate_position < len(candidates):
+        take_new = candidate_position == len(candidates) or (
+            new_position < len(new_entries) and new_entries[new_position][0] <= candidates[candidate_position][0]
+        )
+        if take_new:
+            entry, own, other = new_entries[new_position], active_new, active_candidates
+            new_position += 1
+        else:
+            entry, own, other = candidates[candidate_position], active_candidates, active_new
+            candidate_position += 1
+        start_time, slot_id, end_time, user_id = entry
+        while other and other[0][0] < start_time:
+            heapq.heappop(other)
+        for other_end, other_id, other_user_id in other:
+            if other_user_id != user_id:
+                overlap = min(end_time, other_end) - start_time
+                pairs.append((slot_id, other_id, overlap) if take_new else (other_id, slot_id, overlap))
+        heapq.heappush(own, (end_time, slot_id, user_id))
+    return pairs
+
+
+class IncrementalMatcher:
+    """Подбирает пары для только что добавленных слотов среди открытых слотов индекса."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def candidates(self, slot_type, time_slots, after=None):
+        """Кандидаты типа slot_type для каждого из time_slots, по убыванию длительности пересечения.
+
+        Возвращает словарь {id слота: [(id кандидата, длительность пересечения), ...]}.
+        """
+        new_entries = sorted((slot.start_time, slot.id, slot.end_time, slot.user_id) for slot in time_slots)
+        ranked = {slot.id: [] for slot in time_slots}
+        if not new_entries:
+            return ranked
+        window = self.index.window(slot_type, new_entries[0][0], max(entry[2] for entry in new_entries))
+        if after is not None:
+            window = [entry for entry in window if entry[2] > after]
+        new_ids = set(ranked)
+        window = [entry for entry in window if entry[1] not in new_ids]
+        for slot_id, candidate_id, overlap in sweep_pairs(new_entries, window):
+            ranked[slot_id].append((candidate_id, overlap))
+        for candidates in ranked.values():
+            candidates.sort(key=lambda candidate: (-candidate[1], candidate[0]))
+        return ranked
+
+
+matcher = IncrementalMatcher(slot_index)
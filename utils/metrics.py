@@ -0,0 +1,105 @@
+import math
+from collections import defaultdict
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, math.inf)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+                break
+
+    def quantile(self, share):
+        """Верхняя граница корзины, в которую попадает заданная доля наблюдений."""
+        if not self.count:
+            return 0.0
+        target = share * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.histograms = defaultdict(dict)
+        self.counters = defaultdict(lambda: defaultdict(float))
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = tuple(sorted(labels.items()))
+        histogram = self.histograms[name].get(key)
+        if histogram is None:
+            histogram = self.histograms[name][key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        self.counters[name][tuple(sorted(labels.items()))] += amount
+
+    def reset(self):
+        self.histograms.clear()
+        self.counters.clear()
+
+    def summary(self):
+        """Краткий текстовый отчёт для команды /stats."""
+        lines = []
+        for name in sorted(self.histograms):
+            lines.append(f'{name}:')
+            for key, histogram in sorted(self.histograms[name].items()):
+                if histogram.count:
+                    lines.append(
+                        f'  {_format_labels(key) or "-"}: n={histogram.count}, '
+                        f'avg={histogram.sum / histogram.count:.4g}, '
+                        f'p50<={histogram.quantile(0.5):g}, p95<={histogram.quantile(0.95):g}, '
+                        f'p99<={histogram.quantile(0.99):g}'
+                    )
+        for name in sorted(self.counters):
+            lines.append(f'{name}:')
+            for key, value in sorted(self.counters[name].items()):
+                lines.append(f'  {_format_labels(key) or "-"}: {value:g}')
+        return '\n'.join(lines) or 'Метрик пока нет.'
+
+    def render_prometheus(self):
+        """Метрики в текстовом формате Prometheus."""
+        lines = []
+        for name in sorted(self.histograms):
+            lines.append(f'# TYPE {name} histogram')
+            for key, histogram in sorted(self.histograms[name].items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    bucket_key = key + (('le', '+Inf' if bound == math.inf else f'{bound:g}'),)
+                    lines.append(f'{name}_bucket{_prometheus_labels(bucket_key)} {cumulative}')
+                lines.append(f'{name}_sum{_prometheus_labels(key)} {histogram.sum:g}')
+                lines.append(f'{name}_count{_prometheus_labels(key)} {histogram.count}')
+        for name in sorted(self.counters):
+            lines.append(f'# TYPE {name} counter')
+            for key, value in sorted(self.counters[name].items()):
+                lines.append(f'{name}{_prometheus_labels(key)} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(key):
+    return ', '.join(f'{label}={value}' for label, value in key)
+
+
+def _prometheus_labels(key):
+    if not key:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in key)
+    return '{' + ','.join(f'{label}="{value}"' for (label, _), value in zip(key, escaped)) + '}'
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,145 @@
+import asyncio
+import enum
+import logging
+import time
+
+from telegram.error import Forbidden, BadRequest, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_MESSAGES_PER_SECOND = 30
+CHAT_MESSAGE_INTERVAL = 1.0
+WORKERS = 8
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.5
+CHAT_SLOTS_LIMIT = 10000
+
+
+class Delivery(enum.Enum):
+    SENT = 'sent'
+    # Telegram отказал окончательно: пользователь заблокировал бота или чат не найден.
+    REJECTED = 'rejected'
+    # Не удалось отправить за все попытки — можно попробовать позже.
+    FAILED = 'failed'
+
+
+class NotificationDispatcher:
+    """Очередь исходящих уведомлений с ограничением частоты отправки и повторами."""
+
+    def __init__(self, workers=WORKERS, messages_per_second=GLOBAL_MESSAGES_PER_SECOND,
+                 chat_interval=CHAT_MESSAGE_INTERVAL, max_attempts=MAX_ATTEMPTS):
+        self.workers = workers
+        self.global_interval = 1 / messages_per_second
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self.bot = None
+        self.delivered = 0
+        self.failed = 0
+        self._queue = asyncio.Queue()
+        self._pending = {}
+        self._tasks = []
+        self._next_global_slot = 0.0
+        self._next_chat_slot = {}
+
+    def enqueue(self, chat_id, text, dedupe_key=None, on_sent=None, **kwargs):
+        """Ставит сообщение в очередь. Повтор с тем же получателем и ключом заменяет ожидающее сообщение.
+
+        Возвращает future, которое получит Delivery, когда сообщение будет отправлено или отброшено.
+        Корутину on_sent() воркер дожидается сразу после успешной отправки.
+        """
+        key = (chat_id, dedupe_key if dedupe_key is not None else text)
+        if key in self._pending:
+            future = self._pending[key][3]
+            self._pending[key] = (text, kwargs, on_sent, future)
+            return future
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = (text, kwargs, on_sent, future)
+        self._queue.put_nowait(key)
+        return future
+
+    def pending_count(self):
+        """Сколько сообщений ждёт отправки."""
+        return len(self._pending)
+
+    def snapshot(self):
+        """Ожидающие отправки сообщения — список (chat_id, text, kwargs) в порядке постановки в очередь."""
+        return [(chat_id, text, kwargs) for (chat_id, _), (text, kwargs, _, _) in self._pending.items()]
+
+    def start(self, bot):
+        self.bot = bot
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def join(self):
+        await self._queue.join()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for _, _, _, future in self._pending.values():
+            if not future.done():
+                future.set_result(Delivery.FAILED)
+
+    async def _work(self):
+        while True:
+            key = await self._queue.get()
+            text, kwargs, on_sent, future = self._pending.pop(key)
+            result = Delivery.FAILED
+            try:
+                result = await self._deliver(key[0], text, kwargs)
+                if result == Delivery.SENT and on_sent is not None:
+                    await self._after_sent(key[0], on_sent)
+            except Exception:
+                logger.exception('Failed to deliver notification to %s', key[0])
+            finally:
+                if not future.done():
+                    future.set_result(result)
+                self._queue.task_done()
+
+    async def _after_sent(self, chat_id, on_sent):
+        try:
+            await on_sent()
+        except Exception:
+            logger.exception('Post-delivery callback failed for %s', chat_id)
+
+    async def _wait_for_slot(self, chat_id):
+        now = time.monotonic()
+        if len(self._next_chat_slot) > CHAT_SLOTS_LIMIT:
+            self._next_chat_slot = {chat: slot for chat, slot in self._next_chat_slot.items() if slot > now}
+        chat_slot = max(now, self._next_chat_slot.get(chat_id, 0.0))
+        self._next_chat_slot[chat_id] = chat_slot + self.chat_interval
+        if chat_slot > now:
+            await asyncio.sleep(chat_slot - now)
+
+        now = time.monotonic()
+        global_slot = max(now, self._next_global_slot)
+        self._next_global_slot = global_slot + self.global_interval
+        if global_slot > now:
+            await asyncio.sleep(global_slot - now)
+
+    async def _deliver(self, chat_id, text, kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            await self._wait_for_slot(chat_id)
+            try:
+                await self.bot.send_message(chat_id, text, **kwargs)
+                self.delivered += 1
+                return Delivery.SENT
+            except RetryAfter as error:
+                retry_after = error.retry_after
+                if not isinstance(retry_after, (int, float)):
+                    retry_after = retry_after.total_seconds()
+                logger.warning('Flood control for %s, retrying in %s s', chat_id, retry_after)
+                self._next_chat_slot[chat_id] = time.monotonic() + retry_after
+            except (Forbidden, BadRequest) as error:
+                logger.warning('Notification to %s rejected: %s', chat_id, error)
+                self.failed += 1
+                return Delivery.REJECTED
+            except NetworkError as error:
+                logger.warning('Network error sending to %s (attempt %s): %s', chat_id, attempt, error)
+                await asyncio.sleep(BACKOFF_BASE * 2 ** (attempt - 1))
+        self.failed += 1
+        return Delivery.FAILED
+
+
+notifier = NotificationDispatcher()
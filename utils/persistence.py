@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+
+from telegram.ext import BasePersistence, ConversationHandler, PersistenceInput
+
+from database.engine import create_db, session_maker
+from utils.config import PERSISTENCE_INTERVAL
+from utils.db_queries import get_persistence_entries, write_persistence_entries
+
+logger = logging.getLogger(__name__)
+
+CHAT_DATA = 'chat_data'
+CONVERSATION = 'conversation:'
+
+
+def _encode(data):
+    return json.dumps(data, ensure_ascii=False, sort_keys=True)
+
+
+def _conversation_key(key):
+    return _encode(list(key))
+
+
+class SQLPersistence(BasePersistence):
+    """Хранит состояния диалогов и chat_data в таблице persistence_entry.
+
+    Записи копятся write_delay секунд и сохраняются одной транзакцией, повторные записи одного
+    ключа схлопываются, а неизменившиеся значения не пишутся вовсе. Значения должны сериализоваться в JSON.
+    """
+
+    def __init__(self, update_interval=PERSISTENCE_INTERVAL, write_delay=0):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.write_delay = write_delay
+        self.transactions = 0
+        self._known = None
+        self._pending = {}
+        self._flush_task = None
+        self._lock = asyncio.Lock()
+
+    async def _load(self, kind):
+        if self._known is None:
+            # Application.initialize читает состояние раньше post_init, поэтому схема создаётся здесь.
+            await create_db()
+            async with session_maker() as session:
+                rows = await get_persistence_entries(session)
+            self._known = {(row_kind, key): data for row_kind, key, data in rows}
+        return {key: json.loads(data) for (row_kind, key), data in self._known.items() if row_kind == kind}
+
+    async def get_conversations(self, name):
+        return {tuple(json.loads(key)): state for key, state in (await self._load(CONVERSATION + name)).items()}
+
+    async def get_chat_data(self):
+        return {int(key): data for key, data in (await self._load(CHAT_DATA)).items()}
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_conversation(self, name, key, new_state):
+        # Первый элемент ключа — id чата: по нему состояние перечитывается в refresh_chat.
+        await self._write(CONVERSATION + name, _conversation_key(key), key[0] if key else None, new_state)
+
+    async def update_chat_data(self, chat_id, data):
+        await self._write(CHAT_DATA, str(chat_id), chat_id, data or None)
+
+    async def drop_chat_data(self, chat_id):
+        await self._write(CHAT_DATA, str(chat_id), chat_id, None)
+
+    async def update_user_data(self, user_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        if self._pending:
+            await self._flush(delay=0)
+
+    async def refresh_chat(self, application, update):
+        """Перечитывает chat_data и состояния диалогов чата, которые мог изменить другой процесс."""
+        chat = update.effective_chat
+        if chat is None:
+            return
+        async with session_maker() as session:
+            rows = await get_persistence_entries(session, chat_id=chat.id)
+        stored = {(kind, key): data for kind, key, data in rows}
+        known = self._known if self._known is not None else {}
+
+        chat_key = (CHAT_DATA, str(chat.id))
+        if chat_key not in self._pending:
+            chat_data = application.chat_data[chat.id]
+            chat_data.clear()
+            if chat_key in stored:
+                chat_data.update(json.loads(stored[chat_key]))
+            known[chat_key] = stored.get(chat_key)
+
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                if not (isinstance(handler, ConversationHandler) and handler.persistent):
+                    continue
+                try:
+                    key = handler._get_key(update)
+                except RuntimeError:
+                    continue
+                entry_key = (CONVERSATION + handler.name, _conversation_key(key))
+                if entry_key in self._pending:
+                    continue
+                if entry_key in stored:
+                    handler._conversations.update_no_track({key: json.loads(stored[entry_key])})
+                else:
+                    handler._conversations.data.pop(key, None)
+                known[entry_key] = stored.get(entry_key)
+
+    async def _write(self, kind, key, chat_id, data):
+        value = None if data is None else _encode(data)
+        if self._known is not None and self._known.get((kind, key)) == value:
+            return
+        if self._known is not None:
+            self._known[(kind, key)] = value
+        self._pending[(kind, key)] = (chat_id, value)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush(self.write_delay))
+        await asyncio.shield(self._flush_task)
+
+    async def _flush(self, delay):
+        # Даже при нулевой задержке отдаём управление, чтобы записи из одного
+        # Application.update_persistence успели собраться в общую пачку.
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        async with self._lock:
+            try:
+                async with session_maker() as session:
+                    await write_persistence_entries(session, batch)
+            except Exception:
+                for entry_key, entry in batch.items():
+                    self._pending.setdefault(entry_key, entry)
+                logger.warning('Failed to persist %s entries, will retry', len(batch), exc_info=True)
+                raise
+        self.transactions += 1
+
+
+async def load_shared_state(update, context):
+    """Первый обработчик каждого обновления в режиме SHARED_STATE."""
+    await context.application.persistence.refresh_chat(context.application, update)
+
+
+async def save_shared_state(update, context):
+    """Последний обработчик каждого обновления в режиме SHARED_STATE: сохраняет изменения сразу."""
+    await context.application.update_persistence()
@@ -0,0 +1,115 @@
+import time
+from collections import OrderedDict
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from utils.config import MAX_OPEN_SLOTS, RATE_LIMIT_BURST, RATE_LIMIT_PER_MINUTE, RATE_LIMIT_USERS
+from utils.metrics import metrics
+from utils.slot_index import slot_index
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated', 'rejected')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+        self.rejected = 0
+
+
+class RateLimiter:
+    """Корзина токенов на каждого пользователя: burst сообщений сразу, дальше rate в секунду.
+
+    Корзины хранятся в памяти процесса, самые давние вытесняются после maxsize пользователей.
+    """
+
+    def __init__(self, rate, burst, maxsize, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.clock = clock
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def allow(self, key):
+        """Забирает токен из корзины key. False — токенов нет, обновление нужно отбросить."""
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.burst, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.rejected = 0
+            return True
+        bucket.rejected += 1
+        return False
+
+    def rejected(self, key):
+        """Сколько обновлений key подряд отброшено с последнего пропущенного."""
+        bucket = self._buckets.get(key)
+        return bucket.rejected if bucket else 0
+
+    def clear(self):
+        self._buckets.clear()
+
+
+rate_limiter = RateLimiter(RATE_LIMIT_PER_MINUTE / 60, RATE_LIMIT_BURST, RATE_LIMIT_USERS)
+
+
+async def throttle_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Первый обработчик каждого обновления: отбрасывает обновления пользователя, исчерпавшего лимит.
+
+    Работает до обращения к базе и до остальных групп обработчиков. О лимите пользователь узнаёт
+    один раз за серию отброшенных сообщений, чтобы ответы не множили нагрузку.
+    """
+    user = update.effective_user
+    if user is None or rate_limiter.allow(user.id):
+        return
+    metrics.increment('updates_shed', reason='rate_limit')
+    if rate_limiter.rejected(user.id) == 1:
+        if update.callback_query is not None:
+            await update.callback_query.answer('Слишком много запросов, попробуйте чуть позже.')
+        elif update.message is not None:
+            await update.message.reply_text('Слишком много сообщений. Подождите немного и попробуйте снова.')
+    raise ApplicationHandlerStop
+
+
+async def admit_time_slots(update: Update, user_id, slot_type, intervals):
+    """Интервалы, которые можно сохранить: без повторов свободных слотов пользователя и в пределах MAX_OPEN_SLOTS.
+
+    Проверка идёт по slot_index, без запросов к базе. Если сохранять нечего, отвечает пользователю
+    и возвращает пустой список.
+    """
+    fresh = [
+        (start_time, end_time) for start_time, end_time in intervals
+        if not slot_index.user_overlaps(slot_type, user_id, start_time, end_time)
+    ]
+    if len(fresh) < len(intervals):
+        metrics.increment('slots_shed', len(intervals) - len(fresh), reason='overlap')
+    if not fresh:
+        metrics.increment('updates_shed', reason='overlap')
+        await update.message.reply_text('Эти слоты у вас уже есть, я продолжаю по ним искать.')
+        return []
+    open_slots = slot_index.user_slot_count(user_id)
+    if open_slots + len(fresh) > MAX_OPEN_SLOTS:
+        metrics.increment('updates_shed', reason='open_slots')
+        metrics.increment('slots_shed', len(fresh), reason='open_slots')
+        await update.message.reply_text(
+            f'У вас уже {open_slots} свободных слотов, а одновременно можно держать не больше {MAX_OPEN_SLOTS}. '
+            'Дождитесь, пока часть из них пройдёт или совпадёт.'
+        )
+        return []
+    if len(fresh) < len(intervals):
+        await update.message.reply_text(
+            f'Пропускаю слоты, которые пересекаются с уже указанными вами: {len(intervals) - len(fresh)}.'
+        )
+    return fresh
@@ -0,0 +1,140 @@
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import timedelta
+
+from database.models import SlotType
+
+
+class SlotPartition:
+    """Свободные слоты одного типа, отсортированные по времени начала."""
+
+    def __init__(self):
+        self._starts = []
+        self._entries = []
+        self._by_id = {}
+        self._max_duration = timedelta(0)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, slot_id):
+        return slot_id in self._by_id
+
+    def add(self, slot_id, user_id, start_time, end_time):
+        if slot_id in self._by_id:
+            self.discard(slot_id)
+        entry = (start_time, slot_id, end_time, user_id)
+        position = bisect_right(self._entries, entry)
+        self._entries.insert(position, entry)
+        self._starts.insert(position, start_time)
+        self._by_id[slot_id] = entry
+        self._max_duration = max(self._max_duration, end_time - start_time)
+
+    def load(self, entries):
+        for slot_id, user_id, start_time, end_time in entries:
+            self._by_id[slot_id] = (start_time, slot_id, end_time, user_id)
+            self._max_duration = max(self._max_duration, end_time - start_time)
+        self._entries = sorted(self._by_id.values())
+        self._starts = [entry[0] for entry in self._entries]
+
+    def discard(self, slot_id):
+        entry = self._by_id.pop(slot_id, None)
+        if entry is None:
+            return None
+        position = bisect_left(self._entries, entry)
+        del self._entries[position]
+        del self._starts[position]
+        return entry
+
+    def window(self, start_time, end_time):
+        """Записи (start_time, id, end_time, user_id), которые могут пересекаться с интервалом, по возрастанию начала."""
+        lo = bisect_left(self._starts, start_time - self._max_duration)
+        hi = bisect_right(self._starts, end_time)
+        return self._entries[lo:hi]
+
+    def overlapping(self, start_time, end_time, user_id=None, after=None):
+        lo = bisect_left(self._starts, start_time - self._max_duration)
+        hi = bisect_right(self._starts, end_time)
+        return [
+            slot_id
+            for _, slot_id, slot_end, slot_user_id in self._entries[lo:hi]
+            if slot_end >= start_time
+            and (after is None or slot_end > after)
+            and (user_id is None or slot_user_id == user_id)
+        ]
+
+
+class SlotIndex:
+    """Индекс несовпавших слотов в памяти, разбитый по типу слота."""
+
+    def __init__(self):
+        self._partitions = {slot_type: SlotPartition() for slot_type in SlotType}
+        self._types = {}
+        self._user_counts = Counter()
+        self.synced_id = 0
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self._types)
+
+    def clear(self):
+        for slot_type in SlotType:
+            self._partitions[slot_type] = SlotPartition()
+        self._types.clear()
+        self._user_counts.clear()
+
+    def load(self, rows):
+        """Заменяет содержимое индекса строками (id, type, user_id, start_time, end_time)."""
+        self.clear()
+        entries = {slot_type: [] for slot_type in SlotType}
+        for slot_id, slot_type, user_id, start_time, end_time in rows:
+            entries[slot_type].append((slot_id, user_id, start_time, end_time))
+            self._types[slot_id] = slot_type
+            self._user_counts[user_id] += 1
+            self.synced_id = max(self.synced_id, slot_id)
+        for slot_type, partition_entries in entries.items():
+            self._partitions[slot_type].load(partition_entries)
+        self.loaded_at = time.monotonic()
+
+    def add(self, slot):
+        self.add_entry(slot.id, slot.type, slot.user_id, slot.start_time, slot.end_time)
+
+    def add_entry(self, slot_id, slot_type, user_id, start_time, end_time):
+        self.discard(slot_id)
+        self._partitions[slot_type].add(slot_id, user_id, start_time, end_time)
+        self._types[slot_id] = slot_type
+        self._user_counts[user_id] += 1
+
+    def discard(self, slot_id):
+        slot_type = self._types.pop(slot_id, None)
+        if slot_type is None:
+            return
+        _, _, _, user_id = self._partitions[slot_type].discard(slot_id)
+        self._user_counts[user_id] -= 1
+        if not self._user_counts[user_id]:
+            del self._user_counts[user_id]
+
+    def user_slot_count(self, user_id):
+        """Сколько свободных слотов обоих типов у пользователя."""
+        return self._user_counts[user_id]
+
+    def window(self, slot_type, start_time, end_time):
+        return self._partitions[slot_type].window(start_time, end_time)
+
+    def overlapping(self, slot_type, start_time, end_time, user_id=None, after=None):
+        """Возвращает id свободных слотов, пересекающихся с интервалом [start_time, end_time].
+
+        Если передан after, слоты, закончившиеся к этому моменту, пропускаются.
+        """
+        return self._partitions[slot_type].overlapping(start_time, end_time, user_id, after)
+
+    def user_overlaps(self, slot_type, user_id, start_time, end_time):
+        """Есть ли у пользователя свободный слот этого типа, пересекающийся с интервалом больше чем в точке."""
+        return any(
+            slot_user_id == user_id and slot_start < end_time and slot_end > start_time
+            for slot_start, _, slot_end, slot_user_id in self.window(slot_type, start_time, end_time)
+        )
+
+
+slot_index = SlotIndex()
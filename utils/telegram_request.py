@@ -0,0 +1,25 @@
+import time
+
+from telegram.request import HTTPXRequest
+
+from utils.metrics import metrics
+
+CONNECTION_POOL_SIZE = 256
+
+
+class TimedRequest(HTTPXRequest):
+    """HTTPXRequest, который пишет длительность каждого вызова Bot API в метрику telegram_api_seconds."""
+
+    def __init__(self, connection_pool_size=CONNECTION_POOL_SIZE, **kwargs):
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+
+    async def do_request(self, url, method, *args, **kwargs):
+        started = time.perf_counter()
+        api_method = url.rsplit('/', 1)[-1]
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            metrics.increment('telegram_api_errors', method=api_method)
+            raise
+        finally:
+            metrics.observe('telegram_api_seconds', time.perf_counter() - started, method=api_method)
@@ -0,0 +1,104 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+def _chat_key(update):
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+    return None
+
+
+class BoundedUpdateQueue(asyncio.Queue):
+    """Очередь входящих обновлений с общим лимитом на обновления в очереди и в обработке.
+
+    PTB сразу забирает обновления из очереди и запускает каждое отдельной задачей, поэтому
+    maxsize самой очереди ничего не сдерживает. Здесь put ждёт, пока принятых и ещё не обработанных
+    обновлений меньше limit, а место освобождает finish — так long polling и webhook притормаживают,
+    когда бот не успевает.
+    """
+
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+        self._slots = asyncio.BoundedSemaphore(limit)
+        self._admitted = set()
+
+    async def put(self, item):
+        if isinstance(item, Update):
+            await self._slots.acquire()
+            self._admitted.add(id(item))
+        await super().put(item)
+
+    def in_flight(self):
+        """Сколько принятых обновлений ещё не обработано."""
+        return len(self._admitted)
+
+    def finish(self, update):
+        """Освобождает место update после его обработки."""
+        if id(update) in self._admitted:
+            self._admitted.discard(id(update))
+            self._slots.release()
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает обновления разных чатов параллельно, а обновления одного чата — по очереди.
+
+    Обновления одного чата выстраиваются в цепочку: каждое ждёт завершения предыдущего и только потом
+    занимает одно из max_concurrent_updates мест, поэтому очередь одного занятого чата не забирает
+    места у остальных. Общий семафор BaseUpdateProcessor рассчитан на все обновления update_queue,
+    включая ждущие своей очереди в чате; их число ограничивает сама очередь.
+    """
+
+    def __init__(self, max_concurrent_updates, update_queue):
+        super().__init__(max(update_queue.limit, max_concurrent_updates))
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._update_queue = update_queue
+        self._tails = {}
+
+    async def do_process_update(self, update, coroutine):
+        try:
+            key = _chat_key(update)
+            if key is None:
+                async with self._running:
+                    await coroutine
+            else:
+                await self._process_in_chat_order(key, coroutine)
+        finally:
+            self._update_queue.finish(update)
+
+    async def _process_in_chat_order(self, key, coroutine):
+        previous = self._tails.get(key)
+        finished = asyncio.get_running_loop().create_future()
+        self._tails[key] = finished
+
+        def release(_=None):
+            finished.set_result(None)
+            if self._tails.get(key) is finished:
+                del self._tails[key]
+
+        started = False
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            started = True
+            async with self._running:
+                await coroutine
+        finally:
+            if not started:
+                coroutine.close()
+            # Если ожидание отменили, следующее обновление чата всё равно ждёт предыдущее.
+            if previous is None or previous.done():
+                release()
+            else:
+                previous.add_done_callback(release)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
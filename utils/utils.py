@@ -1,38 +1,216 @@
 import re
-import os
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta, timezone
+from enum import Enum
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-TIMEZONE_OFFSET = int(os.getenv('TIMEZONE_OFFSET', 0))
+from utils.config import DEFAULT_TIMEZONE, TIMEZONE_OFFSET
+
+MAX_SLOTS_PER_MESSAGE = 100
+MAX_RECURRENCE_WEEKS = 12
+WEEKDAYS = {
+    'пн': 0, 'вт': 1, 'ср': 2, 'чт': 3, 'пт': 4, 'сб': 5, 'вс': 6,
+    'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6,
+}
+RELATIVE_DAYS = {'сегодня': 0, 'today': 0, 'завтра': 1, 'tomorrow': 1, 'послезавтра': 2}
+
+_TIME_RANGE = (
+    r'(?P<start_hour>[01]?\d|2[0-3]):(?P<start_minute>[0-5]\d)\s*[-–—]\s*'
+    r'(?P<end_hour>[01]?\d|2[0-3]):(?P<end_minute>[0-5]\d)'
+)
+_DAY = r'[а-яa-z]{2,3}'
+_DAYS_SPEC = rf'{_DAY}(?:\s*[-–—]\s*{_DAY})?'
+DATE_SLOT_PATTERN = re.compile(
+    r'(?:(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})|(?P<relative>сегодня|послезавтра|завтра|today|tomorrow))'
+    rf'\s+{_TIME_RANGE}'
+)
+RECURRING_SLOT_PATTERN = re.compile(
+    rf'(?P<days>{_DAYS_SPEC}(?:\s*,\s*{_DAYS_SPEC})*)\s+{_TIME_RANGE}'
+    r'(?:\s+(?:на|for)\s+(?P<weeks>\d+)\s+(?:недел[юиь]|weeks?))?'
+)
+UTC_OFFSET_PATTERN = re.compile(r'(?:utc|gmt)?\s*(?P<sign>[+-])(?P<hours>\d{1,2})(?::?(?P<minutes>[0-5]\d))?')
+SLOT_SEPARATOR_PATTERN = re.compile(r'[;\n]')
+DAY_RANGE_SEPARATOR_PATTERN = re.compile(r'[-–—]')
+
+
+class TimeSlotErrorReason(Enum):
+    FORMAT = 'Не удалось распознать временной слот'
+    DATE = 'Такой даты не существует'
+    ORDER = 'Время окончания должно быть позже времени начала'
+    WEEKDAY = 'Не удалось распознать день недели'
+    WEEKS = f'Повторение можно указать не больше чем на {MAX_RECURRENCE_WEEKS} недель'
+    EMPTY = 'Не указано ни одного временного слота'
+    TOO_MANY = f'За один раз можно указать не больше {MAX_SLOTS_PER_MESSAGE} слотов'
+
+
+class TimeSlotError(ValueError):
+    """Ошибка разбора: reason — причина, fragment — часть сообщения, в которой она найдена."""
+
+    def __init__(self, reason, fragment=''):
+        super().__init__(f'{reason.value}: {fragment}' if fragment else reason.value)
+        self.reason = reason
+        self.fragment = fragment
+
+
+class TimeZoneError(ValueError):
+    pass
 
 
 def get_current_datetime():
-    """Возвращает текущее время в выбранной таймзоне."""
-    return datetime.now() + timedelta(hours=TIMEZONE_OFFSET)
-
-
-def adjust_datetime_for_scheduler(dt: datetime) -> datetime:
-    """Корректирует время в зависимости от TIMEZONE_OFFSET для передачи в планировщик."""
-    return dt - timedelta(hours=TIMEZONE_OFFSET)
-
-
-def validate_time_slot(time_slot):
-    pattern = re.compile(r'^\d{4}-\d{2}-\d{2} ([01]\d|2[0-3]):([0-5]\d)-([01]\d|2[0-3]):([0-5]\d)$')
-    match = pattern.match(time_slot)
-    if match:
-        date_part = time_slot.split()[0]
-        start_time = match.group(1) + match.group(2)
-        end_time = match.group(3) + match.group(4)
-        try:
-            datetime.strptime(date_part, '%Y-%m-%d')
-            return start_time < end_time
-        except ValueError:
-            return False
-    return False
-
-
-def parse_time_slot(time_slot):
-    date_part, times = time_slot.split()
-    start_time_str, end_time_str = times.split('-')
-    start_time = datetime.strptime(f"{date_part} {start_time_str}", '%Y-%m-%d %H:%M')
-    end_time = datetime.strptime(f"{date_part} {end_time_str}", '%Y-%m-%d %H:%M')
-    return start_time, end_time
+    """Текущее время в UTC."""
+    return datetime.now(timezone.utc)
+
+
+def legacy_utc_offset():
+    """Смещение от UTC, в котором бот хранил время до перехода на UTC: часовой пояс хоста плюс TIMEZONE_OFFSET."""
+    return datetime.now().astimezone().utcoffset() + timedelta(hours=TIMEZONE_OFFSET)
+
+
+def _parse_utc_offset(text):
+    match = UTC_OFFSET_PATTERN.fullmatch(text.lower())
+    if match is None:
+        return None
+    offset = timedelta(hours=int(match['hours']), minutes=int(match['minutes'] or 0))
+    return -offset if match['sign'] == '-' else offset
+
+
+def format_utc_offset(offset):
+    minutes = int(offset.total_seconds()) // 60
+    sign = '-' if minutes < 0 else '+'
+    return f'UTC{sign}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}'
+
+
+def parse_timezone(text):
+    """Приводит `Europe/Moscow`, `UTC+3` или `-05:30` к имени часового пояса или бросает TimeZoneError."""
+    text = text.strip()
+    offset = _parse_utc_offset(text)
+    if offset is not None:
+        if abs(offset) > timedelta(hours=14):
+            raise TimeZoneError(f'Смещение {text} вне допустимого диапазона')
+        return format_utc_offset(offset)
+    if text.upper() in ('UTC', 'GMT'):
+        return 'UTC+00:00'
+    try:
+        ZoneInfo(text)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise TimeZoneError(f'Неизвестный часовой пояс {text}') from None
+    return text
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name=None):
+    """tzinfo по имени из parse_timezone; без имени — часовой пояс бота по умолчанию."""
+    if name is None:
+        name = DEFAULT_TIMEZONE or format_utc_offset(legacy_utc_offset())
+    offset = _parse_utc_offset(name)
+    if offset is not None:
+        return timezone(offset, name)
+    return ZoneInfo(name)
+
+
+def to_utc(local_datetime, tz):
+    return local_datetime.replace(tzinfo=tz).astimezone(timezone.utc)
+
+
+def _time_bounds(match, fragment):
+    start = (int(match['start_hour']), int(match['start_minute']))
+    end = (int(match['end_hour']), int(match['end_minute']))
+    if start >= end:
+        raise TimeSlotError(TimeSlotErrorReason.ORDER, fragment)
+    return start, end
+
+
+def parse_time_range(text, now=None):
+    """Разбирает `YYYY-MM-DD HH:MM-HH:MM` (или `завтра 9:00–12:00`) за один проход.
+
+    Возвращает пару (start_time, end_time) или бросает TimeSlotError.
+    """
+    fragment = text.strip()
+    match = DATE_SLOT_PATTERN.fullmatch(fragment.lower())
+    if match is None:
+        raise TimeSlotError(TimeSlotErrorReason.FORMAT, fragment)
+    (start_hour, start_minute), (end_hour, end_minute) = _time_bounds(match, fragment)
+    if match['relative']:
+        date = (now or get_current_datetime()).date() + timedelta(days=RELATIVE_DAYS[match['relative']])
+        year, month, day = date.year, date.month, date.day
+    else:
+        year, month, day = int(match['year']), int(match['month']), int(match['day'])
+    try:
+        return datetime(year, month, day, start_hour, start_minute), datetime(year, month, day, end_hour, end_minute)
+    except ValueError:
+        raise TimeSlotError(TimeSlotErrorReason.DATE, fragment) from None
+
+
+def parse_weekdays(days_text, fragment):
+    days = set()
+    for part in days_text.split(','):
+        bounds = [WEEKDAYS.get(day.strip()) for day in DAY_RANGE_SEPARATOR_PATTERN.split(part)]
+        if None in bounds:
+            raise TimeSlotError(TimeSlotErrorReason.WEEKDAY, fragment)
+        first, last = bounds[0], bounds[-1]
+        days.update((first + offset) % 7 for offset in range((last - first) % 7 + 1))
+    return days
+
+
+def expand_recurring_slot(match, now, fragment):
+    days = parse_weekdays(match['days'], fragment)
+    weeks = int(match['weeks'] or 1)
+    if not 1 <= weeks <= MAX_RECURRENCE_WEEKS:
+        raise TimeSlotError(TimeSlotErrorReason.WEEKS, fragment)
+    (start_hour, start_minute), (end_hour, end_minute) = _time_bounds(match, fragment)
+    start_time = time(start_hour, start_minute)
+    end_time = time(end_hour, end_minute)
+    slots = []
+    for offset in range(weeks * 7):
+        day = now.date() + timedelta(days=offset)
+        if day.weekday() in days and datetime.combine(day, end_time) > now:
+            slots.append((datetime.combine(day, start_time), datetime.combine(day, end_time)))
+    return slots
+
+
+def merge_time_slots(slots):
+    """Объединяет пересекающиеся и смежные интервалы."""
+    merged = []
+    for start_time, end_time in sorted(slots):
+        if merged and start_time <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end_time))
+        else:
+            merged.append((start_time, end_time))
+    return merged
+
+
+def parse_time_slots(text, tz=None, now=None):
+    """Разбирает одно или несколько расписаний из сообщения.
+
+    Каждая строка (или часть, отделённая ';') — либо `YYYY-MM-DD HH:MM-HH:MM`
+    (вместо даты можно написать «сегодня» или «завтра»), либо повторение вида
+    `Пн-Пт 09:00-12:00 на 4 недели`. Время читается в часовом поясе tz. Возвращает
+    отсортированные объединённые интервалы в UTC или бросает TimeSlotError.
+    """
+    tz = tz or get_timezone()
+    now = (now or get_current_datetime()).astimezone(tz).replace(tzinfo=None)
+    slots = []
+    for part in SLOT_SEPARATOR_PATTERN.split(text):
+        fragment = part.strip()
+        if not fragment:
+            continue
+        match = RECURRING_SLOT_PATTERN.fullmatch(fragment.lower())
+        if match is not None:
+            slots.extend(expand_recurring_slot(match, now, fragment))
+        else:
+            slots.append(parse_time_range(fragment, now))
+        if len(slots) > MAX_SLOTS_PER_MESSAGE:
+            raise TimeSlotError(TimeSlotErrorReason.TOO_MANY)
+    if not slots:
+        raise TimeSlotError(TimeSlotErrorReason.EMPTY)
+    return [(to_utc(start_time, tz), to_utc(end_time, tz)) for start_time, end_time in merge_time_slots(slots)]
+
+
+def format_datetime(value, tz=None):
+    return value.astimezone(tz or get_timezone()).strftime('%Y-%m-%d %H:%M')
+
+
+def format_time_slot(start_time, end_time, tz=None, separator='-'):
+    """Слот в часовом поясе tz: `2024-06-20 09:00-12:00`."""
+    tz = tz or get_timezone()
+    return f'{format_datetime(start_time, tz)}{separator}{end_time.astimezone(tz).strftime("%H:%M")}'